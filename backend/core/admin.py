@@ -1,33 +1,90 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Department, Doctor, Patient, Appointment, Prescription
+from . import search
+from .models import User, Department, Doctor, Patient, Appointment, Prescription, WorkingHours, Medication
+from .pagination import EstimatedCountPaginator
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelists for tables with millions of rows: no exact COUNT(*) of the
+    whole table, and no second count for "N total" when a filter is applied.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+class IndexedSearchAdmin(LargeTableAdmin):
+    """
+    Search (including the autocomplete widgets that point here) through the
+    core.search index named by ``search_index`` instead of icontains scans.
+    """
+    search_index = None
+    search_fields = ('user__username',)
+    # Autocomplete pages through get_queryset(), which is only ordered if this is set.
+    ordering = ('pk',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Autocomplete labels use __str__, which reads the related user.
+        queryset = queryset.select_related(*self.list_select_related)
+        if not search_term.strip():
+            return queryset, False
+        ids = search.search(self.search_index, search_term, limit=getattr(settings, 'HMS_ADMIN_SEARCH_LIMIT', 1000))
+        return queryset.filter(pk__in=ids), False
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'role', 'is_staff')
     list_filter = ('role', 'is_staff', 'is_superuser', 'is_active')
     fieldsets = UserAdmin.fieldsets + (
-        ('Role', {'fields': ('role',)}),
+        ('Role', {'fields': ('role', 'department')}),
     )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Department)
 class DepartmentAdmin(admin.ModelAdmin):
     list_display = ('name',)
+    search_fields = ('name',)
+
+class WorkingHoursInline(admin.TabularInline):
+    model = WorkingHours
+    extra = 0
 
 @admin.register(Doctor)
-class DoctorAdmin(admin.ModelAdmin):
+class DoctorAdmin(IndexedSearchAdmin):
+    search_index = 'doctors'
     list_display = ('user', 'department', 'specialization')
     list_filter = ('department',)
+    list_select_related = ('user', 'department')
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('department',)
+    inlines = [WorkingHoursInline]
 
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
+class PatientAdmin(IndexedSearchAdmin):
+    search_index = 'patients'
     list_display = ('user', 'date_of_birth', 'blood_group')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
 
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(LargeTableAdmin):
     list_display = ('patient', 'doctor', 'date', 'time', 'status')
     list_filter = ('status', 'date')
+    list_select_related = ('patient__user', 'doctor__user')
+    autocomplete_fields = ('patient', 'doctor')
+    date_hierarchy = 'date'
+
+@admin.register(Medication)
+class MedicationAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
 
 @admin.register(Prescription)
-class PrescriptionAdmin(admin.ModelAdmin):
-    list_display = ('patient', 'doctor', 'date_prescribed')
\ No newline at end of file
+class PrescriptionAdmin(LargeTableAdmin):
+    list_display = ('patient', 'doctor', 'drug', 'date_prescribed')
+    list_select_related = ('patient__user', 'doctor__user', 'drug')
+    autocomplete_fields = ('patient', 'doctor', 'drug')
+    # Appointments have no useful text to search; pick one by id.
+    raw_id_fields = ('appointment',)
+    date_hierarchy = 'date_prescribed'
@@ -0,0 +1,188 @@
+"""
+Async variants of the read-heavy endpoints, for serving under ASGI.
+
+Each view awaits the async ORM and cache APIs instead of holding a worker
+thread while the database answers, so one ASGI worker can keep many requests
+in flight. Responses match the synchronous views (same serializers, keyset
+pagination, per-user payload cache and ETags); only the URL prefix differs.
+"""
+import json
+from functools import partial, wraps
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import archive, cache, events, hashing, versions
+from .authentication import HMSRefreshToken, HMSTokenUser, aclaims_changed_at, claims_are_current
+from .filters import ExpandFilterBackend
+from .models import Department, Doctor, Appointment, Prescription, ArchivedAppointment, ArchivedPrescription
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .serializers import DepartmentSerializer, DoctorSerializer, AppointmentSerializer, PrescriptionSerializer, UserSerializer
+from .views import not_modified, own_rows, set_validators
+
+User = get_user_model()
+jwt_auth = JWTAuthentication()
+
+
+def json_response(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), content_type='application/json', status=status)
+
+
+async def authenticate(request, ticket=False):
+    """The active user named by the request's bearer token (or a ?ticket= from core.events if allowed), or None."""
+    header = jwt_auth.get_header(request)
+    raw_token = jwt_auth.get_raw_token(header) if header else None
+    if raw_token is None:
+        if not (ticket and request.GET.get('ticket')):
+            return None
+        user_id = await events.redeem_ticket(request.GET['ticket'])
+        return await active_user(user_id) if user_id is not None else None
+    try:
+        # Checking the signature and expiry is CPU-only; only cache and database reads await.
+        token = jwt_auth.get_validated_token(raw_token)
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except (AuthenticationFailed, KeyError):
+        return None
+    if claims_are_current(token, await aclaims_changed_at(user_id)):
+        return HMSTokenUser(token)
+    return await active_user(user_id)
+
+
+async def active_user(user_id):
+    user = await User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}).afirst()
+    return user if user is not None and user.is_active else None
+
+
+def api_view(view=None, *, ticket=False):
+    """GET only, bearer token required; API errors become JSON like DRF's."""
+    if view is None:
+        return partial(api_view, ticket=ticket)
+
+    @require_GET
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await authenticate(request, ticket)
+        if user is None:
+            return json_response({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+        try:
+            return await view(request, user, *args, **kwargs)
+        except APIException as exc:
+            return json_response({'detail': exc.detail}, status=exc.status_code)
+    return wrapper
+
+
+async def paginated(request, queryset, serializer_class, ordering, archived=None):
+    """One page of queryset; with ?include_archived=true, of queryset and archived together."""
+    drf_request = Request(request)
+    # The views here are plain functions, so apply ?expand= joins like DRF's filter backend does.
+    view = SimpleNamespace(keyset_ordering=ordering, get_serializer_class=lambda: serializer_class)
+    querysets = [queryset]
+    if archived is not None and archive.include_archived(request):
+        querysets.append(archived)
+    querysets = [ExpandFilterBackend().filter_queryset(drf_request, qs, view) for qs in querysets]
+    paginator = KeysetPagination()
+    rows = await paginator.apaginate_querysets(querysets, drf_request, view)
+    return {
+        'next': paginator.get_next_link(),
+        'previous': paginator.get_previous_link(),
+        'results': serializer_class(rows, many=True, context={'request': drf_request}).data,
+    }
+
+
+async def cached_page(request, user, kind, queryset, serializer_class, ordering, archived=None):
+    key = await cache.apayload_key(kind, user, request.build_absolute_uri())
+    payload = await cache.aget_payload(key)
+    if payload is None:
+        payload = await paginated(request, queryset, serializer_class, ordering, archived)
+        await cache.aset_payload(key, payload)
+    return json_response(payload)
+
+
+async def versioned_page(request, models, queryset, serializer_class):
+    tables = [model._meta.db_table for model in models]
+    etag, last_modified = await versions.astamp(tables, request.get_full_path(), 'application/json')
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = json_response(await paginated(request, queryset, serializer_class, ('id',)))
+    return set_validators(response, etag, last_modified)
+
+
+@api_view
+async def my_appointments(request, user):
+    return await cached_page(request, user, 'appointments', own_rows(Appointment, user),
+                             AppointmentSerializer, ('date', 'time', 'id'), own_rows(ArchivedAppointment, user))
+
+
+@api_view
+async def my_prescriptions(request, user):
+    return await cached_page(request, user, 'prescriptions', own_rows(Prescription, user),
+                             PrescriptionSerializer, ('-date_prescribed', '-id'), own_rows(ArchivedPrescription, user))
+
+
+@api_view
+async def department_list(request, user):
+    return await versioned_page(request, (Department,), Department.objects.all(), DepartmentSerializer)
+
+
+@api_view
+async def doctor_list(request, user):
+    return await versioned_page(request, (Doctor, Department, User), Doctor.objects.all(), DoctorSerializer)
+
+
+# EventSource cannot send headers: it authenticates with a ?ticket= from EventTicketView.
+@api_view(ticket=True)
+async def event_stream(request, user):
+    """Server-Sent Events for changes to the user's appointments and prescriptions (see core.events)."""
+    # Under WSGI Django reads an async stream to the end before sending any of
+    # it: the client would wait HMS_EVENTS_MAX_STREAM seconds, holding a thread.
+    if not isinstance(request, ASGIRequest):
+        return json_response({'error': 'The event stream needs an ASGI server; run gunicorn with HMS_ASGI=1.'}, status=501)
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if last_id is not None:
+        try:
+            last_id = int(last_id)
+        except ValueError:
+            return json_response({'error': 'Last-Event-ID must be an integer.'}, status=400)
+    # Token users carry the id claim as given; events store integer ids.
+    response = StreamingHttpResponse(events.stream(int(user.pk), last_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view
+async def user_profile(request, user):
+    return json_response(UserSerializer(user).data)
+
+
+@csrf_exempt
+@require_POST
+async def login(request):
+    """LoginView for ASGI: the password check awaits the hashing pool instead of blocking."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return json_response({'error': 'Invalid JSON'}, status=400)
+    try:
+        user = await hashing.aauthenticate(request, data.get('username'), data.get('password'))
+    except APIException as exc:
+        return json_response({'detail': exc.detail}, status=exc.status_code)
+    if user is None:
+        return json_response({'error': 'Invalid credentials'}, status=400)
+    refresh = await sync_to_async(HMSRefreshToken.for_user)(user)
+    return json_response({
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+        'user': UserSerializer(user).data,
+    })
@@ -0,0 +1,205 @@
+"""
+Stateless JWT authentication.
+
+Tokens issued by LoginView carry the user's role, profile ids and the fields
+UserSerializer exposes, so authenticating a request and checking its role
+needs no user or profile query. Code that needs the full row reads
+``request.user.user``, which is served from a short-lived cache.
+
+Claims are fixed when a token is issued. When a claimed field changes (role,
+is_active, a profile being added or removed) core.signals records the time in
+a ClaimsChange row. Tokens carry the time current when they were issued, and
+those with an older one fall back to a normal database lookup until they
+expire.
+
+Reading that time is the one query a request makes to authenticate, unless
+HMS_CACHE_SHARED says the cache is shared by every worker: then it comes from
+the cache, and from the database only when the cache has lost it. A
+per-process cache never sees changes made through other workers, so it is not
+trusted for this.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .cache import get_cache
+from .models import ClaimsChange
+
+User = get_user_model()
+
+KEY_PREFIX = 'hms:auth'
+USER_CLAIMS = ('username', 'email', 'role', 'is_staff', 'department_id')
+
+
+def changed_key(user_id):
+    return f'{KEY_PREFIX}:changed:{user_id}'
+
+
+def user_key(user_id):
+    return f'{KEY_PREFIX}:user:{user_id}'
+
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def markers_are_shared():
+    """Whether every worker sees the same cache, so a claims marker set by one is seen by all."""
+    shared = getattr(settings, 'HMS_CACHE_SHARED', None)
+    if shared is None:
+        alias = getattr(settings, 'HMS_CACHE_ALIAS', 'default')
+        shared = settings.CACHES[alias]['BACKEND'] not in LOCAL_CACHE_BACKENDS
+    return shared
+
+
+def marker_timeout():
+    # After this no token issued before the change is still valid.
+    return api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+
+
+def timestamp(changed_at):
+    # Microseconds; "never changed" is 0, so it can be cached (None is a cache miss).
+    return round(changed_at.timestamp() * 1e6) if changed_at is not None else 0
+
+
+def revoke_claims(user_id, deleted=False):
+    """
+    Make tokens issued up to now for this user fall back to a database lookup.
+    Call it inside the transaction that changes the claims: the ClaimsChange
+    row is written with it, and the cache is updated once it commits.
+    """
+    changed = timezone.now()
+    if not deleted:
+        ClaimsChange.objects.update_or_create(user_id=user_id, defaults={'changed_at': changed})
+
+    def publish():
+        if markers_are_shared():
+            get_cache().set(changed_key(user_id), timestamp(changed), timeout=marker_timeout())
+        forget_user(user_id)
+    transaction.on_commit(publish)
+
+
+def remember_claims(user_id, changed_at):
+    """Cache a marker just read from the database, so the next requests need not read it."""
+    if markers_are_shared():
+        # add(): never overwrite a newer marker set by revoke_claims().
+        get_cache().add(changed_key(user_id), timestamp(changed_at), timeout=marker_timeout())
+
+
+def forget_user(user_id):
+    get_cache().delete(user_key(user_id))
+
+
+def marker_query(user_id):
+    # From User, not ClaimsChange: no row then means the user is gone, not "never changed".
+    return User.objects.filter(pk=user_id).values_list('claims_change__changed_at', flat=True)
+
+
+def from_database(user_id, rows):
+    """The marker in marker_query() rows; None if there is no such user."""
+    if not rows:
+        return None
+    remember_claims(user_id, rows[0])
+    return timestamp(rows[0])
+
+
+def claims_changed_at(user_id):
+    """When the user's claims last changed, as timestamp() gives it; None if there is no such user."""
+    if markers_are_shared():
+        changed = get_cache().get(changed_key(user_id))
+        if changed is not None:
+            return changed
+    return from_database(user_id, list(marker_query(user_id)))
+
+
+async def aclaims_changed_at(user_id):
+    if markers_are_shared():
+        changed = await get_cache().aget(changed_key(user_id))
+        if changed is not None:
+            return changed
+    return from_database(user_id, [changed async for changed in marker_query(user_id)])
+
+
+def claims_are_current(token, changed):
+    # Tokens carry the marker they were issued under; iat is too coarse to compare.
+    return 'role' in token and changed is not None and token.get('claims_at') == changed
+
+
+def cached_user(user_id):
+    cache = get_cache()
+    user = cache.get(user_key(user_id))
+    if user is None:
+        user = User.objects.get(pk=user_id)
+        cache.set(user_key(user_id), user, timeout=getattr(settings, 'HMS_TOKEN_USER_CACHE_TIMEOUT', 60))
+    return user
+
+
+class HMSRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        # One query with three left joins; null when the user has no such profile.
+        profiles = User.objects.filter(pk=user.pk).values(
+            'patient_profile', 'doctor_profile', 'claims_change__changed_at',
+        ).first() or {}
+        token['patient_id'] = profiles.get('patient_profile')
+        token['doctor_id'] = profiles.get('doctor_profile')
+        token['claims_at'] = timestamp(profiles.get('claims_change__changed_at'))
+        remember_claims(user.pk, profiles.get('claims_change__changed_at'))
+        return token
+
+
+class HMSTokenUser(TokenUser):
+    """A request user answered from token claims. ``user`` is the model instance."""
+
+    @cached_property
+    def email(self):
+        return self.token.get('email', '')
+
+    @cached_property
+    def role(self):
+        return self.token['role']
+
+    @cached_property
+    def patient_id(self):
+        return self.token.get('patient_id')
+
+    @cached_property
+    def doctor_id(self):
+        return self.token.get('doctor_id')
+
+    @cached_property
+    def department_id(self):
+        return self.token.get('department_id')
+
+    @cached_property
+    def user(self):
+        return cached_user(self.id)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """Trust the claims of current tokens; look the user up only for old or revoked ones."""
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is not None and claims_are_current(validated_token, claims_changed_at(user_id)):
+            return HMSTokenUser(validated_token)
+        return super().get_user(validated_token)
+
+
+def profile_lookup(user, role):
+    """Filter kwargs for rows belonging to the user's patient or doctor profile."""
+    profile_id = getattr(user, f'{role}_id', None)
+    if profile_id is not None:
+        return {f'{role}_id': profile_id}
+    return {f'{role}__user_id': user.pk}
@@ -0,0 +1,113 @@
+"""
+Per-user cache of rendered "my appointments" / "my prescriptions" payloads.
+
+Entries are never deleted. Every user has a version token, and there is one
+global token; both are part of each entry's key. Invalidating a user means
+writing a new token for that user, so their old entries become unreachable and
+expire on their own. Department edits change the global token, because a
+department is embedded in every payload.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = 'hms:my'
+GLOBAL_VERSION_KEY = f'{KEY_PREFIX}:v:global'
+COUNTERS = ('hits', 'misses', 'invalidations')
+
+
+def get_cache():
+    return caches[getattr(settings, 'HMS_CACHE_ALIAS', 'default')]
+
+
+def user_version_key(user_id):
+    return f'{KEY_PREFIX}:v:user:{user_id}'
+
+
+def counter_key(name):
+    return f'{KEY_PREFIX}:stats:{name}'
+
+
+def incr(name, delta=1):
+    cache = get_cache()
+    key = counter_key(name)
+    # add() is a no-op when the counter exists; incr() is atomic on shared backends.
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+
+
+async def aincr(name, delta=1):
+    cache = get_cache()
+    key = counter_key(name)
+    await cache.aadd(key, 0, timeout=None)
+    try:
+        await cache.aincr(key, delta)
+    except ValueError:
+        await cache.aset(key, delta, timeout=None)
+
+
+def version_keys(user):
+    return [user_version_key(user.pk), GLOBAL_VERSION_KEY]
+
+
+def build_key(kind, user, url, versions):
+    digest = hashlib.sha1(url.encode()).hexdigest()
+    return ':'.join([
+        KEY_PREFIX, kind, str(user.pk), user.role,
+        versions.get(user_version_key(user.pk), '0'), versions.get(GLOBAL_VERSION_KEY, '0'), digest,
+    ])
+
+
+def payload_key(kind, user, url):
+    return build_key(kind, user, url, get_cache().get_many(version_keys(user)))
+
+
+async def apayload_key(kind, user, url):
+    return build_key(kind, user, url, await get_cache().aget_many(version_keys(user)))
+
+
+def get_payload(key):
+    payload = get_cache().get(key)
+    incr('hits' if payload is not None else 'misses')
+    return payload
+
+
+async def aget_payload(key):
+    payload = await get_cache().aget(key)
+    await aincr('hits' if payload is not None else 'misses')
+    return payload
+
+
+def set_payload(key, payload):
+    get_cache().set(key, payload, timeout=getattr(settings, 'HMS_CACHE_TIMEOUT', 300))
+
+
+async def aset_payload(key, payload):
+    await get_cache().aset(key, payload, timeout=getattr(settings, 'HMS_CACHE_TIMEOUT', 300))
+
+
+def invalidate_users(user_ids):
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    token = uuid.uuid4().hex
+    get_cache().set_many({user_version_key(user_id): token for user_id in user_ids}, timeout=None)
+    incr('invalidations', len(user_ids))
+
+
+def invalidate_all():
+    get_cache().set(GLOBAL_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    incr('invalidations')
+
+
+def stats():
+    values = get_cache().get_many([counter_key(name) for name in COUNTERS])
+    counters = {name: values.get(counter_key(name), 0) for name in COUNTERS}
+    lookups = counters['hits'] + counters['misses']
+    counters['hit_ratio'] = round(counters['hits'] / lookups, 4) if lookups else None
+    return counters
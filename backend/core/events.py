@@ -0,0 +1,225 @@
+"""
+Change feed behind the Server-Sent Events endpoint (``/api/async/events/``).
+The endpoint needs an ASGI server (gunicorn with HMS_ASGI=1); under WSGI it
+answers 501 Not Implemented.
+
+Receivers in core.signals turn every committed create, update, cancel or
+delete of an appointment or prescription into one event per affected user,
+the patient's and the doctor's, before and after the change.
+
+The backend named by HMS_EVENTS_BACKEND stores events and answers "this
+user's events after id N". That is what makes Last-Event-ID reconnection
+work.
+
+* DatabaseBackend (default) writes ChangeEvent rows. All workers share them,
+  so a stream sees changes made through any worker. Rows older than
+  HMS_EVENTS_RETENTION seconds are pruned (core.pruning).
+* LocalBackend keeps the last HMS_EVENTS_BUFFER events in memory. It is for
+  a single process only: events from other workers never reach it, and its
+  ids restart with the process.
+
+EventSource cannot send an Authorization header, and an access token in the
+URL would be written to access logs. A client POSTs to /api/events/ticket/
+with its token and opens the stream with the returned ``?ticket=``: it is good
+for one connection within HMS_EVENTS_TICKET_TTL seconds. To reconnect, the
+client fetches a new ticket and passes ``?last_event_id=``.
+
+Inside a process, ``hub`` wakes the streams of the affected users as soon as an
+event is stored. A stream also re-reads the backend every
+HMS_EVENTS_POLL_INTERVAL seconds, to pick up events stored by other workers.
+"""
+import asyncio
+import itertools
+import json
+import secrets
+import threading
+from collections import deque
+from functools import lru_cache
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from . import cache, pruning
+from .models import Appointment, ChangeEvent
+
+BATCH = 500
+# How long EventSource waits before reconnecting.
+RETRY_MS = 3000
+TICKET_SALT = 'core.events.ticket'
+
+
+class Hub:
+    """In-process pub/sub: wakes the async streams waiting on a user's events."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = {}
+
+    def subscribe(self, user_id):
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self.lock:
+            self.waiters.setdefault(user_id, set()).add(waiter)
+        return waiter
+
+    def unsubscribe(self, user_id, waiter):
+        with self.lock:
+            waiters = self.waiters.get(user_id, set())
+            waiters.discard(waiter)
+            if not waiters:
+                self.waiters.pop(user_id, None)
+
+    def notify(self, user_ids):
+        # Called from the thread that committed; each stream's event belongs to its own loop.
+        with self.lock:
+            waiters = [waiter for user_id in user_ids for waiter in self.waiters.get(user_id, ())]
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The loop has closed; the stream is gone.
+                pass
+
+
+hub = Hub()
+
+
+class DatabaseBackend:
+    def store(self, events):
+        ChangeEvent.objects.bulk_create([ChangeEvent(**event) for event in events])
+        pruning.prune()
+
+    async def since(self, user_id, last_id):
+        queryset = ChangeEvent.objects.filter(user_id=user_id, id__gt=last_id).order_by('id')[:BATCH]
+        return [event async for event in queryset]
+
+    async def latest(self, user_id):
+        last_id = await ChangeEvent.objects.filter(user_id=user_id).order_by('-id').values_list('id', flat=True).afirst()
+        return last_id or 0
+
+
+class LocalBackend:
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.events = deque(maxlen=getattr(settings, 'HMS_EVENTS_BUFFER', 10000))
+        self.lock = threading.Lock()
+
+    def store(self, events):
+        with self.lock:
+            for event in events:
+                self.events.append(SimpleNamespace(id=next(self.ids), **event))
+
+    async def since(self, user_id, last_id):
+        with self.lock:
+            events = [event for event in self.events if event.id > last_id and event.user_id == user_id]
+        return events[:BATCH]
+
+    async def latest(self, user_id):
+        with self.lock:
+            return next((event.id for event in reversed(self.events) if event.user_id == user_id), 0)
+
+
+@lru_cache(maxsize=None)
+def backend():
+    return import_string(getattr(settings, 'HMS_EVENTS_BACKEND', 'core.events.DatabaseBackend'))()
+
+
+def action(sender, instance, created=False, deleted=False, loaded=None):
+    if created:
+        return 'created'
+    if deleted:
+        return 'deleted'
+    if sender is Appointment and instance.status == 'cancelled' and (loaded or {}).get('status') != 'cancelled':
+        return 'cancelled'
+    return 'updated'
+
+
+def publish_on_commit(sender, changes):
+    """Queue events for (instance, action, user ids) triples, to be stored and announced on commit."""
+    from .serializers import AppointmentSerializer, PrescriptionSerializer
+
+    serializer_class = AppointmentSerializer if sender is Appointment else PrescriptionSerializer
+    kind = sender._meta.model_name
+    # Rendered now: a deleted instance loses its pk once the delete finishes.
+    events = [
+        {'user_id': user_id, 'kind': kind, 'action': name, 'object_id': instance.pk,
+         'data': serializer_class(instance).data}
+        for instance, name, user_ids in changes for user_id in user_ids
+    ]
+    if events:
+        transaction.on_commit(lambda: publish(events))
+
+
+def publish(events):
+    backend().store(events)
+    hub.notify({event['user_id'] for event in events})
+
+
+def ticket_ttl():
+    return getattr(settings, 'HMS_EVENTS_TICKET_TTL', 30)
+
+
+def issue_ticket(user_id):
+    """A signed ticket that opens one stream for this user within HMS_EVENTS_TICKET_TTL seconds."""
+    return signing.dumps({'user': user_id, 'nonce': secrets.token_urlsafe(12)}, salt=TICKET_SALT)
+
+
+async def redeem_ticket(ticket):
+    """The user id a ticket was issued to, or None when it is forged, expired or already used."""
+    try:
+        payload = signing.loads(ticket, salt=TICKET_SALT, max_age=ticket_ttl())
+    except signing.BadSignature:
+        return None
+    # add() fails when the key exists, i.e. on a second use. Tickets are only
+    # single-use across workers when HMS_CACHE_ALIAS is a shared cache.
+    if not await cache.get_cache().aadd(f'hms:events:ticket:{payload["nonce"]}', 1, ticket_ttl()):
+        return None
+    return payload['user']
+
+
+def format_event(event):
+    data = json.dumps({'action': event.action, 'id': event.object_id, 'data': event.data}, cls=DjangoJSONEncoder)
+    return f'id: {event.id}\nevent: {event.kind}\ndata: {data}\n\n'
+
+
+async def stream(user_id, last_id=None):
+    """
+    Server-Sent Events text for a user's events after last_id (from now when
+    None), until HMS_EVENTS_MAX_STREAM seconds have passed; the client then
+    reconnects with Last-Event-ID and misses nothing.
+    """
+    store = backend()
+    loop = asyncio.get_running_loop()
+    poll_interval = getattr(settings, 'HMS_EVENTS_POLL_INTERVAL', 2.0)
+    heartbeat = getattr(settings, 'HMS_EVENTS_HEARTBEAT', 15.0)
+    deadline = loop.time() + getattr(settings, 'HMS_EVENTS_MAX_STREAM', 600)
+    waiter = hub.subscribe(user_id)
+    try:
+        if last_id is None:
+            last_id = await store.latest(user_id)
+        yield f'retry: {RETRY_MS}\n\n'
+        quiet_since = loop.time()
+        while loop.time() < deadline:
+            # Cleared before reading, so a commit during the read still wakes the next wait.
+            waiter[1].clear()
+            events = await store.since(user_id, last_id)
+            for event in events:
+                last_id = event.id
+                yield format_event(event)
+            if events:
+                quiet_since = loop.time()
+                if len(events) == BATCH:
+                    continue
+            elif loop.time() - quiet_since >= heartbeat:
+                # Keeps proxies from closing an idle connection.
+                yield ': ping\n\n'
+                quiet_since = loop.time()
+            try:
+                await asyncio.wait_for(waiter[1].wait(), max(0, min(poll_interval, deadline - loop.time())))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        hub.unsubscribe(user_id, waiter)
@@ -0,0 +1,133 @@
+"""
+Flat, streaming exports of appointments and prescriptions for reporting.
+
+Rows are read with values() (one joined query, no model instances, no nested
+serializers) through QuerySet.iterator(), and each row is rendered as soon as
+it is read, so memory stays flat however many rows are exported.
+
+Exports cover the archive tables too (see core.archive): the live and archived
+queries are read side by side and merged on the export's ordering.
+"""
+import csv
+import datetime
+import heapq
+import json
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Appointment, Prescription, ArchivedAppointment, ArchivedPrescription
+
+APPOINTMENT_COLUMNS = (
+    ('id', 'id'),
+    ('date', 'date'),
+    ('time', 'time'),
+    ('status', 'status'),
+    ('reason', 'reason'),
+    ('patient_id', 'patient_id'),
+    ('patient_first_name', 'patient__user__first_name'),
+    ('patient_last_name', 'patient__user__last_name'),
+    ('doctor_id', 'doctor_id'),
+    ('doctor_first_name', 'doctor__user__first_name'),
+    ('doctor_last_name', 'doctor__user__last_name'),
+    ('department', 'doctor__department__name'),
+)
+
+PRESCRIPTION_COLUMNS = (
+    ('id', 'id'),
+    ('date_prescribed', 'date_prescribed'),
+    ('appointment_id', 'appointment_id'),
+    ('medication', 'medication'),
+    ('dosage', 'dosage'),
+    ('instructions', 'instructions'),
+    ('patient_id', 'patient_id'),
+    ('patient_first_name', 'patient__user__first_name'),
+    ('patient_last_name', 'patient__user__last_name'),
+    ('doctor_id', 'doctor_id'),
+    ('doctor_first_name', 'doctor__user__first_name'),
+    ('doctor_last_name', 'doctor__user__last_name'),
+    ('department', 'doctor__department__name'),
+)
+
+EXPORTS = {
+    'appointments': (Appointment, APPOINTMENT_COLUMNS, ('date', 'time', 'id')),
+    'prescriptions': (Prescription, PRESCRIPTION_COLUMNS, ('date_prescribed', 'id')),
+}
+
+# Rows moved out of EXPORTS' models by core.archive, with the same columns.
+ARCHIVES = {
+    'appointments': ArchivedAppointment,
+    'prescriptions': ArchivedPrescription,
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_rows(kind, **filters):
+    """Yield one tuple per row, live and archived, in the column order of the export."""
+    _, columns, ordering = EXPORTS[kind]
+    lookups = [lookup for _, lookup in columns]
+    # Archived rows keep their ids, so the two sources never repeat a key.
+    key = itemgetter(*[lookups.index(field) for field in ordering])
+    return heapq.merge(query(kind, EXPORTS[kind][0], **filters), query(kind, ARCHIVES[kind], **filters), key=key)
+
+
+def query(kind, model, start=None, end=None, doctor=None, department=None):
+    _, columns, ordering = EXPORTS[kind]
+    queryset = model.objects.order_by(*ordering)
+    if kind == 'appointments':
+        if start:
+            queryset = queryset.filter(date__gte=start)
+        if end:
+            queryset = queryset.filter(date__lte=end)
+    else:
+        # Compare against datetime bounds rather than date_prescribed__date so
+        # the range can use rx_recent_idx.
+        if start:
+            queryset = queryset.filter(date_prescribed__gte=day_start(start))
+        if end:
+            queryset = queryset.filter(date_prescribed__lt=day_start(end + datetime.timedelta(days=1)))
+    if doctor:
+        queryset = queryset.filter(doctor_id=doctor)
+    if department:
+        queryset = queryset.filter(doctor__department_id=department)
+    chunk_size = getattr(settings, 'HMS_EXPORT_CHUNK_SIZE', 2000)
+    return queryset.values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=chunk_size)
+
+
+def day_start(date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
+class Echo:
+    """A file-like object that hands back what csv.writer writes to it."""
+    def write(self, value):
+        return value
+
+
+def render_csv(kind, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in EXPORTS[kind][1]])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_ndjson(kind, rows):
+    names = [name for name, _ in EXPORTS[kind][1]]
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+RENDERERS = {
+    'csv': render_csv,
+    'ndjson': render_ndjson,
+}
+
+
+def render(kind, fmt, **filters):
+    return RENDERERS[fmt](kind, export_rows(kind, **filters))
@@ -0,0 +1,29 @@
+from rest_framework.filters import BaseFilterBackend
+
+from .serializers import ExpandableSerializer
+
+
+class RoleScopeFilterBackend(BaseFilterBackend):
+    """
+    Limit querysets that have ``for_user()`` (appointments, prescriptions and
+    patients; see core.models) to the rows request.user may see, so list,
+    detail, update and delete views all answer from the same scoped query.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        for_user = getattr(queryset, 'for_user', None)
+        return for_user(request.user) if for_user is not None else queryset
+
+
+class ExpandFilterBackend(BaseFilterBackend):
+    """
+    Join exactly the relations the request expands (``?expand=``), so a flat
+    response runs one query and an expanded one still does not run one per row.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        serializer_class = view.get_serializer_class()
+        if not issubclass(serializer_class, ExpandableSerializer):
+            return queryset
+        lookups = serializer_class.related_lookups(*serializer_class.from_request(request))
+        return queryset.select_related(*lookups) if lookups else queryset
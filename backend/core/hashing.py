@@ -0,0 +1,134 @@
+"""
+Password hashing with admission control, and off the event loop for async views.
+
+A PBKDF2/Argon2/bcrypt call is tens of milliseconds of CPU. At most
+HMS_HASHER_MAX_PENDING hashes are running or queued at once; past that,
+logins get 503 rather than queueing behind each other until they time out.
+
+Only the async views (core.async_views) use the thread pool: they await it
+instead of blocking the event loop, and the C implementations release the
+GIL while they hash. Sync views hash on their own request thread, which
+would wait for the pool anyway; handing the work over would only add a
+thread switch.
+
+Only the hashing runs on the pool. Database reads and writes stay on the
+caller's thread and connection.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.signals import user_login_failed
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+User = get_user_model()
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many sign-ins in progress; please retry shortly.'
+    default_code = 'hashing_busy'
+
+
+def workers():
+    return getattr(settings, 'HMS_HASHER_WORKERS', None) or os.cpu_count() or 1
+
+
+@lru_cache(maxsize=None)
+def executor():
+    return ThreadPoolExecutor(max_workers=workers(), thread_name_prefix='hms-hasher')
+
+
+@lru_cache(maxsize=None)
+def slots():
+    return threading.BoundedSemaphore(getattr(settings, 'HMS_HASHER_MAX_PENDING', 64))
+
+
+def submit(fn, *args):
+    """Run fn(*args) on the pool and return its Future; raise HashingBusy when the pool is full."""
+    if not slots().acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = executor().submit(fn, *args)
+    except BaseException:
+        slots().release()
+        raise
+    future.add_done_callback(lambda _: slots().release())
+    return future
+
+
+def run(fn, *args):
+    """Run fn(*args) on this thread, counted against the same limit as submit()."""
+    if not slots().acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        return fn(*args)
+    finally:
+        slots().release()
+
+
+def verify(raw_password, encoded):
+    """(valid, needs_rehash) for a password against a stored hash."""
+    rehash = []
+    valid = check_password(raw_password, encoded, setter=lambda _: rehash.append(True))
+    return valid, bool(rehash)
+
+
+def hash_password(raw_password):
+    return run(make_password, raw_password)
+
+
+async def ahash_password(raw_password):
+    return await asyncio.wrap_future(submit(make_password, raw_password))
+
+
+def authenticate(request, username, password):
+    """
+    Username/password authentication like ModelBackend's, with the hashing
+    admission-controlled. A hash made with another hasher or outdated
+    parameters is replaced with one from the preferred hasher.
+    """
+    try:
+        user = User._default_manager.get_by_natural_key(username)
+    except User.DoesNotExist:
+        # Hash anyway, so a missing user takes as long as a wrong password.
+        hash_password(password)
+        return login_failed(request, username)
+    valid, rehash = run(verify, password, user.password)
+    if not valid or not user.is_active:
+        return login_failed(request, username)
+    if rehash:
+        user.password = hash_password(password)
+        user.save(update_fields=['password'])
+    return user
+
+
+async def aauthenticate(request, username, password):
+    try:
+        user = await User._default_manager.aget(**{User.USERNAME_FIELD: username})
+    except User.DoesNotExist:
+        await ahash_password(password)
+        return await alogin_failed(request, username)
+    valid, rehash = await asyncio.wrap_future(submit(verify, password, user.password))
+    if not valid or not user.is_active:
+        return await alogin_failed(request, username)
+    if rehash:
+        user.password = await ahash_password(password)
+        await user.asave(update_fields=['password'])
+    return user
+
+
+def login_failed(request, username):
+    user_login_failed.send(sender=__name__, credentials={'username': username}, request=request)
+    return None
+
+
+async def alogin_failed(request, username):
+    await user_login_failed.asend(sender=__name__, credentials={'username': username}, request=request)
+    return None
@@ -0,0 +1,41 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Move completed and cancelled appointments older than --older-than days, with '
+        'their prescriptions, into the archive tables. Each batch is its own transaction, '
+        'so the command can be stopped and rerun at any point.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, required=True, help='Age in days of the appointment date.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the eligible appointments.')
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--older-than must be >= 0 and --batch-size >= 1.')
+        cutoff = timezone.localdate() - datetime.timedelta(days=options['older_than'])
+        if options['dry_run']:
+            self.stdout.write(f'{archive.eligible(cutoff).count()} appointments before {cutoff} would be archived.')
+            return
+
+        start = time.perf_counter()
+        appointments = prescriptions = 0
+        for appointments, prescriptions in archive.archive(cutoff, options['batch_size']):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{appointments} appointments, {prescriptions} prescriptions archived')
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(
+            f'Archived {appointments} appointments and {prescriptions} prescriptions dated before {cutoff} '
+            f'in {time.perf_counter() - start:.1f}s'
+        )
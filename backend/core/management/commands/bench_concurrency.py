@@ -0,0 +1,128 @@
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from core.authentication import HMSRefreshToken
+
+from core.models import Appointment
+from .bench_endpoints import percentile
+
+# Sync route -> its async counterpart in core/async_views.py.
+ROUTES = {
+    'my-appointments': 'async-my-appointments',
+    'my-prescriptions': 'async-my-prescriptions',
+    'department-list': 'async-department-list',
+    'doctor-list': 'async-doctor-list',
+    'user-profile': 'async-user-profile',
+}
+
+
+async def http_get(host, port, path, headers):
+    """One HTTP/1.1 GET over a fresh connection; returns the status code."""
+    reader, writer = await asyncio.open_connection(host, port)
+    lines = [f'GET {path} HTTP/1.1', f'Host: {host}', 'Connection: close']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return int(status_line.split()[1])
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/sec of the sync (WSGI) and async (ASGI) read endpoints at increasing '
+        'client concurrency. Pass --wsgi-url/--asgi-url to load running servers over HTTP; '
+        'otherwise both paths are driven in-process.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--route', choices=sorted(ROUTES), default='my-appointments')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[100, 250, 500, 1000])
+        parser.add_argument('--requests', type=int, default=5, help='Requests per client.')
+        parser.add_argument('--wsgi-url', help='Base URL of a WSGI server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', help='Base URL of an ASGI server, e.g. http://127.0.0.1:8001')
+        parser.add_argument('--output', '-o', help='Write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        sample = Appointment.objects.select_related('patient__user').order_by('-id').first()
+        if sample is None:
+            raise CommandError('No data to benchmark; run manage.py seed_hms first.')
+        token = str(HMSRefreshToken.for_user(sample.patient.user).access_token)
+        self.headers = {'Authorization': f'Bearer {token}'}
+        paths = {
+            'wsgi': reverse(options['route']),
+            'asgi': reverse(ROUTES[options['route']]),
+        }
+        bases = {'wsgi': options['wsgi_url'], 'asgi': options['asgi_url']}
+
+        results = []
+        # The in-process clients send Host: testserver.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for concurrency in options['concurrency']:
+                for mode in ('wsgi', 'asgi'):
+                    get = self.getter(mode, bases[mode])
+                    result = asyncio.run(self.load(get, paths[mode], concurrency, options['requests']))
+                    result.update(mode=mode, concurrency=concurrency, transport='http' if bases[mode] else 'in-process')
+                    results.append(result)
+                    self.stdout.write(
+                        f"{mode:<5} {result['transport']:<10} c={concurrency:<5} {result['rps']:>9.1f} req/s  "
+                        f"p50 {result['p50_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  errors {result['errors']}"
+                    )
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump({'route': options['route'], 'results': results}, fh, indent=2)
+            self.stdout.write(f"Saved {options['output']}")
+
+    def getter(self, mode, base_url):
+        """An async callable that GETs a path and returns the status code."""
+        if base_url:
+            parts = urlsplit(base_url)
+            return lambda path: http_get(parts.hostname, parts.port or 80, path, self.headers)
+        if mode == 'asgi':
+            client = AsyncClient()
+
+            async def get(path):
+                return (await client.get(path, headers=self.headers)).status_code
+            return get
+
+        # The sync view runs on a pool thread, as under a threaded WSGI server.
+        def get(path):
+            return Client().get(path, headers=self.headers).status_code
+        return sync_to_async(get, thread_sensitive=False)
+
+    async def load(self, get, path, concurrency, per_client):
+        timings, errors = [], 0
+
+        async def worker():
+            nonlocal errors
+            for _ in range(per_client):
+                start = time.perf_counter()
+                try:
+                    status = await get(path)
+                except OSError:
+                    status = None
+                timings.append((time.perf_counter() - start) * 1000)
+                if status != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        return {
+            'requests': len(timings),
+            'errors': errors,
+            'seconds': round(elapsed, 3),
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+        }
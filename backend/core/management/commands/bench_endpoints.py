@@ -0,0 +1,275 @@
+import datetime
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from core.authentication import HMSRefreshToken
+
+from core import medications, urls as core_urls
+from core.models import User, Department, Doctor, Patient, Appointment, Prescription, WorkingHours, Medication
+
+BENCH_PASSWORD = 'bench-Passw0rd!'
+
+# Settings applied while a route runs. The event stream would stay open for
+# HMS_EVENTS_MAX_STREAM seconds; it is measured from connecting to its first line.
+ROUTE_SETTINGS = {
+    'async-events': {'HMS_EVENTS_MAX_STREAM': 0},
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every route in core/urls.py in-process through the Django test client: '
+        'p50/p95/p99 latency, queries per request and peak memory, saved as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per route.')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', nargs='*', help='Route names to run (default: all).')
+        parser.add_argument('--output', '-o', default='bench_endpoints.json')
+        parser.add_argument('--compare', help='Earlier results file to diff against.')
+
+    def handle(self, *args, **options):
+        if not (Appointment.objects.exists() and Prescription.objects.exists() and WorkingHours.objects.exists()):
+            raise CommandError('No data to benchmark; run manage.py seed_hms first.')
+        self.client = Client(headers={'Host': 'localhost'})
+        self.async_client = AsyncClient()
+        self.users = self.bench_users()
+        self.headers = self.auth_headers()
+        routes = self.routes()
+
+        names = [pattern.name for pattern in core_urls.urlpatterns]
+        missing = sorted(set(names) - set(routes))
+        if missing:
+            raise CommandError(f'No sample request for: {", ".join(missing)}; add them to routes().')
+        # Variants of routes (writes, other parameters), keyed by their own names.
+        names += [name for name in routes if name not in names]
+        if options['only']:
+            names = [name for name in names if name in options['only']]
+
+        results = {}
+        # AsyncClient always sends Host: testserver, which the test runner would allow.
+        # 'localhost' is listed too: an empty ALLOWED_HOSTS allowed it under DEBUG.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'localhost', 'testserver']):
+            for name in names:
+                with override_settings(**ROUTE_SETTINGS.get(name, {})):
+                    results[name] = self.run_route(name, *routes[name], options['requests'], options['warmup'])
+                self.report(name, results[name])
+
+        payload = {
+            'meta': {
+                'commit': self.git_commit(),
+                'timestamp': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'requests_per_route': options['requests'],
+                'rows': {model.__name__: model.objects.count() for model in (Department, Doctor, Patient, Appointment, Prescription)},
+            },
+            'routes': results,
+        }
+        with open(options['output'], 'w') as fh:
+            json.dump(payload, fh, indent=2)
+        self.stdout.write(f"Saved {options['output']}")
+        if options['compare']:
+            self.compare(options['compare'], payload)
+
+    def bench_users(self):
+        """Users to authenticate as: an admin and the busiest patient and doctor."""
+        admin, created = User.objects.get_or_create(username='bench-admin', defaults={'role': 'admin', 'is_staff': True})
+        if created or not admin.check_password(BENCH_PASSWORD):
+            admin.set_password(BENCH_PASSWORD)
+            admin.save()
+        sample = Appointment.objects.select_related('patient__user', 'doctor__user').order_by('-id').first()
+        return {'admin': admin, 'patient': sample.patient.user, 'doctor': sample.doctor.user}
+
+    def auth_headers(self):
+        # Minted once: signing a token is not part of the request being measured.
+        return {
+            role: {'Authorization': f'Bearer {HMSRefreshToken.for_user(user).access_token}'}
+            for role, user in self.users.items()
+        }
+
+    def sample_medication(self, prescription):
+        medication = Medication.objects.order_by('name').first()
+        if medication is None:
+            # Databases seeded before the catalog existed.
+            medications.import_names([prescription.medication])
+            medication = Medication.objects.order_by('name').first()
+        return medication
+
+    def sync_token(self):
+        """A token from a full sync, so the delta sync route measures the usual "what changed" poll."""
+        response = self.client.get(reverse('sync'), headers=self.headers['patient'])
+        if response.status_code != 200:
+            raise CommandError(f"Full sync answered {response.status_code}: {response.content[:200]!r}")
+        return response.data['token']
+
+    def routes(self):
+        """route name -> (method, url, user role, payload). Writes are rolled back after each request."""
+        appointment = Appointment.objects.order_by('-id').first()
+        prescription = Prescription.objects.order_by('-id').first()
+        working_hours = WorkingHours.objects.order_by('id').first()
+        medication = self.sample_medication(prescription)
+        today = timezone.localdate()
+        free_day = today + datetime.timedelta(days=3650)
+        routes = {
+            'department-list': ('get', reverse('department-list'), 'admin', None),
+            'department-detail': ('get', reverse('department-detail', args=[appointment.doctor.department_id]), 'admin', None),
+            'doctor-list': ('get', reverse('doctor-list'), 'admin', None),
+            'doctor-detail': ('get', reverse('doctor-detail', args=[appointment.doctor_id]), 'admin', None),
+            'patient-list': ('get', reverse('patient-list'), 'admin', None),
+            'patient-detail': ('get', reverse('patient-detail', args=[appointment.patient_id]), 'admin', None),
+            'appointment-list': ('get', reverse('appointment-list'), 'admin', None),
+            'appointment-detail': ('get', reverse('appointment-detail', args=[appointment.pk]), 'admin', None),
+            'prescription-list': ('get', reverse('prescription-list'), 'admin', None),
+            'prescription-detail': ('get', reverse('prescription-detail', args=[prescription.pk]), 'admin', None),
+            'medication-autocomplete': ('get', f"{reverse('medication-autocomplete')}?q={medication.name[:3]}", 'doctor', None),
+            'working-hours-list': ('get', reverse('working-hours-list'), 'admin', None),
+            'working-hours-detail': ('get', reverse('working-hours-detail', args=[working_hours.pk]), 'admin', None),
+            'available-slots': ('get', f"{reverse('available-slots')}?doctor={appointment.doctor_id}&start={today}&end={today + datetime.timedelta(days=6)}", 'patient', None),
+            'register': ('post', reverse('register'), None, {
+                'username': 'bench-new-user', 'password': BENCH_PASSWORD, 'email': 'bench@example.com', 'role': 'patient',
+            }),
+            'login': ('post', reverse('login'), None, {'username': 'bench-admin', 'password': BENCH_PASSWORD}),
+            'user-profile': ('get', reverse('user-profile'), 'patient', None),
+            'doctor-dashboard': ('get', reverse('doctor-dashboard'), 'doctor', None),
+            'patient-dashboard': ('get', reverse('patient-dashboard'), 'patient', None),
+            'my-appointments': ('get', reverse('my-appointments'), 'patient', None),
+            'my-prescriptions': ('get', reverse('my-prescriptions'), 'patient', None),
+            'stats': ('get', reverse('stats'), 'admin', None),
+            'cache-stats': ('get', reverse('cache-stats'), 'admin', None),
+            'export': ('get', f"{reverse('export', kwargs={'kind': 'appointments', 'fmt': 'csv'})}?start={today}&end={today}", 'admin', None),
+            'sync': ('get', f"{reverse('sync')}?since={self.sync_token()}", 'patient', None),
+            'event-ticket': ('post', reverse('event-ticket'), 'patient', {}),
+            'async-login': ('post', reverse('async-login'), None, {'username': 'bench-admin', 'password': BENCH_PASSWORD}),
+            'async-department-list': ('get', reverse('async-department-list'), 'admin', None),
+            'async-doctor-list': ('get', reverse('async-doctor-list'), 'admin', None),
+            'async-user-profile': ('get', reverse('async-user-profile'), 'patient', None),
+            'async-my-appointments': ('get', reverse('async-my-appointments'), 'patient', None),
+            'async-my-prescriptions': ('get', reverse('async-my-prescriptions'), 'patient', None),
+            'async-events': ('get', reverse('async-events'), 'patient', None),
+            'appointment-create': ('post', reverse('appointment-list'), 'admin', {
+                'patient_id': appointment.patient_id, 'doctor_id': appointment.doctor_id, 'date': str(free_day), 'time': '09:00',
+            }),
+            'sync-full': ('get', reverse('sync'), 'patient', None),
+        }
+        return routes
+
+    def request(self, method, url, role, payload):
+        headers = self.headers[role] if role else {}
+        if method == 'get':
+            response = self.client.get(url, headers=headers)
+        else:
+            response = getattr(self.client, method)(url, data=json.dumps(payload), content_type='application/json', headers=headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    async def arequest(self, method, url, role, payload):
+        """request() through ASGI, for the async views: under WSGI they would run in a thread of their own."""
+        headers = self.headers[role] if role else {}
+        if method == 'get':
+            response = await self.async_client.get(url, headers=headers)
+        else:
+            response = await getattr(self.async_client, method)(
+                url, data=json.dumps(payload), content_type='application/json', headers=headers,
+            )
+        if response.streaming:
+            [chunk async for chunk in response.streaming_content]
+        return response
+
+    def run_route(self, name, method, url, role, payload, count, warmup):
+        writes = method != 'get'
+        if iscoroutinefunction(resolve(url.partition('?')[0]).func):
+            request = async_to_sync(self.arequest)
+        else:
+            request = self.request
+
+        def once():
+            if not writes:
+                return request(method, url, role, payload)
+            try:
+                with transaction.atomic():
+                    response = request(method, url, role, payload)
+                    raise Rollback(response)
+            except Rollback as rollback:
+                return rollback.args[0]
+
+        for _ in range(warmup):
+            once()
+        timings, queries, statuses = [], [], set()
+        for _ in range(count):
+            # Every alias, as PerformanceMiddleware does: ReplicaRouter sends reads to 'replica'.
+            with ExitStack() as stack:
+                contexts = [stack.enter_context(CaptureQueriesContext(db)) for db in connections.all()]
+                start = time.perf_counter()
+                response = once()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(sum(len(ctx.captured_queries) for ctx in contexts))
+            statuses.add(response.status_code)
+
+        tracemalloc.start()
+        once()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'method': method.upper(),
+            'url': url,
+            'status': sorted(statuses),
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'queries': round(statistics.mean(queries), 2),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<24} {result['method']:<5} {str(result['status']):<10} "
+            f"p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms  "
+            f"{result['queries']:>6} queries  {result['peak_memory_kb']:>9.1f} KiB"
+        )
+
+    def compare(self, path, current):
+        with open(path) as fh:
+            previous = json.load(fh)
+        self.stdout.write(f"\nChange against {path} ({previous['meta'].get('commit') or 'unknown commit'}):")
+        for name, result in current['routes'].items():
+            before = previous['routes'].get(name)
+            if not before:
+                continue
+            delta = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+            self.stdout.write(
+                f"{name:<24} p50 {before['p50_ms']:>8.2f} -> {result['p50_ms']:>8.2f} ms ({delta:+.1f}%)  "
+                f"queries {before['queries']} -> {result['queries']}"
+            )
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,68 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+
+PASSWORD = 'bench-Passw0rd!'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure hashes/sec for each hasher in PASSWORD_HASHERS, on one thread and on '
+        'a thread pool, to choose a hasher and HMS_HASHER_WORKERS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=2.0, help='Time spent per hasher and mode.')
+        parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--output', '-o', help='Write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        results = {}
+        for hasher in self.available_hashers():
+            encoded = hasher.encode(PASSWORD, hasher.salt())
+            single = self.rate(hasher, encoded, 1, options['seconds'])
+            pooled = self.rate(hasher, encoded, options['threads'], options['seconds'])
+            results[hasher.algorithm] = {
+                'ms_per_hash': round(1000 / single, 2),
+                'hashes_per_sec_1_thread': round(single, 1),
+                f'hashes_per_sec_{options["threads"]}_threads': round(pooled, 1),
+                'hashes_per_sec_per_core': round(pooled / min(options['threads'], os.cpu_count() or 1), 1),
+            }
+            self.stdout.write(
+                f"{hasher.algorithm:<22} {1000 / single:>8.2f} ms/hash  {single:>8.1f}/s on 1 thread  "
+                f"{pooled:>8.1f}/s on {options['threads']} threads"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump({'cpus': os.cpu_count(), 'threads': options['threads'], 'hashers': results}, fh, indent=2)
+            self.stdout.write(f"Saved {options['output']}")
+
+    def available_hashers(self):
+        for hasher in get_hashers():
+            try:
+                if hasher.library:
+                    hasher._load_library()
+            except ValueError:
+                self.stderr.write(f'Skipping {hasher.algorithm}: library not installed.')
+                continue
+            yield hasher
+
+    def rate(self, hasher, encoded, threads, seconds):
+        """Verifications per second; verifying costs the same as hashing a new password."""
+        deadline = time.perf_counter() + seconds
+
+        def work():
+            count = 0
+            while time.perf_counter() < deadline:
+                hasher.verify(PASSWORD, encoded)
+                count += 1
+            return count
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            total = sum(pool.map(lambda _: work(), range(threads)))
+        return total / (time.perf_counter() - start)
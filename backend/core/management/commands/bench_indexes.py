@@ -0,0 +1,126 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max, Min, UniqueConstraint
+from django.utils import timezone
+
+from core.models import Appointment, Prescription
+from core.seed import seed
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Show EXPLAIN plans and timings for the main appointment/prescription access paths, "
+        "with the indexes from core.0002 (and the partial unique index on appointment slots) "
+        "in place and with them dropped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, metavar='APPOINTMENTS',
+                            help='Seed this many appointments first (e.g. 1000000). Default: use existing data.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query (median is reported).')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this file.')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            volume = options['seed']
+            seed(
+                departments=20, doctors=max(volume // 2000, 1), patients=max(volume // 10, 1),
+                appointments=volume, prescriptions=volume // 2,
+                log=lambda message: self.stdout.write(f'  seeded {message}'),
+            )
+        if not Appointment.objects.exists():
+            self.stderr.write('No appointments to benchmark; pass --seed N.')
+            return
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        queries = self.queries()
+        results = {'vendor': connection.vendor, 'rows': self.row_counts(), 'queries': {}}
+        results['queries'] = {name: {'after': self.measure(qs, options['repeat'])} for name, qs in queries.items()}
+
+        # Drop the indexes inside a transaction and roll it back afterwards, so the
+        # "before" numbers come from the same data without touching the schema for good.
+        # This relies on transactional DDL (SQLite, PostgreSQL).
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for name in self.index_names():
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                    if connection.vendor == 'sqlite':
+                        cursor.execute('ANALYZE')
+                for name, qs in queries.items():
+                    results['queries'][name]['before'] = self.measure(qs, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.report(results)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+
+    def index_names(self):
+        """
+        The models' indexes, and their conditional unique constraints: those are
+        unique indexes too (appt_unique_active_slot covers a doctor's day), and
+        the planner would use them in place of a dropped index.
+        """
+        names = []
+        for model in (Appointment, Prescription):
+            names += [index.name for index in model._meta.indexes]
+            names += [
+                constraint.name for constraint in model._meta.constraints
+                if isinstance(constraint, UniqueConstraint) and constraint.condition is not None
+            ]
+        return names
+
+    def queries(self):
+        bounds = Appointment.objects.aggregate(lo=Min('id'), hi=Max('id'))
+        sample = Appointment.objects.filter(id__gte=(bounds['lo'] + bounds['hi']) // 2).order_by('id').first()
+        today = timezone.localdate()
+        return {
+            "doctor's schedule for a day": Appointment.objects.filter(
+                doctor_id=sample.doctor_id, date=sample.date).order_by('time'),
+            "patient's upcoming appointments": Appointment.objects.filter(
+                patient_id=sample.patient_id, status='scheduled', date__gte=today).order_by('date', 'time'),
+            "patient's appointments (keyset page)": Appointment.objects.filter(
+                patient_id=sample.patient_id).order_by('date', 'time', 'id')[:50],
+            "patient's prescriptions, newest first": Prescription.objects.filter(
+                patient_id=sample.patient_id).order_by('-date_prescribed', '-id')[:50],
+            "doctor's prescriptions, newest first": Prescription.objects.filter(
+                doctor_id=sample.doctor_id).order_by('-date_prescribed', '-id')[:50],
+            'appointment list (keyset page)': Appointment.objects.filter(
+                date__gt=sample.date).order_by('date', 'time', 'id')[:50],
+            'admin: scheduled on a date': Appointment.objects.filter(status='scheduled', date=sample.date),
+        }
+
+    def row_counts(self):
+        return {'appointments': Appointment.objects.count(), 'prescriptions': Prescription.objects.count()}
+
+    def measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+        return {'plan': queryset.explain(), 'median_ms': round(statistics.median(timings), 3)}
+
+    def report(self, results):
+        self.stdout.write(f"{results['vendor']}: {results['rows']['appointments']} appointments, "
+                          f"{results['rows']['prescriptions']} prescriptions\n")
+        for name, result in results['queries'].items():
+            before, after = result['before'], result['after']
+            speedup = before['median_ms'] / after['median_ms'] if after['median_ms'] else float('inf')
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(f"  before: {before['median_ms']:.3f} ms  after: {after['median_ms']:.3f} ms  ({speedup:.1f}x)")
+            self.stdout.write('  plan before:\n    ' + before['plan'].replace('\n', '\n    '))
+            self.stdout.write('  plan after:\n    ' + after['plan'].replace('\n', '\n    '))
@@ -0,0 +1,95 @@
+import json
+import statistics
+import time
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.authentication import HMSRefreshToken
+from core.models import User, Appointment
+
+# route name -> {variant: query string}. "expanded" is the nested shape every
+# list returned before ?expand= existed.
+VARIANTS = {
+    'doctor-list': {
+        'flat': '',
+        'expanded': 'expand=user,department',
+        'sparse': 'fields=id,user,specialization&expand=user',
+    },
+    'patient-list': {
+        'flat': '',
+        'expanded': 'expand=user',
+        'sparse': 'fields=id,user.username,blood_group&expand=user',
+    },
+    'appointment-list': {
+        'flat': '',
+        'expanded': 'expand=patient.user,doctor.user,doctor.department',
+        'sparse': 'fields=id,date,time,status,doctor',
+    },
+    'prescription-list': {
+        'flat': '',
+        'expanded': (
+            'expand=patient.user,doctor.user,doctor.department,'
+            'appointment.patient.user,appointment.doctor.user,appointment.doctor.department'
+        ),
+        'sparse': 'fields=id,medication,dosage,date_prescribed',
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare response size, time and queries of the list endpoints with flat ids '
+        '(the default), with every relation expanded, and with a sparse ?fields= set.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=30, help='Timed requests per variant.')
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--output', '-o', help='Write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        if not Appointment.objects.exists():
+            raise CommandError('No data to benchmark; run manage.py seed_hms first.')
+        admin, _ = User.objects.get_or_create(username='bench-admin', defaults={'role': 'admin', 'is_staff': True})
+        client = Client(HTTP_HOST='localhost')
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {HMSRefreshToken.for_user(admin).access_token}'}
+
+        results = {}
+        for name, variants in VARIANTS.items():
+            results[name] = {}
+            for variant, query in variants.items():
+                url = f"{reverse(name)}?page_size={options['page_size']}" + (f'&{query}' if query else '')
+                results[name][variant] = result = self.measure(client, url, headers, options['requests'])
+                self.stdout.write(
+                    f"{name:<18} {variant:<9} {result['bytes']:>9} bytes  p50 {result['p50_ms']:>7.2f} ms  "
+                    f"{result['queries']:>3} queries"
+                )
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Saved {options['output']}")
+
+    def measure(self, client, url, headers, count):
+        # The list views that send ETags are asked fresh each time: no If-None-Match.
+        client.get(url, **headers)
+        timings = []
+        for _ in range(count):
+            # Every alias, as bench_endpoints does: ReplicaRouter sends reads to 'replica'.
+            with ExitStack() as stack:
+                contexts = [stack.enter_context(CaptureQueriesContext(db)) for db in connections.all()]
+                start = time.perf_counter()
+                response = client.get(url, **headers)
+                timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise CommandError(f'{url} answered {response.status_code}: {response.content[:200]!r}')
+        return {
+            'url': url,
+            'bytes': len(response.content),
+            'p50_ms': round(statistics.median(timings), 3),
+            'queries': sum(len(ctx.captured_queries) for ctx in contexts),
+        }
@@ -0,0 +1,74 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from core.authentication import HMSRefreshToken
+from core.models import User, Appointment
+from core.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+
+# route name -> query string; relations are expanded, as the heaviest pages a client asks for.
+ENDPOINTS = {
+    'department-list': '',
+    'doctor-list': 'expand=user,department',
+    'patient-list': 'expand=user',
+    'appointment-list': 'expand=patient.user,doctor.user,doctor.department',
+    'prescription-list': 'expand=patient.user,doctor.user,appointment',
+    'working-hours-list': '',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Render one page of each list endpoint with DRF\'s JSONRenderer, FastJSONRenderer '
+        'and (when msgpack is installed) MessagePackRenderer; report render time and size.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Renders timed per endpoint and renderer.')
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--output', '-o', help='Write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        if not Appointment.objects.exists():
+            raise CommandError('No data to benchmark; run manage.py seed_hms first.')
+        if orjson is None:
+            self.stderr.write('orjson is not installed: FastJSONRenderer falls back to the json module.')
+        renderers = {'drf-json': JSONRenderer(), 'fast-json': FastJSONRenderer()}
+        if msgpack is not None:
+            renderers['msgpack'] = MessagePackRenderer()
+        else:
+            self.stderr.write('Skipping msgpack: library not installed.')
+
+        admin, _ = User.objects.get_or_create(username='bench-admin', defaults={'role': 'admin', 'is_staff': True})
+        client = Client(HTTP_HOST='localhost')
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {HMSRefreshToken.for_user(admin).access_token}'}
+
+        results = {}
+        for name, query in ENDPOINTS.items():
+            url = f"{reverse(name)}?page_size={options['page_size']}" + (f'&{query}' if query else '')
+            response = client.get(url, **headers)
+            if response.status_code != 200:
+                raise CommandError(f'{url} answered {response.status_code}: {response.content[:200]!r}')
+            results[name] = {}
+            for label, renderer in renderers.items():
+                results[name][label] = result = self.measure(renderer, response.data, options['iterations'])
+                self.stdout.write(
+                    f"{name:<19} {label:<10} {result['bytes']:>9} bytes  p50 {result['p50_ms']:>7.3f} ms"
+                )
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Saved {options['output']}")
+
+    def measure(self, renderer, data, iterations):
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            content = renderer.render(data, renderer.media_type, {})
+            timings.append((time.perf_counter() - start) * 1000)
+        return {'bytes': len(content), 'p50_ms': round(statistics.median(timings), 4)}
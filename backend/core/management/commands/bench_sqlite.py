@@ -0,0 +1,130 @@
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+READ_SQL = 'SELECT id, date, time, status FROM core_appointment WHERE doctor_id = ? ORDER BY date, time LIMIT 50'
+WRITE_SQL = 'UPDATE core_appointment SET reason = ? WHERE id = ?'
+
+
+def pragmas(alias):
+    command = settings.DATABASES[alias].get('OPTIONS', {}).get('init_command', '')
+    return [statement.strip() for statement in command.split(';') if statement.strip()]
+
+
+def connect(path, statements):
+    # isolation_level=None: transactions are opened explicitly, as Django does.
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+    for statement in statements:
+        conn.execute(statement)
+    return conn
+
+
+def worker(path, mode, seconds, write_ratio, doctor_ids, max_id, seed, results):
+    """Mixed reads and single-row update transactions until the deadline."""
+    rng = random.Random(seed)
+    if mode == 'tuned':
+        writer = connect(path, pragmas('default'))
+        reader = connect(path, pragmas('replica'))
+        begin = 'BEGIN IMMEDIATE'
+    else:
+        writer = reader = connect(path, [])
+        begin = 'BEGIN'
+    reads = writes = errors = 0
+    write_ms = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            if rng.random() < write_ratio:
+                start = time.perf_counter()
+                writer.execute(begin)
+                try:
+                    writer.execute(WRITE_SQL, (f'bench {rng.random()}', rng.randint(1, max_id)))
+                    writer.execute('COMMIT')
+                except BaseException:
+                    writer.execute('ROLLBACK')
+                    raise
+                write_ms.append((time.perf_counter() - start) * 1000)
+                writes += 1
+            else:
+                reader.execute(READ_SQL, (rng.choice(doctor_ids),)).fetchall()
+                reads += 1
+        except sqlite3.OperationalError:
+            # "database is locked": the busy timeout ran out.
+            errors += 1
+    results.put((reads, writes, errors, write_ms))
+
+
+class Command(BaseCommand):
+    help = (
+        'Run concurrent reader/writer processes against a copy of the SQLite database, '
+        "once with SQLite's defaults and once with the PRAGMAs and read connection from "
+        'settings.DATABASES, and report throughput and lock errors per worker count.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+        parser.add_argument('--seconds', type=float, default=3.0, help='Run time per mode and worker count.')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of operations that write.')
+        parser.add_argument('--output', '-o', help='Write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('bench_sqlite only applies to the sqlite3 backend.')
+        source = connections['default']
+        source.ensure_connection()
+        doctor_ids = [row[0] for row in source.connection.execute('SELECT DISTINCT doctor_id FROM core_appointment')]
+        max_id = source.connection.execute('SELECT MAX(id) FROM core_appointment').fetchone()[0]
+        if not doctor_ids:
+            raise CommandError('No data to benchmark; run manage.py seed_hms first.')
+
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.sqlite3')
+            with sqlite3.connect(path) as copy:
+                source.connection.backup(copy)
+            connections.close_all()
+            for mode, journal in (('default', 'DELETE'), ('tuned', 'WAL')):
+                with sqlite3.connect(path) as conn:
+                    conn.execute(f'PRAGMA journal_mode = {journal}')
+                results[mode] = {}
+                for count in options['workers']:
+                    result = self.run(path, mode, count, options, doctor_ids, max_id)
+                    results[mode][count] = result
+                    self.stdout.write(
+                        f"{mode:<8} {count:>3} workers  {result['reads_per_sec']:>9.1f} reads/s  "
+                        f"{result['writes_per_sec']:>8.1f} writes/s  p95 write {result['p95_write_ms']:>8.2f} ms  "
+                        f"{result['lock_errors']:>5} lock errors"
+                    )
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Saved {options['output']}")
+
+    def run(self, path, mode, count, options, doctor_ids, max_id):
+        queue = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=worker, args=(
+                path, mode, options['seconds'], options['write_ratio'], doctor_ids, max_id, seed, queue,
+            ))
+            for seed in range(count)
+        ]
+        for process in processes:
+            process.start()
+        totals = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        write_ms = sorted(ms for *_, durations in totals for ms in durations)
+        return {
+            'reads_per_sec': round(sum(t[0] for t in totals) / options['seconds'], 1),
+            'writes_per_sec': round(sum(t[1] for t in totals) / options['seconds'], 1),
+            'lock_errors': sum(t[2] for t in totals),
+            'p95_write_ms': round(write_ms[int(len(write_ms) * 0.95)] if write_ms else 0, 2),
+        }
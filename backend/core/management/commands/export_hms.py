@@ -0,0 +1,40 @@
+import argparse
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from core import exports
+
+
+def date_arg(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value!r} is not a YYYY-MM-DD date')
+
+
+class Command(BaseCommand):
+    help = 'Stream appointments or prescriptions as CSV or NDJSON, with the same filters as /api/exports/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(exports.EXPORTS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--start', type=date_arg)
+        parser.add_argument('--end', type=date_arg)
+        parser.add_argument('--doctor', type=int)
+        parser.add_argument('--department', type=int)
+        parser.add_argument('--output', '-o', help='File to write (default: stdout).')
+
+    def handle(self, *args, kind, fmt, output, **options):
+        filters = {name: options[name] for name in ('start', 'end', 'doctor', 'department') if options[name]}
+        if not output:
+            for chunk in exports.render(kind, fmt, **filters):
+                self.stdout.write(chunk, ending='')
+            return
+        count = 0
+        with open(output, 'w', newline='') as out:
+            for chunk in exports.render(kind, fmt, **filters):
+                out.write(chunk)
+                count += 1
+        rows = count - 1 if fmt == 'csv' else count
+        self.stderr.write(f'Wrote {rows} {kind} to {output}')
@@ -0,0 +1,56 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import cache, medications
+
+
+class Command(BaseCommand):
+    help = (
+        'Add medication names to the catalog from a CSV file with a "name" column, or a '
+        'text file with one name per line ("-" reads stdin). Names already in the catalog '
+        '(ignoring case and spacing) are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--link', action='store_true',
+            help='Then link prescriptions without a catalog entry whose medication matches a catalog name.',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be >= 1.')
+        try:
+            if options['path'] == '-':
+                names = list(self.read(sys.stdin))
+            else:
+                with open(options['path'], newline='', encoding='utf-8') as fh:
+                    names = list(self.read(fh))
+        except OSError as exc:
+            raise CommandError(str(exc))
+        added = medications.import_names(names, options['batch_size'])
+        self.stdout.write(f'Added {added} of {len(names)} names to the catalog.')
+        too_long = sum(len(medications.normalize(name)) > medications.MAX_LENGTH for name in names)
+        if too_long:
+            self.stderr.write(f'Skipped {too_long} names longer than {medications.MAX_LENGTH} characters.')
+        if options['link']:
+            linked = medications.link()
+            # Cached "my prescriptions" payloads show the old, unlinked rows.
+            cache.invalidate_all()
+            self.stdout.write(f'Linked {linked} prescriptions.')
+
+    def read(self, fh):
+        first = fh.readline()
+        header = [column.strip().lower() for column in next(csv.reader([first]), [])]
+        if 'name' in header:
+            column = header.index('name')
+            for row in csv.reader(fh):
+                if len(row) > column:
+                    yield row[column]
+            return
+        yield first
+        yield from fh
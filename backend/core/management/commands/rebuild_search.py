@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Refill the patient/doctor search tables (see core.search) from the current rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('index', nargs='?', choices=sorted(search.INDEXES), help='Default: all indexes.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = search.rebuild(options['index'])
+        if not written:
+            self.stderr.write('No search tables on this database; searches use unindexed filters.')
+        for name, count in written.items():
+            self.stdout.write(f'{name}: {count} documents')
+        self.stdout.write(f'Done in {time.perf_counter() - start:.1f}s')
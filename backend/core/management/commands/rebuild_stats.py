@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the dashboard summary tables (DoctorDailyStats, DepartmentMonthlyStats) '
+        'from all appointments and prescriptions. Run once after migrating, and after bulk '
+        'writes that bypass signals.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rows = stats.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(
+            f"Rebuilt {rows['doctor_daily_stats']} doctor/day/status rows and "
+            f"{rows['department_monthly_stats']} department/month rows in {time.perf_counter() - start:.1f}s"
+        )
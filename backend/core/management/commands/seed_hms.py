@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from core.seed import seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic departments, doctors, patients, appointments and prescriptions. '
+        'Example for a large hospital: --departments 200 --doctors 5000 --patients 2000000 --appointments 20000000'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--departments', type=int, default=20)
+        parser.add_argument('--doctors', type=int, default=200)
+        parser.add_argument('--patients', type=int, default=20000)
+        parser.add_argument('--appointments', type=int, default=200000)
+        parser.add_argument('--prescriptions', type=int, help='Default: half the appointments.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        prescriptions = options['prescriptions']
+        if prescriptions is None:
+            prescriptions = options['appointments'] // 2
+        created = seed(
+            departments=options['departments'],
+            doctors=options['doctors'],
+            patients=options['patients'],
+            appointments=options['appointments'],
+            prescriptions=prescriptions,
+            batch_size=options['batch_size'],
+            random_seed=options['random_seed'],
+            log=lambda message: self.stdout.write(f'  {message}'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Seeded ' + ', '.join(f'{count} {name}' for name, count in created.items())
+        ))
@@ -0,0 +1,148 @@
+"""
+Medication catalog: name matching, linking free-text prescriptions to catalog
+entries, and the prefix index behind ``/api/medications/autocomplete/``.
+
+Every worker keeps the catalog in memory as two sorted lists, one of whole
+names and one of the words after the first, and answers a prefix with a
+bisect. No query is run per keystroke. Catalog writes bump the core_medication
+TableVersion. A worker rebuilds its index when it sees a new version, which
+it checks at most every HMS_MEDICATION_INDEX_TTL seconds; the worker that made
+the change rebuilds as soon as it commits.
+"""
+import bisect
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from . import versions
+from .models import Medication, Prescription, ArchivedPrescription, TableVersion
+
+WORD = re.compile(r'\w+')
+TABLE = Medication._meta.db_table
+MAX_LENGTH = Medication._meta.get_field('name').max_length
+
+
+def normalize(name):
+    """The name as stored: surrounding and repeated whitespace removed."""
+    return ' '.join(name.split())
+
+
+def key(name):
+    return normalize(name).lower()
+
+
+def catalogable(name):
+    """Whether a normalized name can be a catalog entry. Longer texts stay free text, unlinked."""
+    return bool(name) and len(name) <= MAX_LENGTH
+
+
+def ids_by_key():
+    return {key(name): pk for pk, name in Medication.objects.values_list('pk', 'name').iterator()}
+
+
+def import_names(names, batch_size=1000):
+    """
+    Add the names not yet in the catalog (ignoring case and spacing); returns
+    how many were added. Names too long for the catalog are left out.
+    """
+    known = set(ids_by_key())
+    new = {}
+    for name in map(normalize, names):
+        if catalogable(name) and key(name) not in known:
+            new.setdefault(key(name), name)
+    rows = list(new.values())
+    with transaction.atomic():
+        for start in range(0, len(rows), batch_size):
+            # ignore_conflicts: an entry added concurrently since we read the catalog.
+            Medication.objects.bulk_create(
+                [Medication(name=name) for name in rows[start:start + batch_size]], ignore_conflicts=True,
+            )
+        # bulk_create() sends no post_save; do what the receivers in core.signals would.
+        versions.bump(TABLE)
+        transaction.on_commit(catalog.invalidate)
+    return len(rows)
+
+
+def link(batch_size=300):
+    """Point unlinked prescriptions at the catalog entry named like their medication; returns rows linked."""
+    ids = ids_by_key()
+    now, linked = timezone.now(), 0
+    for model in (Prescription, ArchivedPrescription):
+        unlinked = model.objects.filter(drug__isnull=True)
+        texts = unlinked.order_by().values_list('medication', flat=True).distinct()
+        pairs = [(text, ids[key(text)]) for text in texts if key(text) in ids]
+        # One UPDATE per batch of names (medication is not indexed, so each is a scan);
+        # three parameters per name keeps a batch under SQLite's variable limit.
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            linked += unlinked.filter(medication__in=[text for text, _ in batch]).update(
+                drug_id=Case(*[When(medication=text, then=Value(pk)) for text, pk in batch]),
+                updated_at=now,
+            )
+    return linked
+
+
+class PrefixIndex:
+    def __init__(self, rows):
+        self.names = {}
+        starts, words = [], []
+        for pk, name in rows:
+            self.names[pk] = name
+            folded = key(name)
+            starts.append((folded, pk))
+            # "clav" finds "Amoxicillin Clavulanate".
+            words += [(folded[match.start():], pk) for match in WORD.finditer(folded) if match.start()]
+        starts.sort()
+        words.sort()
+        self.lists = [([text for text, _ in entries], [pk for _, pk in entries]) for entries in (starts, words)]
+
+    def search(self, prefix, limit=10):
+        """[{id, name}] of entries with a name or later word starting with prefix; name matches first."""
+        prefix = key(prefix)
+        if not prefix:
+            return []
+        found = {}
+        for texts, ids in self.lists:
+            position = bisect.bisect_left(texts, prefix)
+            while position < len(texts) and len(found) < limit and texts[position].startswith(prefix):
+                found.setdefault(ids[position], self.names[ids[position]])
+                position += 1
+        return [{'id': pk, 'name': name} for pk, name in found.items()]
+
+
+class CatalogIndex:
+    """The process-wide PrefixIndex, rebuilt when the catalog's TableVersion moves."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+        self.checked = 0.0
+
+    def invalidate(self):
+        self.checked = 0.0
+        self.version = None
+
+    def current(self):
+        ttl = getattr(settings, 'HMS_MEDICATION_INDEX_TTL', 5)
+        if self.index is not None and self.version is not None and time.monotonic() - self.checked < ttl:
+            return self.index
+        with self.lock:
+            # Read the version first: a change made while loading is seen at the next check.
+            version = TableVersion.objects.filter(name=TABLE).values_list('version', flat=True).first() or 0
+            if self.index is None or version != self.version:
+                self.index = PrefixIndex(Medication.objects.values_list('pk', 'name').iterator())
+                self.version = version
+            self.checked = time.monotonic()
+        return self.index
+
+    def search(self, prefix, limit=10):
+        return self.current().search(prefix, limit)
+
+
+catalog = CatalogIndex()
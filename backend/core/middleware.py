@@ -0,0 +1,110 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('hms.perf')
+
+
+class RequestMetrics:
+    """Execute wrapper that counts and times every SQL statement a request runs."""
+
+    def __init__(self):
+        self.queries = []
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.db_time += duration
+            self.queries.append((sql, duration))
+
+
+class PerformanceMiddleware:
+    """
+    Per-request timing: total, database (statement count and time), response
+    rendering, and the rest of the application time (view code and serializers).
+
+    Enabled by HMS_PERF_ENABLED. HMS_PERF_SAMPLE_RATE sets the fraction of
+    requests that are measured. Each measured request gets a Server-Timing
+    header and one JSON log line on the ``hms.perf`` logger. A request slower
+    than HMS_PERF_SLOW_MS is also logged at WARNING level with its SQL.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'HMS_PERF_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'HMS_PERF_SAMPLE_RATE', 1.0)
+        self.slow_ms = getattr(settings, 'HMS_PERF_SLOW_MS', 500)
+        self.max_logged_queries = getattr(settings, 'HMS_PERF_MAX_LOGGED_QUERIES', 50)
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        metrics = request._perf_metrics = RequestMetrics()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            start = time.perf_counter()
+            response = self.get_response(request)
+            total = time.perf_counter() - start
+
+        timings = {
+            'total_ms': total * 1000,
+            'db_ms': metrics.db_time * 1000,
+            'render_ms': metrics.render_time * 1000,
+            'app_ms': max(total - metrics.db_time - metrics.render_time, 0) * 1000,
+        }
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timings["db_ms"]:.1f};desc="{len(metrics.queries)} queries"',
+            f'render;dur={timings["render_ms"]:.1f}',
+            f'app;dur={timings["app_ms"]:.1f}',
+            f'total;dur={timings["total_ms"]:.1f}',
+        ])
+
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': len(metrics.queries),
+            **{name: round(value, 2) for name, value in timings.items()},
+        }
+        if timings['total_ms'] >= self.slow_ms:
+            record['slow'] = True
+            record['sql'] = [
+                {'sql': sql, 'ms': round(duration * 1000, 2)}
+                for sql, duration in metrics.queries[:self.max_logged_queries]
+            ]
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+        return response
+
+    def process_template_response(self, request, response):
+        # Django renders DRF/template responses after this hook; wrap render() to time it.
+        metrics = getattr(request, '_perf_metrics', None)
+        if metrics is not None:
+            render = response.render
+
+            def timed_render():
+                start = time.perf_counter()
+                try:
+                    return render()
+                finally:
+                    metrics.render_time += time.perf_counter() - start
+
+            response.render = timed_render
+        return response
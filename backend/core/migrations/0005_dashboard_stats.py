@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_table_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepartmentMonthlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month.')),
+                ('count', models.IntegerField(default=0)),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_stats', to='core.department')),
+            ],
+            options={
+                'verbose_name_plural': 'department monthly stats',
+                'ordering': ['department', 'month'],
+                'indexes': [models.Index(fields=['month'], name='department_stats_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('department', 'month'), name='department_stats_unique_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DoctorDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.doctor')),
+            ],
+            options={
+                'verbose_name_plural': 'doctor daily stats',
+                'ordering': ['doctor', 'date', 'status'],
+                'indexes': [models.Index(fields=['date', 'status'], name='doctor_stats_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'date', 'status'), name='doctor_stats_unique_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+# Documents are built the same way as core.search.SearchIndex.documents().
+PATIENT_COLUMNS = {
+    'name': "TRIM(COALESCE(u.first_name, '') || ' ' || COALESCE(u.last_name, ''))",
+    'username': 'u.username',
+    'email': 'u.email',
+    'blood_group': 'p.blood_group',
+}
+PATIENT_FROM = 'core_patient p JOIN core_user u ON u.id = p.user_id'
+DOCTOR_COLUMNS = {
+    'name': "TRIM(COALESCE(u.first_name, '') || ' ' || COALESCE(u.last_name, ''))",
+    'username': 'u.username',
+    'specialization': 'd.specialization',
+    'department': 'dep.name',
+}
+DOCTOR_FROM = 'core_doctor d JOIN core_user u ON u.id = d.user_id JOIN core_department dep ON dep.id = d.department_id'
+TABLES = (
+    ('core_patient_search', PATIENT_COLUMNS, PATIENT_FROM, 'p.id'),
+    ('core_doctor_search', DOCTOR_COLUMNS, DOCTOR_FROM, 'd.id'),
+)
+
+
+def sqlite_statements():
+    for table, columns, source, key in TABLES:
+        yield (
+            f"CREATE VIRTUAL TABLE {table} USING fts5({', '.join(columns)}, "
+            f"tokenize=\"unicode61 remove_diacritics 2 tokenchars '+-'\", prefix='2 3')"
+        )
+        yield f"INSERT INTO {table} (rowid, {', '.join(columns)}) SELECT {key}, {', '.join(columns.values())} FROM {source}"
+
+
+def postgresql_statements():
+    yield 'CREATE EXTENSION IF NOT EXISTS pg_trgm'
+    for table, columns, source, key in TABLES:
+        # bigint: ids are BigAutoField (DEFAULT_AUTO_FIELD).
+        yield f'CREATE TABLE {table} (id bigint PRIMARY KEY, document text NOT NULL)'
+        yield f'CREATE INDEX {table}_trgm ON {table} USING gin (document gin_trgm_ops)'
+        yield f"INSERT INTO {table} (id, document) SELECT {key}, LOWER(CONCAT_WS(' ', {', '.join(columns.values())})) FROM {source}"
+
+
+def create_search_tables(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = sqlite_statements()
+    elif vendor == 'postgresql':
+        statements = postgresql_statements()
+    else:
+        return  # core.search falls back to unindexed filters.
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        for table, *_ in TABLES:
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_dashboard_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
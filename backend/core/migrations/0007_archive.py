@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_search_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('reason', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=10)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_appointments', to='core.doctor')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_appointments', to='core.patient')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPrescription',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('medication', models.TextField()),
+                ('dosage', models.CharField(max_length=100)),
+                ('instructions', models.TextField(blank=True)),
+                ('date_prescribed', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='prescription', to='core.archivedappointment')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_prescriptions', to='core.doctor')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_prescriptions', to='core.patient')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedappointment',
+            index=models.Index(fields=['patient', 'date', 'time', 'id'], name='archived_appt_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedappointment',
+            index=models.Index(fields=['doctor', 'date', 'time', 'id'], name='archived_appt_doctor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedappointment',
+            index=models.Index(fields=['date', 'time', 'id'], name='archived_appt_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedprescription',
+            index=models.Index(fields=['patient', '-date_prescribed', '-id'], name='archived_rx_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedprescription',
+            index=models.Index(fields=['doctor', '-date_prescribed', '-id'], name='archived_rx_doctor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedprescription',
+            index=models.Index(fields=['-date_prescribed', '-id'], name='archived_rx_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='department',
+            field=models.ForeignKey(blank=True, help_text='Limits a lab or admin user to this department; empty for the whole hospital.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='staff', to='core.department'),
+        ),
+    ]
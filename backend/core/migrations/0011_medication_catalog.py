@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:57
+
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_catalog(apps, schema_editor):
+    """One catalog entry per prescribed name (ignoring case and spacing), linked to its prescriptions."""
+    Medication = apps.get_model('core', 'Medication')
+    prescriptions = [apps.get_model('core', 'Prescription'), apps.get_model('core', 'ArchivedPrescription')]
+    texts = {model: list(model.objects.order_by().values_list('medication', flat=True).distinct()) for model in prescriptions}
+    # Longer free text (notes rather than a drug name) stays unlinked, as core.medications.catalogable() has it.
+    max_length = Medication._meta.get_field('name').max_length
+    names = {}
+    for text in (text for model_texts in texts.values() for text in model_texts):
+        name = ' '.join(text.split())
+        if name and len(name) <= max_length:
+            names.setdefault(name.lower(), name)
+    Medication.objects.bulk_create([Medication(name=name) for name in names.values()], batch_size=1000)
+
+    ids = {name.lower(): pk for pk, name in Medication.objects.values_list('pk', 'name')}
+    now = timezone.now()
+    for model, model_texts in texts.items():
+        pairs = []
+        for text in model_texts:
+            pk = ids.get(' '.join(text.split()).lower())
+            if pk is not None:
+                pairs.append((text, pk))
+        # One UPDATE per batch of names rather than per name: medication is not indexed.
+        for start in range(0, len(pairs), 300):
+            batch = pairs[start:start + 300]
+            # A changed row for delta sync (core.sync), like any other edit.
+            model.objects.filter(medication__in=[text for text, _ in batch]).update(
+                drug_id=models.Case(*[models.When(medication=text, then=models.Value(pk)) for text, pk in batch]),
+                updated_at=now,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_user_department'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Medication',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+            ],
+            options={
+                'ordering': ['name'],
+                'constraints': [models.UniqueConstraint(django.db.models.functions.text.Lower('name'), name='medication_unique_name')],
+            },
+        ),
+        migrations.AddField(
+            model_name='archivedprescription',
+            name='drug',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_prescriptions', to='core.medication'),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='drug',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='prescriptions', to='core.medication'),
+        ),
+        migrations.RunPython(backfill_catalog, migrations.RunPython.noop),
+    ]
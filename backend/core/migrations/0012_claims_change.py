@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_medication_catalog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimsChange',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='claims_change', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('changed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,5 +1,68 @@
+from functools import reduce
+from operator import or_
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Lower
+
+def is_staff_user(user):
+    """Lab and admin users see the whole hospital, or their department when they have one."""
+    return user.role in ('lab', 'admin') or user.is_staff
+
+def visit_out_of_scope(user, patient=None, doctor=None):
+    """
+    The field ('patient' or 'doctor') that would put a new or changed visit outside
+    VisitQuerySet.for_user(user), or None. Only the given profiles are checked.
+    """
+    if user.role == 'patient':
+        return 'patient' if patient is not None and patient.user_id != user.pk else None
+    if user.role == 'doctor':
+        return 'doctor' if doctor is not None and doctor.user_id != user.pk else None
+    if is_staff_user(user):
+        department_id = getattr(user, 'department_id', None)
+        if department_id and doctor is not None and doctor.department_id != department_id:
+            return 'doctor'
+        return None
+    return 'patient' if patient is not None else 'doctor'
+
+class VisitQuerySet(models.QuerySet):
+    """Appointments and prescriptions (live or archived) and their tombstones."""
+
+    def for_user(self, user):
+        """The rows the user may see, filtered through joins in the same query."""
+        from .authentication import profile_lookup
+        if not user.is_authenticated:
+            return self.none()
+        if user.role in ('patient', 'doctor'):
+            return self.filter(**profile_lookup(user, user.role))
+        if is_staff_user(user):
+            department_id = getattr(user, 'department_id', None)
+            return self.filter(doctor__department_id=department_id) if department_id else self
+        return self.none()
+
+class PatientQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """A patient sees their own profile; a doctor, the patients they have seen or prescribed for."""
+        from .authentication import profile_lookup
+        if not user.is_authenticated:
+            return self.none()
+        if user.role == 'patient':
+            patient_id = getattr(user, 'patient_id', None)
+            return self.filter(pk=patient_id) if patient_id is not None else self.filter(user_id=user.pk)
+        if user.role == 'doctor':
+            return self.with_visits(**profile_lookup(user, 'doctor'))
+        if is_staff_user(user):
+            department_id = getattr(user, 'department_id', None)
+            return self.with_visits(doctor__department_id=department_id) if department_id else self
+        return self.none()
+
+    def with_visits(self, **lookup):
+        """Patients with a live or archived appointment or prescription matching lookup."""
+        visits = [
+            models.Exists(model.objects.filter(patient=models.OuterRef('pk'), **lookup))
+            for model in (Appointment, Prescription, ArchivedAppointment, ArchivedPrescription)
+        ]
+        return self.filter(reduce(or_, visits))
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -9,10 +72,31 @@ class User(AbstractUser):
         ('admin', 'Admin'),
     )
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='patient')
+    department = models.ForeignKey(
+        'Department', on_delete=models.SET_NULL, null=True, blank=True, related_name='staff',
+        help_text='Limits a lab or admin user to this department; empty for the whole hospital.',
+    )
 
     def __str__(self):
         return f"{self.username} ({self.role})"
 
+class ClaimsChange(models.Model):
+    """When a field carried in a user's tokens last changed; older tokens are not trusted (core.authentication)."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='claims_change')
+    changed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id} at {self.changed_at}"
+
+class TableVersion(models.Model):
+    """A counter bumped on every write to a table, used to validate HTTP caches cheaply."""
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
 class Department(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -29,11 +113,42 @@ class Doctor(models.Model):
     def __str__(self):
         return f"Dr. {self.user.first_name} {self.user.last_name}"
 
+class WorkingHours(models.Model):
+    WEEKDAY_CHOICES = (
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    )
+
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='working_hours')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+
+    class Meta:
+        verbose_name_plural = 'working hours'
+        ordering = ('doctor', 'weekday', 'start_time')
+        constraints = [
+            models.CheckConstraint(condition=models.Q(end_time__gt=models.F('start_time')), name='working_hours_end_after_start'),
+            models.CheckConstraint(condition=models.Q(slot_minutes__gt=0), name='working_hours_positive_slot'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} {self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
 class Patient(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='patient_profile')
     date_of_birth = models.DateField(null=True, blank=True)
     blood_group = models.CharField(max_length=5, blank=True)
     address = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = PatientQuerySet.as_manager()
     
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}"
@@ -51,18 +166,220 @@ class Appointment(models.Model):
     time = models.TimeField(default='09:00:00')
     reason = models.TextField(blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='scheduled')
+    # Set on every save, and by BulkListSerializer for bulk updates; read by core.sync.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = VisitQuerySet.as_manager()
+
+    # ArchivedAppointment rows say True; both are rendered by AppointmentSerializer.
+    archived = False
+
+    class Meta:
+        indexes = [
+            # A doctor's schedule for a day.
+            models.Index(fields=['doctor', 'date', 'time'], name='appt_doctor_schedule_idx'),
+            # "My appointments" for a patient, in keyset order.
+            models.Index(fields=['patient', 'date', 'time', 'id'], name='appt_patient_date_idx'),
+            # A patient's upcoming scheduled appointments; past and cancelled rows are left out.
+            models.Index(
+                fields=['patient', 'date', 'time'], name='appt_patient_upcoming_idx',
+                condition=models.Q(status='scheduled'),
+            ),
+            models.Index(fields=['date', 'time', 'id'], name='appt_date_time_idx'),
+            models.Index(fields=['status', 'date'], name='appt_status_date_idx'),
+            # A patient's or doctor's changes since their last sync.
+            models.Index(fields=['patient', 'updated_at', 'id'], name='appt_patient_sync_idx'),
+            models.Index(fields=['doctor', 'updated_at', 'id'], name='appt_doctor_sync_idx'),
+        ]
+        constraints = [
+            # One active booking per doctor slot; concurrent bookings race in the database.
+            models.UniqueConstraint(
+                fields=['doctor', 'date', 'time'], name='appt_unique_active_slot',
+                condition=~models.Q(status='cancelled'),
+                violation_error_message='This doctor is already booked at that date and time.',
+            ),
+        ]
     
     def __str__(self):
         return f"Appointment: {self.patient} with {self.doctor} on {self.date}"
 
+class Medication(models.Model):
+    """A catalog entry that prescriptions link to. Names are unique regardless of case."""
+    name = models.CharField(max_length=200)
+
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(Lower('name'), name='medication_unique_name'),
+        ]
+
+    def __str__(self):
+        return self.name
+
 class Prescription(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='prescriptions')
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='prescriptions')
     appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='prescription', null=True, blank=True)
+    # The name as prescribed; drug is the catalog entry it was picked from or matched to.
     medication = models.TextField()
+    drug = models.ForeignKey(Medication, on_delete=models.SET_NULL, null=True, blank=True, related_name='prescriptions')
     dosage = models.CharField(max_length=100)
     instructions = models.TextField(blank=True)
     date_prescribed = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = VisitQuerySet.as_manager()
+
+    archived = False
+
+    class Meta:
+        indexes = [
+            # A patient's or doctor's prescriptions, newest first.
+            models.Index(fields=['patient', '-date_prescribed', '-id'], name='rx_patient_recent_idx'),
+            models.Index(fields=['doctor', '-date_prescribed', '-id'], name='rx_doctor_recent_idx'),
+            models.Index(fields=['-date_prescribed', '-id'], name='rx_recent_idx'),
+            models.Index(fields=['patient', 'updated_at', 'id'], name='rx_patient_sync_idx'),
+            models.Index(fields=['doctor', 'updated_at', 'id'], name='rx_doctor_sync_idx'),
+        ]
     
     def __str__(self):
-        return f"Prescription for {self.patient} by {self.doctor}"
\ No newline at end of file
+        return f"Prescription for {self.patient} by {self.doctor}"
+
+class ArchivedAppointment(models.Model):
+    """A completed or cancelled appointment moved out of Appointment by core.archive. Keeps its id."""
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='archived_appointments')
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='archived_appointments')
+    date = models.DateField()
+    time = models.TimeField()
+    reason = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=Appointment.STATUS_CHOICES)
+    # Copied from the live row: archiving is not a change to sync.
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = VisitQuerySet.as_manager()
+
+    archived = True
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'date', 'time', 'id'], name='archived_appt_patient_idx'),
+            models.Index(fields=['doctor', 'date', 'time', 'id'], name='archived_appt_doctor_idx'),
+            models.Index(fields=['date', 'time', 'id'], name='archived_appt_date_idx'),
+            models.Index(fields=['patient', 'updated_at', 'id'], name='archived_appt_patient_sync_idx'),
+            models.Index(fields=['doctor', 'updated_at', 'id'], name='archived_appt_doctor_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived appointment: {self.patient} with {self.doctor} on {self.date}"
+
+class ArchivedPrescription(models.Model):
+    """A prescription archived together with its appointment. Keeps its id."""
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='archived_prescriptions')
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='archived_prescriptions')
+    appointment = models.ForeignKey(ArchivedAppointment, on_delete=models.CASCADE, related_name='prescription', null=True, blank=True)
+    medication = models.TextField()
+    drug = models.ForeignKey(Medication, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_prescriptions')
+    dosage = models.CharField(max_length=100)
+    instructions = models.TextField(blank=True)
+    date_prescribed = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = VisitQuerySet.as_manager()
+
+    archived = True
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', '-date_prescribed', '-id'], name='archived_rx_patient_idx'),
+            models.Index(fields=['doctor', '-date_prescribed', '-id'], name='archived_rx_doctor_idx'),
+            models.Index(fields=['-date_prescribed', '-id'], name='archived_rx_recent_idx'),
+            models.Index(fields=['patient', 'updated_at', 'id'], name='archived_rx_patient_sync_idx'),
+            models.Index(fields=['doctor', 'updated_at', 'id'], name='archived_rx_doctor_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived prescription for {self.patient} by {self.doctor}"
+
+class ChangeEvent(models.Model):
+    """A change to an appointment or prescription, queued for one user's event stream (core.events)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='change_events')
+    kind = models.CharField(max_length=20)
+    action = models.CharField(max_length=10)
+    object_id = models.BigIntegerField()
+    data = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # A user's events after their Last-Event-ID.
+            models.Index(fields=['user', 'id'], name='change_event_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} {self.action} for user {self.user_id}"
+
+class Tombstone(models.Model):
+    """
+    An appointment or prescription that a patient or doctor can no longer see:
+    deleted, or moved to another patient or doctor. Read by core.sync.
+    """
+    kind = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    # Ids of who lost the row; no constraint, so the tombstone outlives a deleted profile.
+    patient = models.ForeignKey(Patient, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    doctor = models.ForeignKey(Doctor, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = VisitQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'deleted_at', 'id'], name='tombstone_patient_idx'),
+            models.Index(fields=['doctor', 'deleted_at', 'id'], name='tombstone_doctor_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} removed {self.deleted_at}"
+
+class DoctorDailyStats(models.Model):
+    """Appointments per doctor, day and status. Maintained by core.stats."""
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    status = models.CharField(max_length=10, choices=Appointment.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'doctor daily stats'
+        ordering = ['doctor', 'date', 'status']
+        indexes = [
+            models.Index(fields=['date', 'status'], name='doctor_stats_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'date', 'status'], name='doctor_stats_unique_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} {self.date} {self.status}: {self.count}"
+
+class DepartmentMonthlyStats(models.Model):
+    """Prescriptions per prescribing doctor's department and month. Maintained by core.stats."""
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='monthly_stats')
+    month = models.DateField(help_text='First day of the month.')
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'department monthly stats'
+        ordering = ['department', 'month']
+        indexes = [
+            models.Index(fields=['month'], name='department_stats_month_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['department', 'month'], name='department_stats_unique_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.department} {self.month:%Y-%m}: {self.count}"
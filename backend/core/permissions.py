@@ -10,4 +10,8 @@ class IsPatient(permissions.BasePermission):
 
 class IsLab(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.role == 'lab'
\ No newline at end of file
+        return request.user.is_authenticated and request.user.role == 'lab'
+
+class IsAdmin(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and (request.user.role == 'admin' or request.user.is_staff)
@@ -0,0 +1,41 @@
+"""
+Expiry of the append-only change logs: ChangeEvent rows behind the event
+stream (core.events) and the Tombstones read by delta sync (core.sync).
+
+Both writers call prune() after storing rows. It deletes every log's expired
+rows at most once a minute per process, so the cost is not paid per change.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ChangeEvent, Tombstone
+
+# model -> (timestamp field, retention setting, default seconds)
+LOGS = {
+    ChangeEvent: ('created', 'HMS_EVENTS_RETENTION', 86400),
+    Tombstone: ('deleted_at', 'HMS_SYNC_RETENTION', 30 * 86400),
+}
+INTERVAL = 60
+_last_prune = 0.0
+
+
+def retention(model):
+    _, setting, default = LOGS[model]
+    return datetime.timedelta(seconds=getattr(settings, setting, default))
+
+
+def prune(force=False):
+    """Delete expired log rows; returns rows deleted per model name ({} when skipped)."""
+    global _last_prune
+    if not force and time.monotonic() - _last_prune < INTERVAL:
+        return {}
+    _last_prune = time.monotonic()
+    now = timezone.now()
+    deleted = {}
+    for model, (field, _, _) in LOGS.items():
+        count, _ = model.objects.filter(**{f'{field}__lt': now - retention(model)}).delete()
+        deleted[model._meta.model_name] = count
+    return deleted
@@ -0,0 +1,182 @@
+"""
+Text search over patients and doctors.
+
+Each index is a shadow table holding one document per patient or doctor,
+rewritten by receivers in core.signals whenever the row or anything it is
+built from (user names, department name) changes:
+
+* SQLite: an FTS5 virtual table, queried with MATCH and ranked by bm25.
+* PostgreSQL: a plain table with a pg_trgm GIN index on the document,
+  matched with ILIKE per term and ranked by similarity().
+
+Migration 0006 creates and fills the tables. Where neither is available the
+search falls back to unindexed icontains filters. ``manage.py rebuild_search``
+refills the tables after writes that bypass signals, such as bulk_create().
+"""
+import re
+from functools import reduce
+from operator import and_, or_
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Patient, Doctor
+
+TERM = re.compile(r'[\w+-]+')
+MAX_TERMS = 8
+_available = {}
+
+
+class SearchIndex:
+    def __init__(self, model, table, fields):
+        self.model = model
+        self.table = table
+        # column name -> lookups joined (with spaces) into that column.
+        self.fields = fields
+
+    @property
+    def columns(self):
+        return list(self.fields)
+
+    @property
+    def lookups(self):
+        return [lookup for lookups in self.fields.values() for lookup in lookups]
+
+    def documents(self, pks=None):
+        """(pk, [column values]) for the given rows, or for every row."""
+        queryset = self.model.objects.order_by()
+        if pks is not None:
+            queryset = queryset.filter(pk__in=pks)
+        for row in queryset.values_list('pk', *self.lookups).iterator(chunk_size=2000):
+            values, position = [], 1
+            for lookups in self.fields.values():
+                parts = row[position:position + len(lookups)]
+                values.append(' '.join(str(part) for part in parts if part))
+                position += len(lookups)
+            yield row[0], values
+
+
+INDEXES = {
+    'patients': SearchIndex(Patient, 'core_patient_search', {
+        'name': ('user__first_name', 'user__last_name'),
+        'username': ('user__username',),
+        'email': ('user__email',),
+        'blood_group': ('blood_group',),
+    }),
+    'doctors': SearchIndex(Doctor, 'core_doctor_search', {
+        'name': ('user__first_name', 'user__last_name'),
+        'username': ('user__username',),
+        'specialization': ('specialization',),
+        'department': ('department__name',),
+    }),
+}
+
+
+def connection_for(index, write=False):
+    alias = (router.db_for_write if write else router.db_for_read)(index.model)
+    return connections[alias]
+
+
+def available(connection, index):
+    """Whether the shadow table exists on this connection (checked once per database)."""
+    key = (connection.alias, index.table)
+    if key not in _available:
+        _available[key] = connection.vendor in ('sqlite', 'postgresql') and (
+            index.table in connection.introspection.table_names()
+        )
+    return _available[key]
+
+
+def terms(q):
+    return [term.lower() for term in TERM.findall(q)][:MAX_TERMS]
+
+
+def like_escape(word):
+    # Terms are [\w+-]+, so '_' is the only LIKE wildcard they can contain.
+    return word.replace('_', '\\_')
+
+
+def update(name, pks):
+    """Rewrite the documents of these rows; rows that no longer exist are removed."""
+    index = INDEXES[name]
+    pks = list(pks)
+    connection = connection_for(index, write=True)
+    if not pks or not available(connection, index):
+        return
+    key = 'rowid' if connection.vendor == 'sqlite' else 'id'
+    table = connection.ops.quote_name(index.table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {key} IN ({", ".join(["%s"] * len(pks))})', pks)
+        documents = list(index.documents(pks))
+        if not documents:
+            return
+        if connection.vendor == 'postgresql':
+            columns, rows = ['document'], [(pk, ' '.join(values).lower()) for pk, values in documents]
+        else:
+            columns, rows = index.columns, [(pk, *values) for pk, values in documents]
+        placeholders = ', '.join(['%s'] * (len(columns) + 1))
+        cursor.executemany(f'INSERT INTO {table} ({key}, {", ".join(columns)}) VALUES ({placeholders})', rows)
+
+
+def rebuild(name=None):
+    """Refill one index (or all of them) from scratch; returns documents written per index."""
+    written = {}
+    for index_name in ([name] if name else INDEXES):
+        index = INDEXES[index_name]
+        connection = connection_for(index, write=True)
+        if not available(connection, index):
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(index.table)}')
+        pks = list(index.model.objects.values_list('pk', flat=True).order_by('pk'))
+        for start in range(0, len(pks), 2000):
+            update(index_name, pks[start:start + 2000])
+        written[index_name] = len(pks)
+    return written
+
+
+def search(name, q, limit, offset=0, scope=None):
+    """
+    Primary keys of the best matches for q, best first. With a scope queryset
+    only rows in it are matched: it is joined into the index query as a
+    subquery, so paging happens after scoping.
+    """
+    index = INDEXES[name]
+    words = terms(q)
+    if not words:
+        return []
+    connection = connection_for(index)
+    if not available(connection, index):
+        return fallback(index, words, limit, offset, scope)
+    table = connection.ops.quote_name(index.table)
+    key = 'rowid' if connection.vendor == 'sqlite' else 'id'
+    if connection.vendor == 'sqlite':
+        # Quoted prefix queries: every term must match the start of some token.
+        where, params = [f'{table} MATCH %s'], [' '.join(f'"{word}"*' for word in words)]
+        order, order_params = 'rank, rowid', []
+    else:
+        where, params = ['document ILIKE %s'] * len(words), [f'%{like_escape(word)}%' for word in words]
+        order, order_params = 'similarity(document, %s) DESC, id', [' '.join(words)]
+    if scope is not None:
+        try:
+            scope_sql, scope_params = scope.order_by().values('pk').query.get_compiler(
+                connection=connection
+            ).as_sql()
+        except EmptyResultSet:
+            return []
+        where.append(f'{key} IN ({scope_sql})')
+        params += scope_params
+    sql = f'SELECT {key} FROM {table} WHERE {" AND ".join(where)} ORDER BY {order} LIMIT %s OFFSET %s'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, *order_params, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def fallback(index, words, limit, offset, scope=None):
+    condition = reduce(and_, [
+        reduce(or_, [Q(**{f'{lookup}__icontains': word}) for lookup in index.lookups])
+        for word in words
+    ])
+    queryset = index.model.objects.all() if scope is None else scope
+    return list(queryset.filter(condition).order_by('pk').values_list('pk', flat=True)[offset:offset + limit])
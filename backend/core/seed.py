@@ -0,0 +1,189 @@
+"""
+Synthetic data for benchmarks and load tests.
+
+Rows are written with ``bulk_create`` in batches and only primary keys are kept
+in memory, so volumes in the millions are feasible on a laptop.
+"""
+import contextlib
+import datetime
+import random
+import uuid
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache, medications, search, stats, versions
+from .models import User, Department, Doctor, Patient, Appointment, Prescription, WorkingHours
+
+SPECIALIZATIONS = ['Cardiology', 'Neurology', 'Pediatrics', 'Oncology', 'Orthopedics', 'Dermatology', 'Radiology']
+BLOOD_GROUPS = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+FIRST_NAMES = ['Amina', 'Rahim', 'Sara', 'John', 'Maria', 'Karim', 'Nadia', 'David', 'Fatima', 'Liam']
+LAST_NAMES = ['Rahman', 'Smith', 'Khan', 'Garcia', 'Ahmed', 'Chen', 'Hossain', 'Brown', 'Islam', 'Silva']
+MEDICATIONS = ['Amoxicillin', 'Metformin', 'Paracetamol', 'Omeprazole', 'Atorvastatin', 'Salbutamol', 'Losartan']
+SLOTS_PER_DAY = 16
+SLOT_MINUTES = 30
+DAY_START = datetime.time(9, 0)
+DAY_END = datetime.time(17, 0)
+# Unusable password hash: seeded accounts cannot log in, and no time is spent hashing.
+UNUSABLE_PASSWORD = '!seed'
+
+
+def batched(total, batch_size):
+    for start in range(0, total, batch_size):
+        yield start, min(batch_size, total - start)
+
+
+@contextlib.contextmanager
+def explicit_date_prescribed():
+    """Let bulk_create keep the date_prescribed we set instead of stamping now()."""
+    field = Prescription._meta.get_field('date_prescribed')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def slot_for(n, doctors, first_day):
+    """
+    Map the n-th appointment onto a (doctor index, date, time) triple.
+
+    Appointments are dealt round-robin across doctors and then fill each
+    doctor's day slot by slot, so no two seeded appointments share a
+    doctor/date/time.
+    """
+    doctor_index, slot = n % doctors, n // doctors
+    day, slot_of_day = divmod(slot, SLOTS_PER_DAY)
+    minutes = DAY_START.hour * 60 + DAY_START.minute + slot_of_day * SLOT_MINUTES
+    return doctor_index, first_day + datetime.timedelta(days=day), datetime.time(minutes // 60, minutes % 60)
+
+
+def create_users(role, count, batch_size, tag):
+    ids = []
+    for start, size in batched(count, batch_size):
+        users = User.objects.bulk_create([
+            User(
+                username=f'{role}-{tag}-{start + i}',
+                email=f'{role}-{tag}-{start + i}@example.com',
+                first_name=random.choice(FIRST_NAMES),
+                last_name=random.choice(LAST_NAMES),
+                role=role,
+                password=UNUSABLE_PASSWORD,
+            )
+            for i in range(size)
+        ], batch_size=batch_size)
+        ids.extend(user.pk for user in users)
+    return ids
+
+
+def seed(departments=10, doctors=100, patients=1000, appointments=10000, prescriptions=5000,
+         batch_size=5000, first_day=None, random_seed=0, log=None):
+    """
+    Insert the requested volume of rows and return a dict of created counts.
+
+    ``first_day`` is where each doctor's calendar starts; by default it is placed
+    so that roughly half of the appointments lie in the past. Every appointment
+    before today is completed (or occasionally cancelled) and prescriptions are
+    attached to completed appointments, newest data last.
+    """
+    random.seed(random_seed)
+    log = log or (lambda message: None)
+    tag = uuid.uuid4().hex[:8]
+    doctors = max(doctors, 1)
+    departments = max(departments, 1)
+    days = -(-appointments // (doctors * SLOTS_PER_DAY)) if appointments else 0
+    today = timezone.localdate()
+    first_day = first_day or today - datetime.timedelta(days=days // 2)
+
+    with transaction.atomic():
+        department_ids = [d.pk for d in Department.objects.bulk_create([
+            Department(name=f'{SPECIALIZATIONS[i % len(SPECIALIZATIONS)]} {i}', description='Seeded department')
+            for i in range(departments)
+        ])]
+    log(f'{departments} departments')
+
+    doctor_ids = []
+    for start, size in batched(doctors, batch_size):
+        with transaction.atomic():
+            user_ids = create_users('doctor', size, batch_size, f'{tag}-{start}')
+            doctor_ids.extend(d.pk for d in Doctor.objects.bulk_create([
+                Doctor(
+                    user_id=user_id,
+                    department_id=department_ids[(start + i) % departments],
+                    specialization=SPECIALIZATIONS[(start + i) % len(SPECIALIZATIONS)],
+                    license_number=f'LIC-{tag}-{start + i}',
+                )
+                for i, user_id in enumerate(user_ids)
+            ], batch_size=batch_size))
+            WorkingHours.objects.bulk_create([
+                WorkingHours(doctor_id=doctor_id, weekday=weekday, start_time=DAY_START, end_time=DAY_END, slot_minutes=SLOT_MINUTES)
+                for doctor_id in doctor_ids[start:] for weekday in range(5)
+            ], batch_size=batch_size)
+    log(f'{doctors} doctors')
+
+    patient_ids = []
+    for start, size in batched(patients, batch_size):
+        with transaction.atomic():
+            user_ids = create_users('patient', size, batch_size, f'{tag}-{start}')
+            patient_ids.extend(p.pk for p in Patient.objects.bulk_create([
+                Patient(
+                    user_id=user_id,
+                    date_of_birth=datetime.date(1940, 1, 1) + datetime.timedelta(days=random.randrange(30000)),
+                    blood_group=random.choice(BLOOD_GROUPS),
+                )
+                for user_id in user_ids
+            ], batch_size=batch_size))
+        if start and start % (batch_size * 20) == 0:
+            log(f'{start} patients...')
+    log(f'{patients} patients')
+
+    medications.import_names(MEDICATIONS)
+    drug_ids = medications.ids_by_key()
+    created_prescriptions = 0
+    with explicit_date_prescribed():
+        for start, size in batched(appointments if patient_ids else 0, batch_size):
+            batch = []
+            for n in range(start, start + size):
+                doctor_index, date, time = slot_for(n, doctors, first_day)
+                if date >= today:
+                    status = 'cancelled' if random.random() < 0.05 else 'scheduled'
+                else:
+                    status = 'cancelled' if random.random() < 0.1 else 'completed'
+                batch.append(Appointment(
+                    patient_id=random.choice(patient_ids), doctor_id=doctor_ids[doctor_index],
+                    date=date, time=time, status=status, reason='Seeded visit',
+                ))
+            with transaction.atomic():
+                Appointment.objects.bulk_create(batch, batch_size=batch_size)
+                rx = []
+                for appointment in batch:
+                    if created_prescriptions + len(rx) >= prescriptions or appointment.status != 'completed':
+                        continue
+                    medication = random.choice(MEDICATIONS)
+                    rx.append(Prescription(
+                        patient_id=appointment.patient_id, doctor_id=appointment.doctor_id, appointment_id=appointment.pk,
+                        medication=medication, drug_id=drug_ids[medications.key(medication)],
+                        dosage=f'{random.choice([5, 10, 20, 50, 100])}mg',
+                        date_prescribed=timezone.make_aware(datetime.datetime.combine(appointment.date, appointment.time)),
+                    ))
+                Prescription.objects.bulk_create(rx, batch_size=batch_size)
+                created_prescriptions += len(rx)
+            if start and start % (batch_size * 20) == 0:
+                log(f'{start} appointments...')
+    log(f'{appointments} appointments, {created_prescriptions} prescriptions')
+
+    # bulk_create() sends no signals, so do what the save receivers would have done.
+    versions.bump(*(model._meta.db_table for model in (User, Department, Doctor)))
+    cache.invalidate_all()
+    stats.rebuild(batch_size=batch_size)
+    log('dashboard stats rebuilt')
+    search.rebuild()
+    log('search index rebuilt')
+
+    return {
+        'departments': departments,
+        'doctors': doctors,
+        'patients': patients,
+        'appointments': appointments if patient_ids else 0,
+        'prescriptions': created_prescriptions,
+    }
@@ -1,10 +1,236 @@
+from functools import cached_property
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.validators import UniqueTogetherValidator
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
-from .models import Department, Doctor, Patient, Appointment, Prescription
+from .models import (
+    Department, Doctor, Patient, Appointment, Prescription, WorkingHours, Medication, visit_out_of_scope,
+)
+from .signals import bulk_saved
+from . import hashing
 
 User = get_user_model()
 
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    A PrimaryKeyRelatedField that, inside a BulkListSerializer, resolves ids from
+    objects fetched once for the whole batch instead of one query per item.
+    """
+    def to_internal_value(self, data):
+        related = getattr(self.parent, 'related_cache', None)
+        if not related or self.field_name not in related:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return related[self.field_name][int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    Validates and saves a list of objects with a fixed number of queries.
+
+    Every BulkPrimaryKeyRelatedField is resolved with one IN query per relation,
+    rows are written with bulk_create/bulk_update in one transaction, and errors
+    are reported per item index. Per-item unique validators are dropped because
+    they query once per item; subclasses check uniqueness for the whole batch in
+    validate() and the database constraint stays the final word.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', getattr(settings, 'HMS_BULK_MAX_ITEMS', 1000))
+        super().__init__(*args, **kwargs)
+        self.child.validators = [
+            validator for validator in self.child.validators
+            if not isinstance(validator, UniqueTogetherValidator)
+        ]
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child.related_cache = self.fetch_related(data)
+        try:
+            return super().to_internal_value(data)
+        finally:
+            self.child.related_cache = None
+
+    def fetch_related(self, data):
+        related = {}
+        for name, field in self.child.fields.items():
+            if not isinstance(field, BulkPrimaryKeyRelatedField) or field.read_only:
+                continue
+            ids = set()
+            for item in data:
+                try:
+                    ids.add(int(item[name]))
+                except (KeyError, TypeError, ValueError):
+                    pass
+            related[name] = field.get_queryset().in_bulk(ids)
+        return related
+
+    def run_child_validation(self, data):
+        if self.instance is not None:
+            self.child.instance = self.instance_map.get(self.item_id(data))
+        return super().run_child_validation(data)
+
+    @staticmethod
+    def item_id(data):
+        # The same rule as BulkModelMixin.patch(), which accepts "12" as well as 12.
+        try:
+            return int(data['id'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @cached_property
+    def instance_map(self):
+        return {obj.pk: obj for obj in self.instance}
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        with transaction.atomic():
+            instances = model.objects.bulk_create([model(**attrs) for attrs in validated_data])
+            bulk_saved.send(sender=model, instances=instances, created=True)
+        return instances
+
+    def update(self, instances, validated_data):
+        fields = set()
+        for instance, attrs in zip(instances, validated_data):
+            for attr, value in attrs.items():
+                setattr(instance, attr, value)
+                fields.add(attr)
+        if fields:
+            model = self.child.Meta.model
+            # bulk_update() skips auto_now; stamp updated_at as save() would.
+            now = timezone.now()
+            for field in model._meta.concrete_fields:
+                if getattr(field, 'auto_now', False):
+                    for instance in instances:
+                        setattr(instance, field.attname, now)
+                    fields.add(field.name)
+            with transaction.atomic():
+                model.objects.bulk_update(instances, fields)
+                bulk_saved.send(sender=model, instances=instances, created=False)
+        return instances
+
+class AppointmentListSerializer(BulkListSerializer):
+    def validate(self, attrs):
+        instances = self.instance or [None] * len(attrs)
+        slots = []
+        for instance, item in zip(instances, attrs):
+            merged = {
+                key: item.get(key, getattr(instance, key, None))
+                for key in ('date', 'time', 'status')
+            }
+            # doctor_id, not doctor: the instances' doctors are not loaded.
+            doctor_id = item['doctor'].pk if 'doctor' in item else instance.doctor_id
+            active = merged['status'] != 'cancelled'
+            slots.append((doctor_id, merged['date'], merged['time']) if active else None)
+
+        active = [slot for slot in slots if slot]
+        taken = set()
+        if active:
+            taken = set(
+                Appointment.objects.filter(
+                    doctor_id__in={slot[0] for slot in active}, date__in={slot[1] for slot in active},
+                )
+                .exclude(status='cancelled')
+                .exclude(pk__in=[instance.pk for instance in instances if instance])
+                .values_list('doctor_id', 'date', 'time')
+            )
+
+        errors = {}
+        for index, slot in enumerate(slots):
+            if slot is None:
+                continue
+            if slot in taken:
+                errors[index] = {'non_field_errors': ['This doctor is already booked at that date and time.']}
+            taken.add(slot)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+def split_paths(paths):
+    """{'patient': {'user'}, 'doctor': set()} from ['patient.user', 'doctor']."""
+    tree = {}
+    for path in paths:
+        head, _, rest = path.strip().partition('.')
+        if head:
+            tree.setdefault(head, set())
+            if rest:
+                tree[head].add(rest)
+    return tree
+
+def query_list(request, name):
+    params = getattr(request, 'query_params', None) or getattr(request, 'GET', {})
+    value = params.get(name)
+    return value.split(',') if value else None
+
+class ExpandableSerializer(serializers.ModelSerializer):
+    """
+    Relations named in ``expandable_fields`` are rendered as ids unless the
+    request asks for them with ``?expand=patient,doctor.user``; ``?fields=id,date``
+    limits the rendered fields. Both take dotted paths into expanded relations.
+    Writes are unaffected: the write-only ``*_id`` fields stay as they are.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, expand=None, fields=None, **kwargs):
+        # Nested serializers get their part of the paths from their parent; the
+        # top-level one reads them from the request when its fields are built.
+        self._requested = None if expand is None else (expand, fields)
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def from_request(cls, request):
+        """(expand tree, fields tree or None) from the query string."""
+        expand = query_list(request, 'expand') if request is not None else None
+        fields = query_list(request, 'fields') if request is not None else None
+        return split_paths(expand or []), split_paths(fields) if fields else None
+
+    @classmethod
+    def related_lookups(cls, expand, fields=None, prefix=''):
+        """select_related() lookups for the relations an expand tree renders."""
+        lookups = []
+        for name, rest in expand.items():
+            child = cls.expandable_fields.get(name)
+            if child is None or (fields is not None and name not in fields):
+                continue
+            lookups.append(prefix + name)
+            lookups += child.related_lookups(split_paths(rest), prefix=f'{prefix}{name}__')
+        return lookups
+
+    @property
+    def requested(self):
+        if self._requested is None:
+            self._requested = self.from_request(self.context.get('request'))
+        return self._requested
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expand, only = self.requested
+        for name, serializer_class in self.expandable_fields.items():
+            if name not in expand:
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+                continue
+            child_only = only.get(name) if only else None
+            fields[name] = serializer_class(
+                read_only=True, expand=split_paths(expand[name]),
+                fields=split_paths(child_only) if child_only else None,
+            )
+        return fields
+
+    @property
+    def _readable_fields(self):
+        _, only = self.requested
+        for field in super()._readable_fields:
+            if only is None or field.field_name in only:
+                yield field
+
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     
@@ -13,74 +239,121 @@ class RegisterSerializer(serializers.ModelSerializer):
         fields = ('username', 'password', 'email', 'role')
 
     def create(self, validated_data):
-        user = User.objects.create(
+        # Hash before the insert: one query instead of an INSERT and an UPDATE.
+        return User.objects.create(
             username=validated_data['username'],
             email=validated_data['email'],
             role=validated_data['role'],
+            password=hashing.hash_password(validated_data['password']),
         )
-        user.set_password(validated_data['password'])
-        user.save()
-        return user
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ExpandableSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'role')
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(ExpandableSerializer):
     class Meta:
         model = Department
         fields = '__all__'
 
-class DoctorSerializer(serializers.ModelSerializer):
-    department = DepartmentSerializer(read_only=True)
+class DoctorSerializer(ExpandableSerializer):
+    expandable_fields = {'user': UserSerializer, 'department': DepartmentSerializer}
     department_id = serializers.PrimaryKeyRelatedField(
         queryset=Department.objects.all(), source='department', write_only=True
     )
-    user = UserSerializer(read_only=True)
-    
+
     class Meta:
         model = Doctor
         fields = '__all__'
         extra_fields = ['department_id']
 
-class PatientSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
-    
+class WorkingHoursSerializer(ExpandableSerializer):
+    class Meta:
+        model = WorkingHours
+        fields = '__all__'
+
+    def validate(self, attrs):
+        start = attrs.get('start_time', getattr(self.instance, 'start_time', None))
+        end = attrs.get('end_time', getattr(self.instance, 'end_time', None))
+        if start and end and end <= start:
+            raise serializers.ValidationError('end_time must be after start_time.')
+        return attrs
+
+class PatientSerializer(ExpandableSerializer):
+    expandable_fields = {'user': UserSerializer}
+
     class Meta:
         model = Patient
         fields = '__all__'
 
-class AppointmentSerializer(serializers.ModelSerializer):
-    patient = PatientSerializer(read_only=True)
-    patient_id = serializers.PrimaryKeyRelatedField(
+class VisitScopeMixin:
+    """
+    Rejects a patient_id/doctor_id the requesting user could not read back,
+    so writes are held to the same scope as VisitQuerySet.for_user.
+    """
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        request = self.context.get('request')
+        if request is not None:
+            field = visit_out_of_scope(request.user, attrs.get('patient'), attrs.get('doctor'))
+            if field:
+                raise serializers.ValidationError({f'{field}_id': ['Outside the records you can write to.']})
+        return attrs
+
+class AppointmentSerializer(VisitScopeMixin, ExpandableSerializer):
+    expandable_fields = {'patient': PatientSerializer, 'doctor': DoctorSerializer}
+    archived = serializers.BooleanField(read_only=True)
+    patient_id = BulkPrimaryKeyRelatedField(
         queryset=Patient.objects.all(), source='patient', write_only=True
     )
-    doctor = DoctorSerializer(read_only=True)
-    doctor_id = serializers.PrimaryKeyRelatedField(
+    doctor_id = BulkPrimaryKeyRelatedField(
         queryset=Doctor.objects.all(), source='doctor', write_only=True
     )
     
     class Meta:
         model = Appointment
         fields = '__all__'
+        list_serializer_class = AppointmentListSerializer
         extra_fields = ['patient_id', 'doctor_id']
 
-class PrescriptionSerializer(serializers.ModelSerializer):
-    appointment = AppointmentSerializer(read_only=True)
-    appointment_id = serializers.PrimaryKeyRelatedField(
+class MedicationSerializer(ExpandableSerializer):
+    class Meta:
+        model = Medication
+        fields = '__all__'
+
+class PrescriptionSerializer(VisitScopeMixin, ExpandableSerializer):
+    expandable_fields = {
+        'appointment': AppointmentSerializer, 'patient': PatientSerializer, 'doctor': DoctorSerializer,
+        'drug': MedicationSerializer,
+    }
+    archived = serializers.BooleanField(read_only=True)
+    appointment_id = BulkPrimaryKeyRelatedField(
         queryset=Appointment.objects.all(), source='appointment', write_only=True, required=False, allow_null=True
     )
-    patient = PatientSerializer(read_only=True)
-    patient_id = serializers.PrimaryKeyRelatedField(
+    patient_id = BulkPrimaryKeyRelatedField(
         queryset=Patient.objects.all(), source='patient', write_only=True
     )
-    doctor = DoctorSerializer(read_only=True)
-    doctor_id = serializers.PrimaryKeyRelatedField(
+    doctor_id = BulkPrimaryKeyRelatedField(
         queryset=Doctor.objects.all(), source='doctor', write_only=True
     )
+    drug_id = BulkPrimaryKeyRelatedField(
+        queryset=Medication.objects.all(), source='drug', write_only=True, required=False, allow_null=True
+    )
     
     class Meta:
         model = Prescription
         fields = '__all__'
-        extra_fields = ['appointment_id', 'patient_id', 'doctor_id']
\ No newline at end of file
+        list_serializer_class = BulkListSerializer
+        extra_fields = ['appointment_id', 'patient_id', 'doctor_id', 'drug_id']
+        extra_kwargs = {'medication': {'required': False}}
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        # Picking a catalog entry (drug_id) is enough; its name becomes the medication text.
+        drug = attrs.get('drug')
+        if drug is not None and 'medication' not in attrs:
+            attrs['medication'] = drug.name
+        if self.instance is None and not attrs.get('medication'):
+            raise serializers.ValidationError({'medication': ['Give a medication name or a catalog drug_id.']})
+        return attrs
\ No newline at end of file
@@ -0,0 +1,313 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import Signal, receiver
+
+from . import authentication, cache, events, medications, search, stats, sync, versions
+from .models import (
+    User, Department, Doctor, Patient, Appointment, Prescription, ArchivedAppointment, ArchivedPrescription,
+    Medication,
+)
+
+# bulk_create()/bulk_update() skip post_save, so BulkListSerializer sends this
+# instead, with ``instances`` (the saved objects) and ``created``.
+bulk_saved = Signal()
+
+# Sent by core.archive after moving rows to the archive tables, with
+# ``appointments`` and ``prescriptions`` (the instances as they were loaded).
+archived = Signal()
+
+# User fields that UserSerializer exposes, and so are embedded in cached payloads.
+USER_SERIALIZED_FIELDS = ('username', 'email', 'role')
+# User fields whose change makes the claims of issued tokens stale.
+USER_CLAIM_FIELDS = USER_SERIALIZED_FIELDS + ('is_staff', 'is_active', 'department_id')
+
+# Values remembered when a row is loaded, so receivers can react to what a save changed.
+TRACKED_FIELDS = {
+    Appointment: ('patient_id', 'doctor_id', 'date', 'status'),
+    Prescription: ('patient_id', 'doctor_id', 'date_prescribed'),
+    User: USER_CLAIM_FIELDS,
+}
+
+
+def remember_loaded_values(sender, instance, **kwargs):
+    # Read __dict__ directly: getattr() on a deferred field would run a query.
+    instance._loaded_values = {name: instance.__dict__.get(name) for name in TRACKED_FIELDS[sender]}
+
+
+def loaded_values(instance):
+    return getattr(instance, '_loaded_values', {})
+
+
+def unchanged(instance, fields):
+    return all(loaded_values(instance).get(name) == getattr(instance, name) for name in fields)
+
+
+for model in TRACKED_FIELDS:
+    post_init.connect(remember_loaded_values, sender=model, dispatch_uid=f'remember-{model.__name__}')
+
+
+def invalidate_on_commit(user_ids):
+    user_ids = set(user_ids)
+    transaction.on_commit(lambda: cache.invalidate_users(user_ids))
+
+
+def profile_user_ids(patient_ids=(), doctor_ids=()):
+    user_ids = set()
+    if patient_ids:
+        user_ids.update(Patient.objects.filter(pk__in=patient_ids).values_list('user_id', flat=True))
+    if doctor_ids:
+        user_ids.update(Doctor.objects.filter(pk__in=doctor_ids).values_list('user_id', flat=True))
+    return user_ids
+
+
+def patient_audience(patient):
+    """The patient's own user plus every doctor whose payloads embed this patient."""
+    doctor_ids = set(Appointment.objects.filter(patient=patient).values_list('doctor_id', flat=True))
+    doctor_ids.update(Prescription.objects.filter(patient=patient).values_list('doctor_id', flat=True))
+    return {patient.user_id} | profile_user_ids(doctor_ids=doctor_ids)
+
+
+def doctor_audience(doctor):
+    patient_ids = set(Appointment.objects.filter(doctor=doctor).values_list('patient_id', flat=True))
+    patient_ids.update(Prescription.objects.filter(doctor=doctor).values_list('patient_id', flat=True))
+    return {doctor.user_id} | profile_user_ids(patient_ids=patient_ids)
+
+
+def visit_audiences(instances):
+    """For each appointment/prescription, the users whose payloads list it, before and after the change."""
+    pairs = [
+        ({instance.patient_id, loaded_values(instance).get('patient_id')} - {None},
+         {instance.doctor_id, loaded_values(instance).get('doctor_id')} - {None})
+        for instance in instances
+    ]
+    patient_ids = set().union(*(patients for patients, _ in pairs))
+    doctor_ids = set().union(*(doctors for _, doctors in pairs))
+    patients = dict(Patient.objects.filter(pk__in=patient_ids).values_list('pk', 'user_id')) if patient_ids else {}
+    doctors = dict(Doctor.objects.filter(pk__in=doctor_ids).values_list('pk', 'user_id')) if doctor_ids else {}
+    return [
+        ({patients.get(pk) for pk in patient_pks} | {doctors.get(pk) for pk in doctor_pks}) - {None}
+        for patient_pks, doctor_pks in pairs
+    ]
+
+
+def visit_audience(instances):
+    return set().union(*visit_audiences(instances))
+
+
+@receiver([post_save, post_delete], sender=Appointment, dispatch_uid='cache-appointment')
+@receiver([post_save, post_delete], sender=Prescription, dispatch_uid='cache-prescription')
+def visit_changed(sender, instance, created=False, **kwargs):
+    visits_changed(sender, [instance], created, deleted=kwargs['signal'] is post_delete)
+
+
+@receiver(bulk_saved, sender=Appointment, dispatch_uid='cache-bulk-appointment')
+@receiver(bulk_saved, sender=Prescription, dispatch_uid='cache-bulk-prescription')
+def visits_bulk_saved(sender, instances, created, **kwargs):
+    visits_changed(sender, instances, created)
+
+
+def visits_changed(sender, instances, created=False, deleted=False):
+    """Invalidate the cached lists of everyone who sees these rows, and send them change events."""
+    audiences = visit_audiences(instances)
+    invalidate_on_commit(set().union(*audiences))
+    events.publish_on_commit(sender, [
+        (instance, events.action(sender, instance, created, deleted, loaded_values(instance)), audience)
+        for instance, audience in zip(instances, audiences)
+    ])
+
+
+@receiver(archived, sender=Appointment, dispatch_uid='cache-archived')
+def visits_archived(sender, appointments, prescriptions, **kwargs):
+    invalidate_on_commit(visit_audience(appointments + prescriptions))
+
+
+@receiver([post_save, post_delete], sender=Patient, dispatch_uid='cache-patient')
+def patient_changed(sender, instance, **kwargs):
+    invalidate_on_commit(patient_audience(instance))
+
+
+@receiver([post_save, post_delete], sender=Doctor, dispatch_uid='cache-doctor')
+def doctor_changed(sender, instance, **kwargs):
+    invalidate_on_commit(doctor_audience(instance))
+
+
+@receiver([post_save, post_delete], sender=Department, dispatch_uid='cache-department')
+def department_changed(sender, instance, **kwargs):
+    transaction.on_commit(cache.invalidate_all)
+
+
+@receiver([post_save, post_delete], sender=Medication, dispatch_uid='cache-medication')
+def medication_changed(sender, instance, **kwargs):
+    # Expanded prescriptions embed the name; this worker's autocomplete index rebuilds now, others on their next check.
+    transaction.on_commit(cache.invalidate_all)
+    transaction.on_commit(medications.catalog.invalidate)
+
+
+@receiver([post_save, post_delete], sender=User, dispatch_uid='cache-user')
+def user_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    tracked = USER_SERIALIZED_FIELDS
+    if created or (update_fields is not None and not set(update_fields) & set(tracked)):
+        return
+    if kwargs['signal'] is post_save and unchanged(instance, tracked):
+        return
+    user_ids = {instance.pk}
+    for patient in Patient.objects.filter(user_id=instance.pk):
+        user_ids |= patient_audience(patient)
+    for doctor in Doctor.objects.filter(user_id=instance.pk):
+        user_ids |= doctor_audience(doctor)
+    invalidate_on_commit(user_ids)
+
+
+@receiver([post_save, post_delete], sender=Department, dispatch_uid='version-department')
+@receiver([post_save, post_delete], sender=Doctor, dispatch_uid='version-doctor')
+@receiver([post_save, post_delete], sender=Medication, dispatch_uid='version-medication')
+def reference_table_changed(sender, instance, **kwargs):
+    versions.bump(sender._meta.db_table)
+
+
+@receiver([post_save, post_delete], sender=User, dispatch_uid='version-user')
+def user_table_changed(sender, instance, created=False, **kwargs):
+    # Only the fields UserSerializer exposes matter to cached representations.
+    if kwargs['signal'] is post_save and not created and unchanged(instance, USER_SERIALIZED_FIELDS):
+        return
+    versions.bump(sender._meta.db_table)
+
+
+@receiver([post_save, post_delete], sender=User, dispatch_uid='auth-user')
+def user_claims_changed(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    if kwargs['signal'] is post_save and unchanged(instance, USER_CLAIM_FIELDS):
+        transaction.on_commit(lambda: authentication.forget_user(instance.pk))
+    else:
+        authentication.revoke_claims(instance.pk, deleted=kwargs['signal'] is post_delete)
+
+
+@receiver([post_save, post_delete], sender=Patient, dispatch_uid='auth-patient')
+@receiver([post_save, post_delete], sender=Doctor, dispatch_uid='auth-doctor')
+def profile_claims_changed(sender, instance, created=False, **kwargs):
+    # Tokens carry patient_id/doctor_id; only adding or removing a profile changes them.
+    origin = kwargs.get('origin')
+    if getattr(origin, 'model', type(origin)) is User:
+        return  # Deleted with its user, which revokes the claims itself.
+    if created or kwargs['signal'] is post_delete:
+        authentication.revoke_claims(instance.user_id)
+
+
+STATS_KEYS = {
+    Appointment: (('doctor_id', 'date', 'status'), stats.record_appointments),
+    Prescription: (('doctor_id', 'date_prescribed'), stats.record_prescriptions),
+}
+
+
+def stats_changes(sender, instances, created=False, deleted=False):
+    """(before, after) summary keys for each instance, for core.stats."""
+    fields = STATS_KEYS[sender][0]
+    changes = []
+    for instance in instances:
+        loaded = loaded_values(instance)
+        current = tuple(getattr(instance, name) for name in fields)
+        before = tuple(loaded.get(name) for name in fields)
+        if None in before:
+            # Not loaded from the database (or loaded with these fields deferred).
+            before = None
+        if created:
+            changes.append((None, current))
+        elif deleted:
+            changes.append((before or current, None))
+        elif before is not None:
+            changes.append((before, current))
+    return changes
+
+
+@receiver(post_save, sender=Appointment, dispatch_uid='stats-save-appointment')
+@receiver(post_save, sender=Prescription, dispatch_uid='stats-save-prescription')
+def visit_saved_stats(sender, instance, created, **kwargs):
+    STATS_KEYS[sender][1](stats_changes(sender, [instance], created=created))
+
+
+@receiver(post_delete, sender=Appointment, dispatch_uid='stats-delete-appointment')
+@receiver(post_delete, sender=Prescription, dispatch_uid='stats-delete-prescription')
+def visit_deleted_stats(sender, instance, **kwargs):
+    STATS_KEYS[sender][1](stats_changes(sender, [instance], deleted=True))
+
+
+@receiver(bulk_saved, sender=Appointment, dispatch_uid='stats-bulk-appointment')
+@receiver(bulk_saved, sender=Prescription, dispatch_uid='stats-bulk-prescription')
+def visits_bulk_saved_stats(sender, instances, created, **kwargs):
+    STATS_KEYS[sender][1](stats_changes(sender, instances, created=created))
+
+
+@receiver([post_save, post_delete], sender=Patient, dispatch_uid='search-patient')
+def patient_search_changed(sender, instance, **kwargs):
+    search.update('patients', [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Doctor, dispatch_uid='search-doctor')
+def doctor_search_changed(sender, instance, **kwargs):
+    search.update('doctors', [instance.pk])
+
+
+@receiver(post_save, sender=Department, dispatch_uid='search-department')
+def department_search_changed(sender, instance, created, **kwargs):
+    if not created:
+        search.update('doctors', Doctor.objects.filter(department=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User, dispatch_uid='search-user')
+def user_search_changed(sender, instance, created, update_fields=None, **kwargs):
+    # A new user has no profile yet; login bookkeeping doesn't touch searched fields.
+    if created or (update_fields is not None and set(update_fields) <= {'last_login', 'password'}):
+        return
+    search.update('patients', Patient.objects.filter(user=instance).values_list('pk', flat=True))
+    search.update('doctors', Doctor.objects.filter(user=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Appointment, dispatch_uid='sync-delete-appointment')
+@receiver(post_delete, sender=Prescription, dispatch_uid='sync-delete-prescription')
+@receiver(post_delete, sender=ArchivedAppointment, dispatch_uid='sync-delete-archived-appointment')
+@receiver(post_delete, sender=ArchivedPrescription, dispatch_uid='sync-delete-archived-prescription')
+def visit_deleted_sync(sender, instance, **kwargs):
+    sync.bury(sender, [(instance.pk, instance.patient_id, instance.doctor_id)])
+
+
+@receiver(post_save, sender=Appointment, dispatch_uid='sync-save-appointment')
+@receiver(post_save, sender=Prescription, dispatch_uid='sync-save-prescription')
+def visit_saved_sync(sender, instance, created, **kwargs):
+    if not created:
+        visits_moved_sync(sender, [instance])
+
+
+@receiver(bulk_saved, sender=Appointment, dispatch_uid='sync-bulk-appointment')
+@receiver(bulk_saved, sender=Prescription, dispatch_uid='sync-bulk-prescription')
+def visits_bulk_saved_sync(sender, instances, created, **kwargs):
+    if not created:
+        visits_moved_sync(sender, instances)
+
+
+def visits_moved_sync(sender, instances):
+    """Tombstones for the patients and doctors that rows were moved away from."""
+    rows = []
+    for instance in instances:
+        loaded = loaded_values(instance)
+        patient_id, doctor_id = loaded.get('patient_id'), loaded.get('doctor_id')
+        patient_id = patient_id if patient_id not in (None, instance.patient_id) else None
+        doctor_id = doctor_id if doctor_id not in (None, instance.doctor_id) else None
+        if patient_id or doctor_id:
+            rows.append((instance.pk, patient_id, doctor_id))
+    sync.bury(sender, rows)
+
+
+# Connected last, so every receiver above still sees the values from before the save.
+@receiver(post_save, sender=Appointment, dispatch_uid='reset-loaded-appointment')
+@receiver(post_save, sender=Prescription, dispatch_uid='reset-loaded-prescription')
+@receiver(post_save, sender=User, dispatch_uid='reset-loaded-user')
+def reset_loaded_values(sender, instance, **kwargs):
+    remember_loaded_values(sender, instance)
+
+
+@receiver(bulk_saved, sender=Appointment, dispatch_uid='reset-loaded-bulk-appointment')
+@receiver(bulk_saved, sender=Prescription, dispatch_uid='reset-loaded-bulk-prescription')
+def reset_bulk_loaded_values(sender, instances, **kwargs):
+    for instance in instances:
+        remember_loaded_values(sender, instance)
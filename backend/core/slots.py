@@ -0,0 +1,45 @@
+import datetime
+
+from django.utils import timezone
+
+from .models import Appointment, WorkingHours
+
+
+def template_slots(hours, start, end):
+    """Yield (doctor_id, date, time) for every slot the working-hours templates open between start and end."""
+    by_weekday = {}
+    for block in hours:
+        by_weekday.setdefault(block.weekday, []).append(block)
+    day = start
+    while day <= end:
+        for block in by_weekday.get(day.weekday(), ()):
+            step = datetime.timedelta(minutes=block.slot_minutes)
+            slot = datetime.datetime.combine(day, block.start_time)
+            close = datetime.datetime.combine(day, block.end_time)
+            while slot + step <= close:
+                yield block.doctor_id, day, slot.time()
+                slot += step
+        day += datetime.timedelta(days=1)
+
+
+def free_slots(doctor_ids, start, end, now=None):
+    """
+    Free (doctor_id, date, time) slots for the given doctors between two dates, inclusive.
+
+    The open slots come from the doctors' WorkingHours templates; every active
+    booking in the range is fetched with a single range query on
+    appt_doctor_schedule_idx and subtracted as a set. Slots that already
+    started are dropped.
+    """
+    now = timezone.localtime(now)
+    hours = WorkingHours.objects.filter(doctor_id__in=doctor_ids).order_by()
+    booked = set(
+        Appointment.objects.filter(doctor_id__in=doctor_ids, date__range=(start, end))
+        .exclude(status='cancelled')
+        .values_list('doctor_id', 'date', 'time')
+    )
+    available = set(template_slots(hours, start, end)) - booked
+    return sorted(
+        slot for slot in available
+        if (slot[1], slot[2]) > (now.date(), now.time().replace(tzinfo=None))
+    )
@@ -0,0 +1,147 @@
+"""
+Summary tables behind the dashboards.
+
+DoctorDailyStats counts appointments per (doctor, date, status), and
+DepartmentMonthlyStats counts prescriptions per (department, month). Saves,
+deletes and bulk writes adjust the affected counters inside the writing
+transaction, through receivers in core.signals, so a dashboard reads a few
+summary rows however long the history is.
+
+Archived appointments and prescriptions (core.archive) stay counted.
+QuerySet.update() sends no signals. After writing that way, or after a
+doctor moves to another department (past prescriptions stay counted under
+the department that prescribed them), run ``manage.py rebuild_stats``.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import (
+    Appointment, Prescription, ArchivedAppointment, ArchivedPrescription, Doctor,
+    DoctorDailyStats, DepartmentMonthlyStats,
+)
+
+STATUSES = [status for status, _ in Appointment.STATUS_CHOICES]
+
+
+def month_of(value):
+    if isinstance(value, datetime.datetime):
+        value = timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value.replace(day=1)
+
+
+def tally(changes):
+    """Net change per key from (before, after) pairs; None stands for no row."""
+    deltas = Counter()
+    for before, after in changes:
+        if before == after:
+            continue
+        if before is not None:
+            deltas[before] -= 1
+        if after is not None:
+            deltas[after] += 1
+    return deltas
+
+
+def apply(model, fields, deltas):
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        lookup = dict(zip(fields, key))
+        if model.objects.filter(**lookup).update(count=F('count') + delta) or delta < 0:
+            # A decrement with no row to apply to: the row went with a cascade
+            # delete of its doctor/department, or the table needs a rebuild.
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(count=delta, **lookup)
+        except IntegrityError:
+            # Inserted concurrently since our update.
+            model.objects.filter(**lookup).update(count=F('count') + delta)
+
+
+def record_appointments(changes):
+    """changes: (before, after) pairs of (doctor_id, date, status) tuples or None."""
+    apply(DoctorDailyStats, ('doctor_id', 'date', 'status'), tally(changes))
+
+
+def record_prescriptions(changes):
+    """changes: (before, after) pairs of (doctor_id, date_prescribed) tuples or None."""
+    doctor_ids = {key[0] for pair in changes for key in pair if key is not None}
+    departments = dict(Doctor.objects.filter(pk__in=doctor_ids).values_list('pk', 'department_id'))
+
+    def key(value):
+        if value is None or value[0] not in departments:
+            return None
+        return departments[value[0]], month_of(value[1])
+
+    deltas = tally((key(before), key(after)) for before, after in changes)
+    apply(DepartmentMonthlyStats, ('department_id', 'month'), deltas)
+
+
+def rebuild(batch_size=5000):
+    """Recompute both tables from the live and archived appointments and prescriptions; returns the row counts."""
+    appointments, prescriptions = Counter(), Counter()
+    for model in (Appointment, ArchivedAppointment):
+        rows = model.objects.order_by().values_list('doctor_id', 'date', 'status').annotate(n=Count('id'))
+        for doctor_id, date, status, n in rows.iterator():
+            appointments[doctor_id, date, status] += n
+    for model in (Prescription, ArchivedPrescription):
+        rows = (
+            model.objects.order_by()
+            .annotate(month=TruncMonth('date_prescribed', output_field=DateField()))
+            .values_list('doctor__department_id', 'month').annotate(n=Count('id'))
+        )
+        for department_id, month, n in rows.iterator():
+            prescriptions[department_id, month] += n
+    with transaction.atomic():
+        DoctorDailyStats.objects.all().delete()
+        DepartmentMonthlyStats.objects.all().delete()
+        doctor_rows = DoctorDailyStats.objects.bulk_create([
+            DoctorDailyStats(doctor_id=doctor_id, date=date, status=status, count=n)
+            for (doctor_id, date, status), n in appointments.items()
+        ], batch_size=batch_size)
+        department_rows = DepartmentMonthlyStats.objects.bulk_create([
+            DepartmentMonthlyStats(department_id=department_id, month=month, count=n)
+            for (department_id, month), n in prescriptions.items()
+        ], batch_size=batch_size)
+    return {'doctor_daily_stats': len(doctor_rows), 'department_monthly_stats': len(department_rows)}
+
+
+def daily(rows):
+    """[{date, scheduled, completed, cancelled, total}] from (date, status, count) rows."""
+    days = defaultdict(lambda: dict.fromkeys(STATUSES, 0))
+    for date, status, count in rows:
+        days[date][status] += count
+    return [{'date': date, **counts, 'total': sum(counts.values())} for date, counts in sorted(days.items())]
+
+
+def totals(days):
+    return {name: sum(day[name] for day in days) for name in STATUSES + ['total']}
+
+
+def doctor_summary(doctor_filter, start, end):
+    rows = (
+        DoctorDailyStats.objects.filter(date__range=(start, end), **doctor_filter)
+        .order_by().values('date', 'status').annotate(n=Sum('count')).values_list('date', 'status', 'n')
+    )
+    days = daily(rows)
+    return {'start': start, 'end': end, 'totals': totals(days), 'days': days}
+
+
+def department_summary(start, end, department_id=None):
+    rows = DepartmentMonthlyStats.objects.filter(month__range=(month_of(start), month_of(end)))
+    if department_id is not None:
+        rows = rows.filter(department_id=department_id)
+    rows = (
+        rows.values('department_id', 'department__name', 'month').annotate(n=Sum('count'))
+        .order_by('month', 'department_id')
+    )
+    return [
+        {'department_id': row['department_id'], 'department': row['department__name'], 'month': row['month'], 'count': row['n']}
+        for row in rows
+    ]
@@ -0,0 +1,123 @@
+"""
+Delta sync for clients that keep a local copy of their lists (``/api/sync/``).
+
+Appointments and prescriptions carry ``updated_at``, set by every save and by
+BulkListSerializer's bulk updates. A row that is deleted, or moved to another
+patient or doctor, leaves a Tombstone for whoever lost it. A sync reads the
+user's rows and tombstones after the client's token through the
+(patient|doctor, updated_at, id) indexes, so it costs as much as the changes,
+however long the history is.
+
+Tokens are opaque to clients (microseconds since the epoch):
+
+* The token returned by a complete sync lags the request by HMS_SYNC_OVERLAP
+  seconds, so a row saved by a transaction that was still open during the read
+  is sent next time. Clients apply changes by id and may see a row twice.
+* Each source returns at most HMS_SYNC_PAGE_SIZE rows, plus any sharing the
+  last one's timestamp; ``more`` tells the client to call again with the token.
+* Tombstones are kept for HMS_SYNC_RETENTION seconds. A token older than that
+  cannot be honoured, and the client downloads its lists again.
+
+Archived rows keep their ``updated_at`` and are synced too; archiving itself
+is not a change. QuerySet.update() does not set ``updated_at``.
+"""
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import pruning
+from .models import Appointment, Prescription, ArchivedAppointment, ArchivedPrescription, Tombstone
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+KINDS = {
+    Appointment: 'appointments',
+    ArchivedAppointment: 'appointments',
+    Prescription: 'prescriptions',
+    ArchivedPrescription: 'prescriptions',
+}
+
+
+def encode(moment):
+    delta = moment - EPOCH
+    return str((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+
+def decode(token):
+    """The moment a token stands for; ValueError if it is not one."""
+    if not token.isdigit():
+        raise ValueError(token)
+    return EPOCH + datetime.timedelta(microseconds=int(token))
+
+
+def retention():
+    return pruning.retention(Tombstone)
+
+
+def expired(since):
+    """Whether tombstones from after ``since`` may already have been pruned."""
+    return since < timezone.now() - retention()
+
+
+def bury(sender, rows):
+    """Record tombstones for (object_id, patient_id, doctor_id) rows of this model."""
+    if not rows:
+        return
+    Tombstone.objects.bulk_create([
+        Tombstone(kind=KINDS[sender], object_id=object_id, patient_id=patient_id, doctor_id=doctor_id)
+        for object_id, patient_id, doctor_id in rows
+    ])
+    pruning.prune()
+
+
+def page(queryset, field, since, limit):
+    """(rows after since in (field, id) order, the last row's field value if more follow, else None)."""
+    queryset = queryset.order_by(field, 'id')
+    if since is not None:
+        queryset = queryset.filter(**{f'{field}__gt': since})
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows, last = rows[:limit], rows[limit - 1]
+    boundary = getattr(last, field)
+    # End the page on a whole timestamp: a bulk update stamps many rows alike.
+    rows += queryset.filter(**{field: boundary, 'id__gt': last.pk})
+    return rows, boundary
+
+
+def changes(sources, since=None):
+    """
+    Read one sync page.
+
+    ``sources`` maps each kind to (querysets of rows, queryset of its
+    tombstones), already limited to the user. Returns (token, more, {kind:
+    (changed rows, deleted ids)}).
+    """
+    start = timezone.now()
+    limit = getattr(settings, 'HMS_SYNC_PAGE_SIZE', 500)
+    boundaries, results = [], {}
+    for kind, (querysets, tombstones) in sources.items():
+        changed = []
+        for queryset in querysets:
+            rows, boundary = page(queryset, 'updated_at', since, limit)
+            changed += rows
+            boundaries.append(boundary)
+        removed, boundary = page(tombstones, 'deleted_at', since, limit)
+        boundaries.append(boundary)
+        ids = {row.pk for row in changed}
+        # A row removed and then given back is sent as changed only.
+        deleted = sorted({tombstone.object_id for tombstone in removed} - ids)
+        results[kind] = (changed, deleted)
+    boundaries = [boundary for boundary in boundaries if boundary is not None]
+    return next_token(since, start, boundaries), bool(boundaries), results
+
+
+def next_token(since, start, boundaries):
+    safe = start - datetime.timedelta(seconds=getattr(settings, 'HMS_SYNC_OVERLAP', 5))
+    if not boundaries:
+        return encode(safe)
+    boundary = min(boundaries)
+    # Keep the overlap on partial pages too, as long as the token still moves forward.
+    if boundary > safe and (since is None or safe > since):
+        return encode(safe)
+    return encode(boundary)
@@ -1,3 +1,1557 @@
-from django.test import TestCase
+import base64
+import datetime
+import importlib
+import io
+import json
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from . import archive, cache, events, hashing, medications, pruning, search, sync, versions
+from .authentication import HMSRefreshToken, HMSTokenUser
+from .pagination import EstimatedCountPaginator
+from .renderers import msgpack
+from .routers import ReplicaRouter
+from .models import (
+    User, Department, Doctor, Patient, Appointment, Prescription, WorkingHours,
+    DoctorDailyStats, DepartmentMonthlyStats, ArchivedAppointment, ArchivedPrescription, Medication,
+    ChangeEvent, Tombstone,
+)
+from .serializers import AppointmentSerializer
+from .slots import free_slots
+from .seed import seed
+from . import stats
+
+
+def make_user(username, role, **extra):
+    return User.objects.create(username=username, role=role, first_name=username.title(), **extra)
+
+
+def make_doctor(username='doc', department=None):
+    department = department or Department.objects.create(name='Cardiology')
+    return Doctor.objects.create(user=make_user(username, 'doctor'), department=department, specialization='Heart')
+
+
+def make_patient(username='pat'):
+    return Patient.objects.create(user=make_user(username, 'patient'), blood_group='O+')
+
+
+def make_visits(doctor, patient, count, start=0):
+    for i in range(start, start + count):
+        appointment = Appointment.objects.create(
+            patient=patient, doctor=doctor,
+            date=datetime.date(2025, 1, 1) + datetime.timedelta(days=i),
+            time=datetime.time(9, 0),
+        )
+        Prescription.objects.create(
+            patient=patient, doctor=doctor, appointment=appointment,
+            medication='Aspirin', dosage='100mg',
+        )
+
+
+class HMSTestCase(APITestCase):
+    def setUp(self):
+        # Payload caches are keyed by user id, and ids are reused between tests.
+        cache.get_cache().clear()
+
+
+class QueryCountTests(HMSTestCase):
+    """Every endpoint must issue a fixed number of queries, independent of row count."""
+
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.admin = make_user('admin', 'admin')
+
+    def add_rows(self, count):
+        # Spread rows over fresh doctors/patients so a missing select_related
+        # can't hide behind the ORM reusing a single related instance.
+        start = Appointment.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                doctor = make_doctor(f'doc{start + i}', self.doctor.department)
+                patient = make_patient(f'pat{start + i}')
+                make_visits(doctor, patient, 1, start + i)
+            make_visits(self.doctor, self.patient, count, start + count)
+
+    def count_queries(self, user, url):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, user, url, expected):
+        self.add_rows(2)
+        small = self.count_queries(user, url)
+        self.add_rows(5)
+        large = self.count_queries(user, url)
+        self.assertEqual(small, large, f'{url} issues a query per row')
+        self.assertEqual(large, expected, url)
+
+    def test_list_endpoints(self):
+        # Department and doctor responses also read their table versions for the ETag.
+        expected = {'department-list': 2, 'doctor-list': 2, 'patient-list': 1, 'appointment-list': 1, 'prescription-list': 1}
+        for name, queries in expected.items():
+            with self.subTest(name):
+                self.assertConstantQueries(self.admin, reverse(name), queries)
+
+    def test_expanded_list_endpoints(self):
+        expected = {
+            'doctor-list': ('user,department', 2),
+            'patient-list': ('user', 1),
+            'appointment-list': ('patient.user,doctor.user,doctor.department', 1),
+            'prescription-list': ('appointment.patient.user,appointment.doctor,patient.user,doctor.user,doctor.department', 1),
+        }
+        for name, (expand, queries) in expected.items():
+            with self.subTest(name):
+                self.assertConstantQueries(self.admin, f'{reverse(name)}?expand={expand}', queries)
+
+    def test_detail_endpoints(self):
+        make_visits(self.doctor, self.patient, 1)
+        appointment = Appointment.objects.get()
+        prescription = Prescription.objects.get()
+        urls = {
+            reverse('department-detail', args=[self.doctor.department_id]): 2,
+            reverse('doctor-detail', args=[self.doctor.pk]): 2,
+            reverse('patient-detail', args=[self.patient.pk]): 1,
+            reverse('appointment-detail', args=[appointment.pk]): 1,
+            reverse('prescription-detail', args=[prescription.pk]): 1,
+        }
+        for url, queries in urls.items():
+            with self.subTest(url):
+                self.assertEqual(self.count_queries(self.admin, url), queries)
+
+    def test_my_appointments(self):
+        self.assertConstantQueries(self.patient.user, reverse('my-appointments'), 1)
+        self.assertConstantQueries(self.doctor.user, reverse('my-appointments'), 1)
+
+    def test_my_prescriptions(self):
+        self.assertConstantQueries(self.patient.user, reverse('my-prescriptions'), 1)
+        self.assertConstantQueries(self.doctor.user, reverse('my-prescriptions'), 1)
+
+
+class KeysetPaginationTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        make_visits(self.doctor, self.patient, 7)
+        # A cancelled booking in an occupied slot exercises the id tie-breaker.
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, date=datetime.date(2025, 1, 3), time=datetime.time(9, 0), status='cancelled',
+        )
+        self.client.force_authenticate(make_user('admin', 'admin'))
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_forward_walk_matches_full_ordering(self):
+        expected = list(Appointment.objects.order_by('date', 'time', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk(reverse('appointment-list') + '?page_size=3'), expected)
+        expected = list(Prescription.objects.order_by('-date_prescribed', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk(reverse('prescription-list') + '?page_size=2'), expected)
+
+    def test_previous_link_returns_preceding_page(self):
+        first = self.client.get(reverse('appointment-list') + '?page_size=3').data
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual([r['id'] for r in back['results']], [r['id'] for r in first['results']])
+
+    def test_page_size_is_capped(self):
+        with self.settings(HMS_MAX_PAGE_SIZE=4):
+            response = self.client.get(reverse('appointment-list') + '?page_size=1000')
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('appointment-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor(self):
+        def cursor(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+        for name, position in [
+            ('appointment-list', ['abc', 'x', 'y']),
+            ('appointment-list', ['2025-01-01', '09:00:00', [1]]),
+            ('appointment-list', ['2025-01-01', None, 1]),
+            ('prescription-list', ['yesterday', 1]),
+        ]:
+            with self.subTest(position=position):
+                response = self.client.get(reverse(name), {'cursor': cursor({'p': position, 'r': 0})})
+                self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('appointment-list'), {'cursor': cursor({'p': ['2025-01-03', '09:00:00', 0], 'r': 0})})
+        self.assertEqual(response.data['results'][0]['date'], '2025-01-03')
+
+
+class SeedTests(HMSTestCase):
+    def test_seed_volumes(self):
+        created = seed(departments=2, doctors=3, patients=10, appointments=100, prescriptions=20, batch_size=7)
+        self.assertEqual(Appointment.objects.count(), 100)
+        self.assertEqual(Prescription.objects.count(), created['prescriptions'])
+        self.assertLessEqual(created['prescriptions'], 20)
+        slots = Appointment.objects.values_list('doctor_id', 'date', 'time')
+        self.assertEqual(len(set(slots)), 100)
+        self.assertFalse(Prescription.objects.exclude(appointment__status='completed').exists())
+        self.assertEqual(WorkingHours.objects.count(), 15)
+
+    def test_seed_command(self):
+        out = io.StringIO()
+        call_command('seed_hms', '--departments', '1', '--doctors', '2', '--patients', '3', '--appointments', '10', stdout=out)
+        self.assertIn('10 appointments', out.getvalue())
+        self.assertEqual(Patient.objects.count(), 3)
+
+
+class SlotTests(HMSTestCase):
+    # 2030-01-07 is a Monday.
+    monday = datetime.date(2030, 1, 7)
+
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        WorkingHours.objects.create(doctor=self.doctor, weekday=0, start_time=datetime.time(9), end_time=datetime.time(11), slot_minutes=30)
+        self.client.force_authenticate(self.patient.user)
+
+    def book(self, time, status_='scheduled'):
+        return Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=self.monday, time=time, status=status_)
+
+    def test_free_slots_subtract_active_bookings(self):
+        self.book(datetime.time(9, 30))
+        self.book(datetime.time(10, 0), 'cancelled')
+        slots = free_slots([self.doctor.pk], self.monday, self.monday + datetime.timedelta(days=6))
+        self.assertEqual([s[2] for s in slots], [datetime.time(9), datetime.time(10), datetime.time(10, 30)])
+
+    def test_free_slots_skip_past(self):
+        now = timezone.make_aware(datetime.datetime.combine(self.monday, datetime.time(10, 15)))
+        slots = free_slots([self.doctor.pk], self.monday, self.monday, now=now)
+        self.assertEqual([s[2] for s in slots], [datetime.time(10, 30)])
+
+    def test_slots_endpoint_by_department(self):
+        other = make_doctor('other', self.doctor.department)
+        WorkingHours.objects.create(doctor=other, weekday=0, start_time=datetime.time(14), end_time=datetime.time(15), slot_minutes=60)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('available-slots'), {'department': self.doctor.department_id, 'start': self.monday})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(response.data[-1]['doctor_id'], other.pk)
+
+    def test_slots_endpoint_validation(self):
+        self.assertEqual(self.client.get(reverse('available-slots'), {'start': self.monday}).status_code, 400)
+        response = self.client.get(reverse('available-slots'), {'doctor': self.doctor.pk, 'start': self.monday, 'end': self.monday + datetime.timedelta(days=40)})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('available-slots'), {'doctor': self.doctor.pk, 'start': '2024-02-30'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start', response.data)
+        response = self.client.get(reverse('available-slots'), {'doctor': '9' * 23, 'start': self.monday})
+        self.assertIn('doctor', response.data)
+
+    def test_database_rejects_double_booking(self):
+        self.book(datetime.time(9))
+        self.book(datetime.time(10), 'cancelled')
+        self.book(datetime.time(10))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.book(datetime.time(9))
+
+    def test_booking_taken_slot(self):
+        self.book(datetime.time(9))
+        payload = {'patient_id': self.patient.pk, 'doctor_id': self.doctor.pk, 'date': self.monday, 'time': '09:00'}
+        response = self.client.post(reverse('appointment-list'), payload)
+        self.assertEqual(response.status_code, 400)
+        # A request that passed validation before the other booking committed.
+        with mock.patch.object(AppointmentSerializer, 'get_validators', return_value=[]):
+            response = self.client.post(reverse('appointment-list'), payload)
+        self.assertEqual(response.status_code, 409)
+
+    def test_other_integrity_errors_are_not_conflicts(self):
+        payload = {'patient_id': self.patient.pk, 'doctor_id': self.doctor.pk, 'date': self.monday, 'time': '09:00'}
+        error = IntegrityError('FOREIGN KEY constraint failed')
+        with mock.patch.object(AppointmentSerializer, 'save', side_effect=error), self.assertRaises(IntegrityError):
+            self.client.post(reverse('appointment-list'), payload)
+
+    def test_working_hours_filter(self):
+        url = reverse('working-hours-list')
+        self.assertEqual(len(self.client.get(url, {'doctor': self.doctor.pk}).data['results']), 1)
+        self.assertEqual(self.client.get(url, {'doctor': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'doctor': '9' * 23}).status_code, 400)
+
+
+class BulkTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patients = [make_patient(f'pat{i}') for i in range(3)]
+        self.client.force_authenticate(make_user('admin', 'admin'))
+
+    def appointments(self, count, day=datetime.date(2030, 1, 7)):
+        return [
+            {'patient_id': self.patients[i % 3].pk, 'doctor_id': self.doctor.pk, 'date': day, 'time': f'{9 + i // 2:02d}:{30 * (i % 2):02d}'}
+            for i in range(count)
+        ]
+
+    def test_bulk_create_query_count_is_independent_of_size(self):
+        url = reverse('appointment-list') + '?expand=patient.user,doctor'
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.post(url, self.appointments(2), format='json').status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(url, self.appointments(12, datetime.date(2030, 1, 8)), format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Appointment.objects.count(), 14)
+        self.assertEqual(response.data[0]['patient']['user']['username'], 'pat0')
+
+    def test_bulk_create_reports_errors_per_item(self):
+        Appointment.objects.create(patient=self.patients[0], doctor=self.doctor, date=datetime.date(2030, 1, 7), time=datetime.time(10))
+        payload = self.appointments(4)
+        payload[1]['patient_id'] = 9999
+        response = self.client.post(reverse('appointment-list'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {1})
+        self.assertIn('patient_id', response.data[1])
+
+        payload[1]['patient_id'] = self.patients[1].pk
+        payload.append(dict(payload[0]))
+        response = self.client.post(reverse('appointment-list'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        # Item 2 is 10:00, which is taken; item 4 repeats item 0's slot.
+        self.assertEqual(set(response.data), {2, 4})
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_bulk_create_prescriptions(self):
+        payload = [
+            {'patient_id': p.pk, 'doctor_id': self.doctor.pk, 'medication': 'Aspirin', 'dosage': '100mg'}
+            for p in self.patients
+        ]
+        # Two IN lookups, SAVEPOINT, INSERT, two lookups of the users whose
+        # cached payloads are now stale, the department summary row (doctor
+        # lookup, UPDATE, then SAVEPOINT/INSERT/RELEASE as it is new), RELEASE,
+        # and the re-read for the response.
+        with self.assertNumQueries(13):
+            response = self.client.post(reverse('prescription-list'), payload, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Prescription.objects.count(), 3)
+
+    def test_bulk_update(self):
+        self.client.post(reverse('appointment-list'), self.appointments(3), format='json')
+        ids = list(Appointment.objects.order_by('id').values_list('id', flat=True))
+        payload = [{'id': ids[0], 'status': 'completed'}, {'id': ids[2], 'reason': 'Follow-up'}]
+        response = self.client.patch(reverse('appointment-list'), payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(Appointment.objects.get(pk=ids[0]).status, 'completed')
+        self.assertEqual(Appointment.objects.get(pk=ids[2]).reason, 'Follow-up')
+
+        # Moving one appointment into another's slot is rejected.
+        taken = Appointment.objects.get(pk=ids[1])
+        response = self.client.patch(reverse('appointment-list'), [{'id': ids[2], 'time': taken.time}], format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(reverse('appointment-list'), [{'id': 9999}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_update_with_string_ids(self):
+        make_visits(self.doctor, self.patients[0], 6)
+        prescriptions = list(Prescription.objects.order_by('id'))
+        response = self.client.patch(reverse('prescription-list'), [
+            {'id': str(prescriptions[0].pk), 'dosage': '2'}, {'id': prescriptions[1].pk, 'dosage': '3'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([row['dosage'] for row in response.data], ['2', '3'])
+
+        appointments = list(Appointment.objects.order_by('id').values_list('id', flat=True))
+        counts = []
+        for ids in (appointments[:2], appointments):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.patch(
+                    reverse('appointment-list'), [{'id': str(pk), 'reason': 'Check-up'} for pk in ids], format='json',
+                )
+            self.assertEqual(response.status_code, 200, response.data)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class MyPayloadCacheTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_visits(self.doctor, self.patient, 2)
+
+    def get(self, user, name='my-appointments', **params):
+        self.client.force_authenticate(user)
+        return self.client.get(reverse(name), params)
+
+    def test_second_request_is_served_from_cache(self):
+        self.get(self.patient.user)
+        with self.assertNumQueries(0):
+            response = self.get(self.patient.user)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_appointment_change_invalidates_patient_and_doctor(self):
+        self.get(self.patient.user)
+        self.get(self.doctor.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.filter(pk=Appointment.objects.first().pk).get().delete()
+        self.assertEqual(len(self.get(self.patient.user).data['results']), 1)
+        self.assertEqual(len(self.get(self.doctor.user).data['results']), 1)
+
+    def test_unrelated_users_keep_their_cache(self):
+        other = make_patient('other')
+        self.get(other.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_visits(self.doctor, self.patient, 1, start=5)
+        with self.assertNumQueries(0):
+            self.get(other.user)
+
+    def test_embedded_objects_invalidate(self):
+        self.get(self.patient.user, 'my-prescriptions', expand='doctor.user,doctor.department')
+        with self.captureOnCommitCallbacks(execute=True):
+            Department.objects.filter(pk=self.doctor.department_id).get().save()
+        with self.assertNumQueries(1):
+            self.get(self.patient.user, 'my-prescriptions', expand='doctor.user,doctor.department')
+
+        user = self.doctor.user
+        with self.captureOnCommitCallbacks(execute=True):
+            user.email = 'doc@example.com'
+            user.save()
+        response = self.get(self.patient.user, 'my-prescriptions', expand='doctor.user,doctor.department')
+        self.assertEqual(response.data['results'][0]['doctor']['user']['email'], 'doc@example.com')
+
+    def test_login_timestamp_does_not_invalidate(self):
+        self.get(self.patient.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.user.last_login = timezone.now()
+            self.patient.user.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            self.get(self.patient.user)
+
+    def test_bulk_writes_invalidate(self):
+        self.get(self.patient.user)
+        self.client.force_authenticate(make_user('admin', 'admin'))
+        payload = [{'patient_id': self.patient.pk, 'doctor_id': self.doctor.pk, 'date': '2030-01-07', 'time': '09:00'}]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('appointment-list'), payload, format='json')
+        self.assertEqual(len(self.get(self.patient.user).data['results']), 3)
+
+    def test_stats_endpoint_is_admin_only(self):
+        self.assertEqual(self.get(self.patient.user, 'cache-stats').status_code, 403)
+        response = self.get(make_user('admin', 'admin'), 'cache-stats')
+        self.assertEqual(set(response.data), {'hits', 'misses', 'invalidations', 'hit_ratio'})
+
+
+class ConditionalGetTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.client.force_authenticate(make_user('admin', 'admin'))
+
+    def test_not_modified_skips_rows_and_serializer(self):
+        url = reverse('doctor-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('Authorization', response['Vary'])
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_writes_change_the_etag(self):
+        url = reverse('doctor-list')
+        etag = self.client.get(url)['ETag']
+        self.doctor.department.name = 'Renamed'
+        self.doctor.department.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        self.doctor.user.last_login = timezone.now()
+        self.doctor.user.save(update_fields=['last_login'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.doctor.user.email = 'new@example.com'
+        self.doctor.user.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_depends_on_url(self):
+        first = self.client.get(reverse('department-list'))['ETag']
+        paged = self.client.get(reverse('department-list') + '?page_size=1')['ETag']
+        detail = self.client.get(reverse('department-detail', args=[self.doctor.department_id]))['ETag']
+        self.assertEqual(len({first, paged, detail}), 3)
+
+
+class AsyncViewTests(HMSTestCase):
+    """The async endpoints answer like their synchronous counterparts."""
+
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        make_visits(self.doctor, self.patient, 3)
+        self.auth = {'Authorization': f'Bearer {HMSRefreshToken.for_user(self.patient.user).access_token}'}
+
+    async def test_lists_match_sync_views(self):
+        for sync_name, async_name in [
+            ('my-appointments', 'async-my-appointments'),
+            ('my-prescriptions', 'async-my-prescriptions'),
+            ('department-list', 'async-department-list'),
+            ('doctor-list', 'async-doctor-list'),
+        ]:
+            expected = (await self.async_client.get(reverse(sync_name), headers=self.auth)).json()
+            response = await self.async_client.get(reverse(async_name) + '?page_size=2', headers=self.auth)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['results'], expected['results'][:2])
+
+    async def test_pages_and_cache(self):
+        url = reverse('async-my-appointments') + '?page_size=2'
+        first = (await self.async_client.get(url, headers=self.auth)).json()
+        second = (await self.async_client.get(first['next'], headers=self.auth)).json()
+        self.assertEqual(len(first['results']) + len(second['results']), 3)
+        self.assertIsNone(second['next'])
+        await self.async_client.get(url, headers=self.auth)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    async def test_conditional_get(self):
+        url = reverse('async-doctor-list')
+        etag = (await self.async_client.get(url, headers=self.auth))['ETag']
+        response = await self.async_client.get(url, headers={'If-None-Match': etag, **self.auth})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_profile_and_auth(self):
+        response = await self.async_client.get(reverse('async-user-profile'), headers=self.auth)
+        self.assertEqual(response.json()['username'], 'pat')
+        self.assertEqual((await self.async_client.get(reverse('async-user-profile'))).status_code, 401)
+        bad = {'Authorization': 'Bearer not-a-token'}
+        self.assertEqual((await self.async_client.get(reverse('async-user-profile'), headers=bad)).status_code, 401)
+        self.assertEqual((await self.async_client.post(reverse('async-user-profile'), headers=self.auth)).status_code, 405)
+
+
+class StatelessAuthTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        make_visits(self.doctor, self.patient, 2)
+
+    def login(self, user):
+        user.set_password('s3cret-Passw0rd')
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        response = self.client.post(reverse('login'), {'username': user.username, 'password': 's3cret-Passw0rd'}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return response
+
+    def test_token_carries_role_and_profile_claims(self):
+        token = HMSRefreshToken.for_user(self.patient.user).access_token
+        self.assertEqual(token['role'], 'patient')
+        self.assertEqual(token['patient_id'], self.patient.pk)
+        self.assertIsNone(token['doctor_id'])
+
+    # One test process: its local-memory cache is shared by every "worker".
+    @override_settings(HMS_CACHE_SHARED=True)
+    def test_requests_skip_user_and_profile_lookups(self):
+        self.login(self.patient.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('patient-dashboard')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('user-profile')).data['username'], 'pat')
+        self.assertEqual(self.client.get(reverse('doctor-dashboard')).status_code, 403)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('my-appointments'))
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_full_user_is_cached(self):
+        self.login(self.doctor.user)
+        user = HMSTokenUser(HMSRefreshToken.for_user(self.doctor.user).access_token)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.user.first_name, 'Doc')
+            self.assertEqual(HMSTokenUser(user.token).user.first_name, 'Doc')
+
+    def test_role_change_revokes_claims(self):
+        self.login(self.patient.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.get(pk=self.patient.user_id)
+            user.role = 'lab'
+            user.save()
+        self.assertEqual(self.client.get(reverse('patient-dashboard')).status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+
+    def test_revocation_survives_a_lost_cache(self):
+        # Another worker changes the user: its cache update never reaches this one.
+        for shared in (False, True):
+            with self.subTest(shared=shared), override_settings(HMS_CACHE_SHARED=shared):
+                self.login(self.patient.user)
+                self.assertEqual(self.client.get(reverse('patient-dashboard')).status_code, 200)
+                with self.captureOnCommitCallbacks(execute=True):
+                    user = User.objects.get(pk=self.patient.user_id)
+                    user.role = 'lab'
+                    user.save()
+                cache.get_cache().clear()
+                self.assertEqual(self.client.get(reverse('patient-dashboard')).status_code, 403)
+                with self.captureOnCommitCallbacks(execute=True):
+                    user.role, user.is_active = 'patient', False
+                    user.save()
+                cache.get_cache().clear()
+                self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+                User.objects.filter(pk=user.pk).update(is_active=True)
+
+    def test_deleted_user_is_rejected(self):
+        user = make_patient('gone').user
+        self.login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.delete()
+        cache.get_cache().clear()
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+
+
+@override_settings(PASSWORD_HASHERS=[
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+])
+class PasswordHashingTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('pat', 'patient', password=make_password('s3cret-Passw0rd', hasher='md5'))
+
+    def login(self, password='s3cret-Passw0rd', name='login'):
+        return self.client.post(reverse(name), {'username': 'pat', 'password': password}, format='json')
+
+    def test_login_rehashes_with_preferred_hasher(self):
+        self.assertEqual(self.login('wrong').status_code, 400)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('md5$'))
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_async_login(self):
+        response = self.login(name='async-login')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['role'], 'patient')
+        self.assertEqual(self.login('wrong', name='async-login').status_code, 400)
+
+    def test_saturated_pool_refuses_logins(self):
+        with mock.patch.object(hashing, 'slots', return_value=mock.Mock(**{'acquire.return_value': False})):
+            self.assertEqual(self.login().status_code, 503)
+            self.assertEqual(self.login(name='async-login').status_code, 503)
+
+    def test_sync_login_hashes_on_its_own_thread(self):
+        with mock.patch.object(hashing, 'executor') as executor:
+            self.assertEqual(self.login().status_code, 200)
+        executor.assert_not_called()
+
+    def test_register_hashes_before_insert(self):
+        payload = {'username': 'new', 'password': 'An0ther-Passw0rd', 'email': 'new@example.com', 'role': 'patient'}
+        self.assertEqual(self.client.post(reverse('register'), payload, format='json').status_code, 201)
+        self.assertTrue(User.objects.get(username='new').check_password('An0ther-Passw0rd'))
+
+
+class DashboardStatsTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+
+    def snapshot(self):
+        return (
+            sorted(DoctorDailyStats.objects.filter(count__gt=0).values_list('doctor_id', 'date', 'status', 'count')),
+            sorted(DepartmentMonthlyStats.objects.filter(count__gt=0).values_list('department_id', 'month', 'count')),
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        stats.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_incremental_counts_match_rebuild(self):
+        make_visits(self.doctor, self.patient, 3)
+        other = make_doctor('other', Department.objects.create(name='Neurology'))
+        appointment = Appointment.objects.first()
+        appointment.status = 'completed'
+        appointment.save()
+        moved = Appointment.objects.last()
+        moved.doctor = other
+        moved.date = datetime.date(2025, 3, 1)
+        moved.save()
+        prescription = Prescription.objects.first()
+        prescription.doctor = other
+        prescription.save()
+        Appointment.objects.filter(pk=Appointment.objects.order_by('id')[1].pk).get().delete()
+        self.assertMatchesRebuild()
+
+        self.client.force_authenticate(make_user('admin', 'admin'))
+        payload = [
+            {'patient_id': self.patient.pk, 'doctor_id': other.pk, 'date': '2025-03-01', 'time': f'1{i}:00'}
+            for i in range(3)
+        ]
+        self.client.post(reverse('appointment-list'), payload, format='json')
+        ids = list(Appointment.objects.filter(doctor=other).values_list('id', flat=True))
+        self.client.patch(reverse('appointment-list'), [{'id': pk, 'status': 'cancelled'} for pk in ids], format='json')
+        self.assertEqual(DoctorDailyStats.objects.get(doctor=other, date='2025-03-01', status='cancelled').count, 4)
+        self.assertMatchesRebuild()
+
+        other.delete()
+        self.assertMatchesRebuild()
+
+    def test_doctor_dashboard_reads_summary_only(self):
+        make_visits(self.doctor, self.patient, 3)
+        self.client.force_authenticate(self.doctor.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('doctor-dashboard'), {'start': '2025-01-01', 'end': '2025-01-31'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['scheduled'], 3)
+        self.assertEqual([day['total'] for day in response.data['days']], [1, 1, 1])
+        response = self.client.get(reverse('doctor-dashboard'), {'start': '2025-02-01', 'end': '2025-01-01'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('doctor-dashboard'), {'start': '2025-02-30'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start', response.data)
+
+    def test_admin_stats(self):
+        make_visits(self.doctor, self.patient, 2)
+        for i, appointment in enumerate(Appointment.objects.all()):
+            appointment.date = timezone.localdate() + datetime.timedelta(days=i)
+            appointment.save()
+        self.client.force_authenticate(self.patient.user)
+        self.assertEqual(self.client.get(reverse('stats')).status_code, 403)
+        self.client.force_authenticate(make_user('admin', 'admin'))
+        month = timezone.localdate().replace(day=1)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('stats'))
+        self.assertEqual(response.data['appointments']['totals']['total'], 2)
+        self.assertEqual(response.data['prescriptions'], [
+            {'department_id': self.doctor.department_id, 'department': 'Cardiology', 'month': month, 'count': 2},
+        ])
+        self.assertEqual(self.client.get(reverse('stats'), {'end': '2025-13-01'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('stats'), {'department': '9' * 23}).status_code, 400)
+
+
+class SearchTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(make_user('admin', 'admin'))
+        self.amina = make_patient('amina')
+        self.amina.user.last_name = 'Rahman'
+        self.amina.user.email = 'amina@example.com'
+        self.amina.user.save()
+        self.other = make_patient('aminul')
+        self.doctor = make_doctor('house', Department.objects.create(name='Neurology'))
+
+    def find(self, name, q, **params):
+        response = self.client.get(reverse(name), {'q': q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def ids(self, name, q):
+        return [row['id'] for row in self.find(name, q)['results']]
+
+    def test_patient_fields_and_prefixes(self):
+        self.assertEqual(self.ids('patient-list', 'Rahman'), [self.amina.pk])
+        self.assertEqual(self.ids('patient-list', 'amina@example'), [self.amina.pk])
+        self.assertEqual(sorted(self.ids('patient-list', 'amin')), sorted([self.amina.pk, self.other.pk]))
+        self.assertEqual(self.ids('patient-list', 'amin rah'), [self.amina.pk])
+        self.assertEqual(len(self.ids('patient-list', 'O+')), 2)
+        self.assertEqual(self.ids('patient-list', 'nobody'), [])
+
+    def test_doctor_specialization_and_department(self):
+        self.assertEqual(self.ids('doctor-list', 'neuro'), [self.doctor.pk])
+        self.assertEqual(self.ids('doctor-list', 'heart'), [self.doctor.pk])
+
+    def test_index_follows_writes(self):
+        department = self.doctor.department
+        department.name = 'Oncology'
+        department.save()
+        self.assertEqual(self.ids('doctor-list', 'onco'), [self.doctor.pk])
+        self.assertEqual(self.ids('doctor-list', 'neuro'), [])
+        user = self.other.user
+        user.first_name = 'Zed'
+        user.save()
+        self.assertEqual(self.ids('patient-list', 'zed'), [self.other.pk])
+        self.amina.delete()
+        self.assertEqual(self.ids('patient-list', 'rahman'), [])
+
+    def test_pages(self):
+        for i in range(3):
+            make_patient(f'amir{i}')
+        first = self.find('patient-list', 'ami', page_size=2)
+        self.assertEqual(len(first['results']), 2)
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).data
+        third = self.client.get(second['next']).data
+        self.assertIsNone(third['next'])
+        seen = [row['id'] for page in (first, second, third) for row in page['results']]
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_scoped_pages_are_full(self):
+        patients = [make_patient(f'amir{i}') for i in range(6)]
+        for day, patient in enumerate(patients[1::2]):
+            make_visits(self.doctor, patient, 1, start=day)
+        self.client.force_authenticate(self.doctor.user)
+        # The scope is applied inside the index query: one query for the page's ids.
+        with CaptureQueriesContext(connection) as queries:
+            first = self.find('patient-list', 'ami', page_size=2)
+        self.assertEqual(len(first['results']), 2)
+        self.assertEqual(sum('core_patient_search' in query['sql'] for query in queries), 1)
+        second = self.client.get(first['next']).data
+        self.assertEqual(len(second['results']), 1)
+        self.assertIsNone(second['next'])
+        seen = {row['id'] for page in (first, second) for row in page['results']}
+        self.assertEqual(seen, {patient.pk for patient in patients[1::2]})
+
+    def test_bad_pages(self):
+        self.client.force_authenticate(self.doctor.user)
+        url = reverse('patient-list')
+        self.assertEqual(self.client.get(url, {'q': 'ami', 'page': '1e20'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'ami', 'page': str(10 ** 20)}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'q': 'ami', 'page': '50'}).data['results'], [])
+
+    def test_rebuild_and_fallback(self):
+        Patient.objects.bulk_create([Patient(user=make_user('bulky', 'patient'))])
+        self.assertEqual(self.ids('patient-list', 'bulky'), [])
+        call_command('rebuild_search', stdout=io.StringIO())
+        self.assertEqual(len(self.ids('patient-list', 'bulky')), 1)
+        with mock.patch.object(search, 'available', return_value=False):
+            self.assertEqual(self.ids('patient-list', 'amin rah'), [self.amina.pk])
+
+
+class ExportTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        make_visits(self.doctor, self.patient, 5)
+        self.client.force_authenticate(make_user('admin', 'admin'))
+
+    def export(self, name, **params):
+        kind, fmt = name.split('.')
+        response = self.client.get(reverse('export', kwargs={'kind': kind, 'fmt': fmt}), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_is_flat_and_filtered(self):
+        lines = self.export('appointments.csv', start='2025-01-02', end='2025-01-04').splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'date', 'time'])
+        self.assertEqual(len(lines), 4)
+        self.assertIn('Cardiology', lines[1])
+
+    def test_ndjson_single_query(self):
+        # One query per source: the live table and its archive.
+        with self.assertNumQueries(2):
+            body = self.export('prescriptions.ndjson', department=self.doctor.department_id)
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['medication'], 'Aspirin')
+        self.assertEqual(self.export('prescriptions.ndjson', doctor=9999), '')
+
+    def test_archived_rows_are_merged_in_order(self):
+        Appointment.objects.filter(date__in=[datetime.date(2025, 1, 1), datetime.date(2025, 1, 3)]).update(status='completed')
+        list(archive.archive(timezone.localdate()))
+        self.assertEqual(ArchivedAppointment.objects.count(), 2)
+        dates = [line.split(',')[1] for line in self.export('appointments.csv').splitlines()[1:]]
+        self.assertEqual(dates, [f'2025-01-0{day}' for day in range(1, 6)])
+        ids = [json.loads(line)['id'] for line in self.export('prescriptions.ndjson').splitlines()]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(self.export('appointments.csv', start='2025-01-03').splitlines()), 4)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('export', kwargs={'kind': 'users', 'fmt': 'csv'})).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export', kwargs={'kind': 'appointments', 'fmt': 'csv'}), {'start': 'x'}).status_code, 400)
+        response = self.client.get(reverse('export', kwargs={'kind': 'appointments', 'fmt': 'csv'}), {'start': '2024-13-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start', response.data)
+        self.assertEqual(self.client.get(reverse('export', kwargs={'kind': 'appointments', 'fmt': 'csv'}), {'doctor': '9' * 23}).status_code, 400)
+        self.client.force_authenticate(self.patient.user)
+        self.assertEqual(self.client.get(reverse('export', kwargs={'kind': 'appointments', 'fmt': 'csv'})).status_code, 403)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_hms', 'appointments', '--format', 'ndjson', '--doctor', str(self.doctor.pk), stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+
+
+@override_settings(HMS_PERF_ENABLED=True, HMS_PERF_SLOW_MS=10_000)
+class PerformanceMiddlewareTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.client.force_authenticate(make_user('admin', 'admin'))
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('hms.perf', 'INFO') as logs:
+            response = self.client.get(reverse('doctor-list'))
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'render;dur=', 'app;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+        self.assertIn('desc="2 queries"', timing)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'doctor-list')
+        self.assertEqual(record['queries'], 2)
+        self.assertNotIn('sql', record)
+
+    def test_slow_requests_dump_sql(self):
+        with self.settings(HMS_PERF_SLOW_MS=0), self.assertLogs('hms.perf', 'WARNING') as logs:
+            self.client.get(reverse('doctor-list'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(record['slow'])
+        self.assertIn('core_doctor', record['sql'][-1]['sql'])
+
+    @override_settings(HMS_PERF_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_untouched(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('doctor-list')))
+
+    @override_settings(HMS_PERF_ENABLED=False)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('doctor-list')))
+
+
+class ExpandTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        make_visits(self.doctor, self.patient, 1)
+        self.client.force_authenticate(make_user('admin', 'admin'))
+
+    def get(self, name='prescription-list', **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data['results'][0]
+
+    def test_relations_are_ids_by_default(self):
+        row = self.get()
+        self.assertEqual(row['patient'], self.patient.pk)
+        self.assertEqual(row['doctor'], self.doctor.pk)
+        self.assertEqual(row['appointment'], Appointment.objects.get().pk)
+
+    def test_expand_nested_paths(self):
+        row = self.get(expand='doctor.user,patient,unknown')
+        self.assertEqual(row['doctor']['user']['username'], 'doc')
+        self.assertEqual(row['doctor']['department'], self.doctor.department_id)
+        self.assertEqual(row['patient']['user'], self.patient.user_id)
+        self.assertEqual(row['appointment'], Appointment.objects.get().pk)
+
+    def test_fields_limit_the_response(self):
+        row = self.get(fields='id,medication,doctor.specialization', expand='doctor')
+        self.assertEqual(set(row), {'id', 'medication', 'doctor'})
+        self.assertEqual(row['doctor'], {'specialization': 'Heart'})
+
+    def test_unrequested_relations_are_not_joined(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.get(fields='id,dosage', expand='doctor.user')
+        self.assertNotIn('core_doctor', ctx.captured_queries[0]['sql'])
+
+    def test_writes_ignore_fields(self):
+        response = self.client.post(reverse('appointment-list') + '?fields=id&expand=patient', {
+            'patient_id': self.patient.pk, 'doctor_id': self.doctor.pk, 'date': '2030-01-07', 'time': '10:00',
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(set(response.data), {'id'})
+        self.assertEqual(Appointment.objects.latest('id').time, datetime.time(10))
+
+
+class DatabaseRoutingTests(HMSTestCase):
+    databases = {'default', 'replica'}
+
+    def pragma(self, alias, name):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied(self):
+        self.assertEqual(self.pragma('default', 'synchronous'), 1)
+        self.assertEqual(self.pragma('default', 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma('default', 'query_only'), 0)
+        self.assertEqual(self.pragma('replica', 'query_only'), 1)
+
+    def test_reads_go_to_the_replica_outside_transactions(self):
+        router = ReplicaRouter()
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            self.assertEqual(router.db_for_read(Department), 'replica')
+        # Test cases run inside a transaction, like a request that has written.
+        self.assertEqual(router.db_for_read(Department), 'default')
+        self.assertEqual(router.db_for_write(Department), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'core'))
+
+
+class RequestRoutingTests(APITransactionTestCase):
+    # Not HMSTestCase: its per-test transaction would keep every read on 'default'.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.get_cache().clear()
+        make_visits(make_doctor(), make_patient(), 2)
+        self.client.force_authenticate(make_user('admin', 'admin'))
+
+    def get(self, name):
+        with CaptureQueriesContext(connections['default']) as default, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+        return len(default), len(replica)
+
+    def test_request_reads_go_to_the_replica(self):
+        for name in ('appointment-list', 'patient-list'):
+            default, replica = self.get(name)
+            self.assertEqual(default, 0)
+            self.assertGreater(replica, 0)
+
+    def test_reads_inside_a_transaction_stay_on_default(self):
+        with transaction.atomic():
+            default, replica = self.get('appointment-list')
+        self.assertGreater(default, 0)
+        self.assertEqual(replica, 0)
+
+
+class HealthCheckTests(HMSTestCase):
+    databases = {'default', 'replica'}
+
+    def test_healthy(self):
+        response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['checks'], {'default': 'ok', 'replica': 'ok', 'cache': 'ok'})
+
+    def test_cache_failure_is_reported(self):
+        with mock.patch('django.core.cache.backends.locmem.LocMemCache.get', side_effect=ConnectionError):
+            response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['cache'], 'error: ConnectionError')
+
+
+class ArchiveTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_visits(self.doctor, self.patient, 4)
+        # Two old finished visits, one old but still scheduled, one recent.
+        statuses = ['completed', 'cancelled', 'scheduled', 'completed']
+        for appointment, status in zip(Appointment.objects.order_by('date'), statuses):
+            appointment.status = status
+            if appointment.date == datetime.date(2025, 1, 4):
+                appointment.date = timezone.localdate()
+            appointment.save()
+        self.archivable = list(Appointment.objects.order_by('date').values_list('pk', flat=True)[:2])
+
+    def archive(self, **options):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_appointments', older_than=30, stdout=io.StringIO(), **options)
+
+    def test_moves_old_finished_appointments_with_prescriptions(self):
+        self.archive(batch_size=1)
+        self.assertEqual(sorted(ArchivedAppointment.objects.values_list('pk', flat=True)), self.archivable)
+        self.assertEqual(Appointment.objects.count(), 2)
+        self.assertEqual(
+            sorted(ArchivedPrescription.objects.values_list('appointment_id', flat=True)), self.archivable,
+        )
+        self.assertEqual(Prescription.objects.count(), 2)
+
+    def test_stats_keep_archived_history(self):
+        def counts():
+            return sorted(DoctorDailyStats.objects.filter(count__gt=0).values_list('date', 'status', 'count'))
+
+        before = counts()
+        self.archive()
+        self.assertEqual(counts(), before)
+        stats.rebuild()
+        self.assertEqual(counts(), before)
+
+    def test_interrupted_run_resumes(self):
+        original = ArchivedPrescription.objects.bulk_create
+        calls = []
+
+        def fail_second_batch(objs, *args, **kwargs):
+            calls.append(objs)
+            if len(calls) == 2:
+                raise RuntimeError('interrupted')
+            return original(objs, *args, **kwargs)
+
+        with mock.patch.object(ArchivedPrescription.objects, 'bulk_create', side_effect=fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.archive(batch_size=1)
+        self.assertEqual(list(ArchivedAppointment.objects.values_list('pk', flat=True)), self.archivable[:1])
+        self.assertEqual(Appointment.objects.count(), 3)
+        self.archive(batch_size=1)
+        self.assertEqual(sorted(ArchivedAppointment.objects.values_list('pk', flat=True)), self.archivable)
+
+    def test_lists_include_archive_only_on_request(self):
+        self.archive()
+        self.client.force_authenticate(self.patient.user)
+        url = reverse('my-appointments')
+        self.assertEqual(len(self.client.get(url).data['results']), 2)
+        rows, next_url = [], f'{url}?include_archived=true&page_size=1'
+        while next_url:
+            response = self.client.get(next_url)
+            rows += response.data['results']
+            next_url = response.data['next']
+        self.assertEqual([row['archived'] for row in rows], [True, True, False, False])
+        self.assertEqual([row['date'] for row in rows], sorted(row['date'] for row in rows))
+
+        response = self.client.get(reverse('my-prescriptions'), {'include_archived': 'true', 'expand': 'appointment'})
+        self.assertEqual(len(response.data['results']), 4)
+        archived = [row for row in response.data['results'] if row['archived']]
+        self.assertEqual(sorted(row['appointment']['id'] for row in archived), self.archivable)
+
+    def test_archiving_invalidates_cached_lists(self):
+        self.client.force_authenticate(self.patient.user)
+        self.assertEqual(len(self.client.get(reverse('my-appointments')).data['results']), 4)
+        self.archive()
+        self.assertEqual(len(self.client.get(reverse('my-appointments')).data['results']), 2)
+
+
+@override_settings(HMS_EVENTS_MAX_STREAM=0.3, HMS_EVENTS_POLL_INTERVAL=0.05)
+class EventStreamTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.other = make_patient('other')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_visits(self.doctor, self.patient, 1)
+            make_visits(self.doctor, self.other, 1, start=1)
+        self.appointment = Appointment.objects.get(patient=self.patient)
+        self.auth = {'Authorization': f'Bearer {HMSRefreshToken.for_user(self.patient.user).access_token}'}
+        self.other_token = HMSRefreshToken.for_user(self.other.user).access_token
+
+    async def read(self, headers=None, on_start=None, url=None):
+        response = await self.async_client.get(url or reverse('async-events'), headers={**self.auth, **(headers or {})})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = []
+        async for chunk in response.streaming_content:
+            chunks.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+            if on_start and len(chunks) == 1:
+                await sync_to_async(on_start)()
+        return [self.parse(chunk) for chunk in chunks if chunk.startswith('id:')]
+
+    @staticmethod
+    def parse(chunk):
+        fields = dict(line.split(': ', 1) for line in chunk.strip().splitlines())
+        return int(fields['id']), fields['event'], json.loads(fields['data'])
+
+    def cancel(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.status = 'cancelled'
+            self.appointment.save()
+
+    async def test_replays_after_last_event_id(self):
+        events = await self.read({'Last-Event-ID': '0'})
+        self.assertEqual([(kind, data['action']) for _, kind, data in events],
+                         [('appointment', 'created'), ('prescription', 'created')])
+        self.assertEqual(events[0][2]['id'], self.appointment.pk)
+        self.assertEqual(events[0][2]['data']['patient'], self.patient.pk)
+        self.assertEqual(await self.read({'Last-Event-ID': str(events[-1][0])}), [])
+
+    async def test_live_changes_wake_the_stream(self):
+        # Without Last-Event-ID the stream starts from now.
+        events = await self.read(on_start=self.cancel)
+        self.assertEqual([(kind, data['action']) for _, kind, data in events], [('appointment', 'cancelled')])
+
+    @override_settings(HMS_EVENTS_BACKEND='core.events.LocalBackend')
+    async def test_local_backend(self):
+        events.backend.cache_clear()
+        self.addCleanup(events.backend.cache_clear)
+        received = await self.read({'Last-Event-ID': '0'}, on_start=self.cancel)
+        self.assertEqual([data['action'] for _, _, data in received], ['cancelled'])
+
+    async def test_ticket_and_auth(self):
+        self.auth = {}
+        response = await self.async_client.post(reverse('event-ticket'), headers={'Authorization': f'Bearer {self.other_token}'})
+        url = f"{reverse('async-events')}?ticket={response.json()['ticket']}"
+        received = await self.read({'Last-Event-ID': '0'}, url=url)
+        self.assertEqual({data['data']['patient'] for _, _, data in received}, {self.other.pk})
+        # Single use; and access tokens are not taken from the URL, where access logs would keep them.
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        self.assertEqual((await self.async_client.get(f"{reverse('async-events')}?access_token={self.other_token}")).status_code, 401)
+        self.assertEqual((await self.async_client.get(f"{reverse('async-events')}?ticket=forged")).status_code, 401)
+        self.assertEqual((await self.async_client.get(reverse('async-events'))).status_code, 401)
+        with override_settings(HMS_EVENTS_TICKET_TTL=-1):
+            url = f"{reverse('async-events')}?ticket={events.issue_ticket(self.other.user.pk)}"
+            self.assertEqual((await self.async_client.get(url)).status_code, 401)
+
+    def test_expired_events_and_tombstones_are_pruned(self):
+        ChangeEvent.objects.update(created=timezone.now() - datetime.timedelta(days=2))
+        for object_id in (1, 2):
+            Tombstone.objects.create(kind='appointments', object_id=object_id, patient_id=self.patient.pk)
+        Tombstone.objects.filter(object_id=1).update(deleted_at=timezone.now() - datetime.timedelta(days=31))
+        self.cancel()
+        expired = ChangeEvent.objects.exclude(action='cancelled').count()
+        self.assertEqual(pruning.prune(force=True), {'changeevent': expired, 'tombstone': 1})
+        self.assertEqual(set(ChangeEvent.objects.values_list('action', flat=True)), {'cancelled'})
+        self.assertEqual(list(Tombstone.objects.values_list('object_id', flat=True)), [2])
+        self.assertEqual(pruning.prune(), {})
+
+    def test_refused_under_wsgi(self):
+        response = self.client.get(reverse('async-events'), headers=self.auth)
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(response.streaming)
+
+
+@override_settings(HMS_SYNC_OVERLAP=0)
+class SyncTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.other = make_patient('other')
+        make_visits(self.doctor, self.patient, 3)
+        make_visits(self.doctor, self.other, 1, start=3)
+        self.client.force_authenticate(self.patient.user)
+
+    def sync(self, since=None, **params):
+        response = self.client.get(reverse('sync'), {**({'since': since} if since else {}), **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, data, kind='appointments'):
+        return sorted(row['id'] for row in data[kind]['changed'])
+
+    def test_changes_and_deletions_since_token(self):
+        first = self.sync()
+        self.assertEqual(self.ids(first), sorted(Appointment.objects.filter(patient=self.patient).values_list('pk', flat=True)))
+        self.assertEqual(len(first['prescriptions']['changed']), 3)
+        self.assertFalse(first['more'])
+        self.assertEqual(self.ids(self.sync(first['token'])), [])
+
+        appointment = Appointment.objects.filter(patient=self.patient).first()
+        appointment.reason = 'Follow-up'
+        appointment.save()
+        prescription = Prescription.objects.filter(patient=self.patient).last()
+        prescription_id = prescription.pk
+        prescription.delete()
+        second = self.sync(first['token'])
+        self.assertEqual(self.ids(second), [appointment.pk])
+        self.assertEqual(second['prescriptions'], {'changed': [], 'deleted': [prescription_id]})
+
+    def test_moved_rows_are_deleted_for_the_old_owner(self):
+        token = self.sync()['token']
+        appointment = Appointment.objects.filter(patient=self.patient).first()
+        appointment.patient = self.other
+        appointment.save()
+        self.assertEqual(self.sync(token)['appointments']['deleted'], [appointment.pk])
+        self.client.force_authenticate(self.other.user)
+        self.assertIn(appointment.pk, self.ids(self.sync(token)))
+
+    def test_bulk_update_sets_updated_at(self):
+        token = self.sync()['token']
+        ids = list(Appointment.objects.filter(patient=self.patient).values_list('pk', flat=True))
+        self.client.force_authenticate(self.doctor.user)
+        response = self.client.patch(reverse('appointment-list'), [{'id': pk, 'reason': 'Bulk'} for pk in ids], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.force_authenticate(self.patient.user)
+        self.assertEqual(self.ids(self.sync(token)), sorted(ids))
+
+    @override_settings(HMS_SYNC_PAGE_SIZE=1)
+    def test_pages_until_caught_up(self):
+        seen, token, more = set(), None, True
+        while more:
+            data = self.sync(token)
+            seen.update(self.ids(data))
+            token, more = data['token'], data['more']
+        self.assertEqual(seen, set(Appointment.objects.filter(patient=self.patient).values_list('pk', flat=True)))
+
+    def test_archived_rows_keep_syncing(self):
+        token = self.sync()['token']
+        appointment = Appointment.objects.filter(patient=self.patient).first()
+        appointment.status = 'completed'
+        appointment.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            list(archive.archive(datetime.date(2030, 1, 1)))
+        data = self.sync(token)
+        self.assertEqual([(row['id'], row['archived']) for row in data['appointments']['changed']], [(appointment.pk, True)])
+        self.assertEqual(data['appointments']['deleted'], [])
+
+    def test_invalid_and_expired_tokens(self):
+        self.assertEqual(self.client.get(reverse('sync'), {'since': 'yesterday'}).status_code, 400)
+        token = sync.encode(timezone.now() - datetime.timedelta(days=365))
+        self.assertEqual(self.client.get(reverse('sync'), {'since': token}).status_code, 410)
+
+
+class RendererTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        make_visits(self.doctor, self.patient, 2)
+        self.client.force_authenticate(make_user('admin', 'admin', is_staff=True))
+        self.url = f"{reverse('prescription-list')}?expand=patient.user,doctor.department,appointment"
+
+    def test_fast_json_matches_drf_json(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content), json.loads(JSONRenderer().render(response.data)))
+        indented = self.client.get(self.url, HTTP_ACCEPT='application/json; indent=2')
+        self.assertIn(b'\n  ', indented.content)
+
+    def test_integer_keys_and_parse_errors(self):
+        response = self.client.patch(reverse('appointment-list'), [{'id': 0}], format='json')
+        self.assertEqual(json.loads(response.content), {'0': {'id': ['Not found.']}})
+        response = self.client.post(reverse('appointment-list'), b'{"date": NaN', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.data['detail'])
+
+    def test_msgpack_negotiation(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), json.loads(self.client.get(self.url).content))
+
+    def test_msgpack_requests(self):
+        body = msgpack.packb({'patient_id': self.patient.pk, 'doctor_id': self.doctor.pk, 'medication': 'Ibuprofen', 'dosage': '200mg'})
+        response = self.client.post(reverse('prescription-list'), body, content_type='application/msgpack')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['medication'], 'Ibuprofen')
+        response = self.client.post(reverse('prescription-list'), b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('MessagePack parse error', response.data['detail'])
+
+
+class AdminTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.client.force_login(make_user('root', 'admin', is_staff=True, is_superuser=True))
+
+    def changelist_queries(self, model):
+        url = reverse(f'admin:core_{model}_changelist')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(ctx)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        make_visits(self.doctor, self.patient, 2)
+        before = {model: self.changelist_queries(model) for model in ('appointment', 'prescription')}
+        other = make_patient('other')
+        make_visits(make_doctor('doc2', self.doctor.department), other, 5, start=2)
+        self.assertEqual({model: self.changelist_queries(model) for model in before}, before)
+
+    def test_estimated_count_for_unfiltered_changelists(self):
+        make_visits(self.doctor, self.patient, 3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        queryset = Appointment.objects.order_by('pk')
+        with override_settings(HMS_ESTIMATED_COUNT_THRESHOLD=1):
+            Appointment.objects.filter(pk=Appointment.objects.first().pk).delete()
+            # The statistics still say 3; a filtered list is counted exactly.
+            self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 3)
+            self.assertEqual(EstimatedCountPaginator(queryset.filter(status='scheduled'), 10).count, 2)
+        self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 2)
+
+    def test_autocomplete_uses_search_index(self):
+        make_patient('zelda')
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'core', 'model_name': 'appointment', 'field_name': 'patient', 'term': 'zel',
+        })
+        self.assertEqual([row['text'] for row in response.json()['results']], ['Zelda '])
+
+
+class RoleScopeTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.surgeon = make_doctor('surgeon', Department.objects.create(name='Surgery'))
+        self.patient = make_patient()
+        self.other = make_patient('other')
+        make_visits(self.doctor, self.patient, 2)
+        make_visits(self.surgeon, self.other, 2, start=2)
+
+    def ids(self, name, user):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['id'] for row in response.data['results'])
+
+    def test_lists_are_scoped_by_role(self):
+        own = sorted(Appointment.objects.filter(patient=self.patient).values_list('pk', flat=True))
+        surgery = sorted(Appointment.objects.filter(doctor=self.surgeon).values_list('pk', flat=True))
+        self.assertEqual(self.ids('appointment-list', self.patient.user), own)
+        self.assertEqual(self.ids('appointment-list', self.doctor.user), own)
+        self.assertEqual(self.ids('patient-list', self.surgeon.user), [self.other.pk])
+        self.assertEqual(self.ids('patient-list', self.patient.user), [self.patient.pk])
+        lab = make_user('lab', 'lab', department=self.surgeon.department)
+        self.assertEqual(self.ids('appointment-list', lab), surgery)
+        self.assertEqual(len(self.ids('prescription-list', make_user('admin', 'admin'))), 4)
+        self.assertEqual(self.ids('prescription-list', make_user('nobody', 'lab')), self.ids('prescription-list', make_user('root', 'admin')))
+
+    @override_settings(HMS_CACHE_SHARED=True)
+    def test_scope_is_one_query(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {HMSRefreshToken.for_user(self.doctor.user).access_token}')
+        for name in ('appointment-list', 'patient-list'):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+
+    def test_other_rows_are_not_found(self):
+        appointment = Appointment.objects.filter(patient=self.other).first()
+        self.client.force_authenticate(self.patient.user)
+        self.assertEqual(self.client.get(reverse('appointment-detail', args=[appointment.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('patient-detail', args=[self.other.pk])).status_code, 404)
+        response = self.client.patch(reverse('appointment-list'), [{'id': appointment.pk, 'reason': 'x'}], format='json')
+        self.assertEqual(response.data, {0: {'id': ['Not found.']}})
+
+    def test_writes_are_scoped_by_role(self):
+        count = Appointment.objects.count()
+        slot = {'doctor_id': self.doctor.pk, 'date': '2030-01-07', 'time': '09:00'}
+        self.client.force_authenticate(self.patient.user)
+        response = self.client.post(reverse('appointment-list'), [
+            {**slot, 'patient_id': self.patient.pk}, {**slot, 'time': '10:00', 'patient_id': self.other.pk},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {1})
+        self.assertIn('patient_id', response.data[1])
+        response = self.client.post(reverse('appointment-list'), {**slot, 'patient_id': self.other.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Appointment.objects.count(), count)
+        self.assertEqual(self.client.post(reverse('appointment-list'), {**slot, 'patient_id': self.patient.pk}, format='json').status_code, 201)
+
+        count = Prescription.objects.count()
+        self.client.force_authenticate(self.doctor.user)
+        prescription = {'patient_id': self.other.pk, 'medication': 'Aspirin', 'dosage': '100mg'}
+        response = self.client.post(reverse('prescription-list'), [
+            {**prescription, 'doctor_id': self.doctor.pk}, {**prescription, 'doctor_id': self.surgeon.pk},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {1})
+        self.assertIn('doctor_id', response.data[1])
+        mine = Prescription.objects.filter(doctor=self.doctor).first()
+        response = self.client.patch(reverse('prescription-detail', args=[mine.pk]), {'doctor_id': self.surgeon.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Prescription.objects.count(), count)
+
+        # A department admin writes only for their department's doctors.
+        self.client.force_authenticate(make_user('head', 'admin', department=self.surgeon.department))
+        response = self.client.post(reverse('appointment-list'), {**slot, 'time': '11:00', 'patient_id': self.other.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('doctor_id', response.data)
+
+    def test_department_admins_see_their_department(self):
+        admin = make_user('head', 'admin', department=self.surgeon.department)
+        self.client.force_authenticate(admin)
+        response = self.client.get(reverse('stats'), {'start': '2025-01-01', 'end': '2025-01-31'})
+        self.assertEqual(response.data['appointments']['totals']['total'], 2)
+        # Prescriptions are dated today.
+        response = self.client.get(reverse('stats'))
+        self.assertEqual({row['department_id'] for row in response.data['prescriptions']}, {self.surgeon.department_id})
+        response = self.client.get(reverse('stats'), {'department': self.doctor.department_id})
+        self.assertEqual(response.status_code, 403)
+
+
+class MedicationCatalogTests(HMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        make_visits(self.doctor, self.patient, 2)
+        medications.catalog.invalidate()
+        self.addCleanup(medications.catalog.invalidate)
+        self.client.force_authenticate(self.doctor.user)
+
+    def import_names(self, text, *args):
+        path = self.enterContext(tempfile.NamedTemporaryFile('w', suffix='.csv'))
+        path.write(text)
+        path.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_medications', path.name, *args, stdout=io.StringIO())
+
+    def autocomplete(self, q):
+        response = self.client.get(reverse('medication-autocomplete'), {'q': q})
+        return [row['name'] for row in response.data]
+
+    def test_import_and_link(self):
+        self.import_names('name,form\n aspirin ,tablet\nAmoxicillin  Clavulanate,tablet\nASPIRIN,tablet\n', '--link')
+        self.assertEqual(sorted(Medication.objects.values_list('name', flat=True)), ['Amoxicillin Clavulanate', 'aspirin'])
+        aspirin = Medication.objects.get(name='aspirin')
+        self.assertEqual(set(Prescription.objects.values_list('drug_id', flat=True)), {aspirin.pk})
+        response = self.client.get(reverse('prescription-list'), {'drug': aspirin.pk, 'expand': 'drug'})
+        self.assertEqual([row['drug']['name'] for row in response.data['results']], ['aspirin', 'aspirin'])
+        self.assertEqual(self.client.get(reverse('prescription-list'), {'drug': '9' * 23}).status_code, 400)
+
+    def test_link_updates_in_batches(self):
+        names = [f'Drug {i}' for i in range(5)]
+        for i, name in enumerate(names):
+            make_visits(self.doctor, self.patient, 1, start=10 + i)
+            Prescription.objects.filter(pk=Prescription.objects.latest('id').pk).update(medication=name.upper())
+        medications.import_names(names)
+        # The catalog, the distinct names per model, and one UPDATE per batch of two (none archived).
+        with self.assertNumQueries(1 + 2 + 3):
+            self.assertEqual(medications.link(batch_size=2), 5)
+        self.assertEqual(
+            sorted(Prescription.objects.filter(drug__isnull=False).values_list('medication', 'drug__name')),
+            [(name.upper(), name) for name in names],
+        )
+
+    def test_names_too_long_for_the_catalog_are_skipped(self):
+        long_name = 'Paracetamol ' + 'x' * 200
+        Prescription.objects.filter(pk=Prescription.objects.first().pk).update(medication=long_name)
+        err = io.StringIO()
+        path = self.enterContext(tempfile.NamedTemporaryFile('w'))
+        path.write(f'{long_name}\nIbuprofen\n')
+        path.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_medications', path.name, '--link', stdout=io.StringIO(), stderr=err)
+        self.assertEqual(list(Medication.objects.values_list('name', flat=True)), ['Ibuprofen'])
+        self.assertIn('Skipped 1 names', err.getvalue())
+        self.assertIsNone(Prescription.objects.get(medication=long_name).drug_id)
+        # The migration that filled the catalog applies the same rule.
+        Medication.objects.all().delete()
+        migration = importlib.import_module('core.migrations.0011_medication_catalog')
+        migration.backfill_catalog(django_apps, None)
+        self.assertEqual(list(Medication.objects.values_list('name', flat=True)), ['Aspirin'])
+
+    def test_autocomplete_prefix_and_word_matches(self):
+        self.import_names('Amoxicillin Clavulanate\nAmlodipine\nClarithromycin\n')
+        self.assertEqual(self.autocomplete('am'), ['Amlodipine', 'Amoxicillin Clavulanate'])
+        self.assertEqual(self.autocomplete('CLA'), ['Clarithromycin', 'Amoxicillin Clavulanate'])
+        self.assertEqual(self.autocomplete(''), [])
+        with self.assertNumQueries(0):
+            self.autocomplete('amox')
+
+    def test_index_follows_catalog_changes(self):
+        self.assertEqual(self.autocomplete('ibu'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Medication.objects.create(name='Ibuprofen')
+        self.assertEqual(self.autocomplete('ibu'), ['Ibuprofen'])
+        # Another worker's write: seen once the index's TTL has passed.
+        Medication.objects.bulk_create([Medication(name='Ibandronate')])
+        versions.bump(Medication._meta.db_table)
+        self.assertEqual(self.autocomplete('iba'), [])
+        with override_settings(HMS_MEDICATION_INDEX_TTL=0):
+            self.assertEqual(self.autocomplete('iba'), ['Ibandronate'])
+
+    def test_prescribe_by_catalog_id(self):
+        drug = Medication.objects.create(name='Metformin')
+        response = self.client.post(reverse('prescription-list'), {
+            'patient_id': self.patient.pk, 'doctor_id': self.doctor.pk, 'drug_id': drug.pk, 'dosage': '500mg',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['medication'], response.data['drug']), ('Metformin', drug.pk))
+        response = self.client.post(reverse('prescription-list'), {
+            'patient_id': self.patient.pk, 'doctor_id': self.doctor.pk, 'dosage': '500mg',
+        }, format='json')
+        self.assertIn('medication', response.data)
@@ -1,4 +1,5 @@
 from django.urls import path
+from . import async_views
 from .views import (
     DepartmentListView, DepartmentDetailView,
     DoctorListView, DoctorDetailView,
@@ -7,7 +8,9 @@ from .views import (
     PrescriptionListView, PrescriptionDetailView,
     RegisterView, LoginView, UserProfileView,
     DoctorOnlyView, PatientOnlyView,
-    MyAppointmentsView, MyPrescriptionsView
+    MyAppointmentsView, MyPrescriptionsView, SyncView, EventTicketView,
+    WorkingHoursListView, WorkingHoursDetailView, AvailableSlotsView, MedicationAutocompleteView,
+    StatsView, CacheStatsView, ExportView
 )
 
 urlpatterns = [
@@ -21,6 +24,10 @@ urlpatterns = [
     path('appointments/<int:pk>/', AppointmentDetailView.as_view(), name='appointment-detail'),
     path('prescriptions/', PrescriptionListView.as_view(), name='prescription-list'),
     path('prescriptions/<int:pk>/', PrescriptionDetailView.as_view(), name='prescription-detail'),
+    path('working-hours/', WorkingHoursListView.as_view(), name='working-hours-list'),
+    path('working-hours/<int:pk>/', WorkingHoursDetailView.as_view(), name='working-hours-detail'),
+    path('slots/', AvailableSlotsView.as_view(), name='available-slots'),
+    path('medications/autocomplete/', MedicationAutocompleteView.as_view(), name='medication-autocomplete'),
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
     path('profile/', UserProfileView.as_view(), name='user-profile'),
@@ -28,4 +35,16 @@ urlpatterns = [
     path('patient-dashboard/', PatientOnlyView.as_view(), name='patient-dashboard'),
     path('my-appointments/', MyAppointmentsView.as_view(), name='my-appointments'),
     path('my-prescriptions/', MyPrescriptionsView.as_view(), name='my-prescriptions'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('events/ticket/', EventTicketView.as_view(), name='event-ticket'),
+    path('exports/<str:kind>.<str:fmt>', ExportView.as_view(), name='export'),
+    path('stats/', StatsView.as_view(), name='stats'),
+    path('cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('async/login/', async_views.login, name='async-login'),
+    path('async/departments/', async_views.department_list, name='async-department-list'),
+    path('async/doctors/', async_views.doctor_list, name='async-doctor-list'),
+    path('async/profile/', async_views.user_profile, name='async-user-profile'),
+    path('async/my-appointments/', async_views.my_appointments, name='async-my-appointments'),
+    path('async/my-prescriptions/', async_views.my_prescriptions, name='async-my-prescriptions'),
+    path('async/events/', async_views.event_stream, name='async-events'),
 ]
\ No newline at end of file
@@ -0,0 +1,39 @@
+import hashlib
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TableVersion
+
+
+def bump(*names):
+    now = timezone.now()
+    for name in names:
+        updated = TableVersion.objects.filter(name=name).update(version=F('version') + 1, modified=now)
+        if not updated:
+            TableVersion.objects.get_or_create(name=name, defaults={'version': 1})
+
+
+def stamp(names, *vary):
+    """
+    Return (etag, last_modified) for a response built from the given tables.
+
+    One indexed query, no matter how many rows the tables hold. ``vary``
+    holds anything else the response body depends on, such as the URL and
+    the media type.
+    """
+    rows = TableVersion.objects.filter(name__in=names).values_list('name', 'version', 'modified')
+    return build_stamp(list(rows), names, vary)
+
+
+async def astamp(names, *vary):
+    rows = TableVersion.objects.filter(name__in=names).values_list('name', 'version', 'modified')
+    return build_stamp([row async for row in rows], names, vary)
+
+
+def build_stamp(rows, names, vary):
+    rows = {name: (version, modified) for name, version, modified in rows}
+    last_modified = max((modified for _, modified in rows.values()), default=None)
+    token = '|'.join([f'{name}:{rows.get(name, (0,))[0]}' for name in sorted(names)] + [str(part) for part in vary])
+    etag = '"%s"' % hashlib.sha1(token.encode()).hexdigest()
+    return etag, last_modified
@@ -1,69 +1,362 @@
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_date
+from django.utils import timezone
+from django.utils.http import http_date
 from rest_framework import generics, permissions, status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
-from django.contrib.auth import authenticate
-from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Department, Doctor, Patient, Appointment, Prescription
+from .models import (
+    Department, Doctor, Patient, Appointment, Prescription, WorkingHours,
+    ArchivedAppointment, ArchivedPrescription, Tombstone,
+)
 from .serializers import (
     DepartmentSerializer, DoctorSerializer, PatientSerializer,
-    AppointmentSerializer, PrescriptionSerializer, RegisterSerializer, UserSerializer
+    AppointmentSerializer, PrescriptionSerializer, RegisterSerializer, UserSerializer,
+    WorkingHoursSerializer
 )
+from .slots import free_slots
 from django.contrib.auth import get_user_model
-from .permissions import IsDoctor, IsPatient, IsLab
+from .permissions import IsDoctor, IsPatient, IsLab, IsAdmin
+from . import archive, cache, events, exports, hashing, medications, search, stats, sync, versions
+from .authentication import HMSRefreshToken, profile_lookup
 
 User = get_user_model()
 
-class DepartmentListView(generics.ListCreateAPIView):
+# Primary keys are BigAutoField (signed 64-bit).
+MAX_ID = 2 ** 63 - 1
+
+def query_id(request, name):
+    """?<name>= as an integer id, or None when absent; a 400 naming the parameter otherwise."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    if not (value.isascii() and value.isdigit()) or int(value) > MAX_ID:
+        raise ValidationError({name: ['Must be an integer id.']})
+    return int(value)
+
+def query_date(request, name, default=None):
+    """?<name>= as a date, or default when absent; a 400 naming the parameter unless it is a real YYYY-MM-DD date."""
+    value = request.query_params.get(name)
+    if not value:
+        return default
+    try:
+        date = parse_date(value)
+    except ValueError:
+        # Well-formed but impossible, like 2024-02-30.
+        date = None
+    if date is None:
+        raise ValidationError({name: ['Must be a YYYY-MM-DD date.']})
+    return date
+
+class SlotConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This doctor is already booked at that date and time.'
+    default_code = 'slot_conflict'
+
+def is_slot_conflict(exc):
+    """Whether an IntegrityError is appt_unique_active_slot's, rather than another constraint's."""
+    constraint = next(c for c in Appointment._meta.constraints if c.name == 'appt_unique_active_slot')
+    # PostgreSQL (psycopg) names the constraint in the error's diagnostics.
+    name = getattr(getattr(exc.__cause__, 'diag', None), 'constraint_name', None)
+    if name is not None:
+        return name == constraint.name
+    # SQLite lists the columns instead; MySQL names the index in the message.
+    table = Appointment._meta.db_table
+    columns = ', '.join(f'{table}.{Appointment._meta.get_field(field).column}' for field in constraint.fields)
+    return constraint.name in str(exc) or f'UNIQUE constraint failed: {columns}' in str(exc)
+
+class SlotConflictMixin:
+    """
+    Turn a lost booking race into a 409.
+
+    The serializer's unique validator catches most double bookings up front; two
+    requests that pass it at the same time are settled by appt_unique_active_slot.
+    Other integrity errors are not conflicts and are raised as they are.
+    """
+    def perform_create(self, serializer):
+        self.save_booking(serializer)
+
+    def perform_update(self, serializer):
+        self.save_booking(serializer)
+
+    def save_booking(self, serializer):
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError as exc:
+            if not is_slot_conflict(exc):
+                raise
+            raise SlotConflict()
+
+class VersionedGetMixin:
+    """
+    Answer GET with ETag/Last-Modified taken from core.versions and return 304
+    Not Modified before any row is read or serialized when the client's copy is
+    still current.
+    """
+    version_models = ()
+
+    def get(self, request, *args, **kwargs):
+        tables = [model._meta.db_table for model in self.version_models]
+        etag, last_modified = versions.stamp(tables, request.get_full_path(), request.accepted_media_type)
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+
+def not_modified(request, etag, last_modified):
+    """A 304 response when the request's validators still match, else None."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+def set_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(int(last_modified.timestamp()))
+        patch_cache_control(response, **settings.HMS_REFERENCE_CACHE_CONTROL)
+        patch_vary_headers(response, ['Authorization'])
+    return response
+
+class SearchMixin:
+    """
+    ``?q=`` on a list endpoint: ranked matches from the core.search index named
+    by ``search_index``, paged with ``?page=`` (results are in rank order, so
+    the keyset cursor does not apply). The index query is limited to the
+    filtered queryset (the user's scope), so every page but the last is full.
+    """
+    search_index = None
+    # LIMIT and OFFSET are signed 64-bit on SQLite and PostgreSQL.
+    max_offset = 2 ** 63 - 1
+
+    def list(self, request, *args, **kwargs):
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            return super().list(request, *args, **kwargs)
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            return Response({'error': 'page must be a positive integer.'}, status=400)
+        page_size = self.paginator.get_page_size(request)
+        offset = (page - 1) * page_size
+        if offset + page_size + 1 > self.max_offset:
+            raise NotFound('Invalid page.')
+        queryset = self.filter_queryset(self.get_queryset())
+        ids = search.search(self.search_index, q, limit=page_size + 1, offset=offset, scope=queryset)
+        has_next, ids = len(ids) > page_size, ids[:page_size]
+        objects = queryset.in_bulk(ids)
+        serializer = self.get_serializer([objects[pk] for pk in ids if pk in objects], many=True)
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'page', page + 1) if has_next else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results': serializer.data,
+        })
+
+class DepartmentListView(VersionedGetMixin, generics.ListCreateAPIView):
+    version_models = (Department,)
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ('id',)
 
-class DepartmentDetailView(generics.RetrieveUpdateDestroyAPIView):
+class DepartmentDetailView(VersionedGetMixin, generics.RetrieveUpdateDestroyAPIView):
+    version_models = (Department,)
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class DoctorListView(generics.ListCreateAPIView):
+class DoctorListView(VersionedGetMixin, SearchMixin, generics.ListCreateAPIView):
+    version_models = (Doctor, Department, User)
+    search_index = 'doctors'
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ('id',)
 
-class DoctorDetailView(generics.RetrieveUpdateDestroyAPIView):
+class DoctorDetailView(VersionedGetMixin, generics.RetrieveUpdateDestroyAPIView):
+    version_models = (Doctor, Department, User)
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class PatientListView(generics.ListCreateAPIView):
+class PatientListView(SearchMixin, generics.ListCreateAPIView):
+    search_index = 'patients'
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ('id',)
 
 class PatientDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class AppointmentListView(generics.ListCreateAPIView):
+class BulkCreateUpdateMixin:
+    """
+    Let a list endpoint accept a JSON list: POST inserts every item, PATCH updates
+    existing rows matched by their "id". Either the whole batch is saved or the
+    response lists errors keyed by item index.
+    """
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return Response(self.refetch(serializer.instance), status=status.HTTP_201_CREATED)
+
+    def patch(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return Response({'error': 'Expected a list of objects with an "id".'}, status=400)
+        ids, errors = [], {}
+        for index, item in enumerate(request.data):
+            try:
+                ids.append(int(item['id']))
+            except (KeyError, TypeError, ValueError):
+                errors[index] = {'id': ['A valid id is required.']}
+        # Scoped like a detail view: rows the user cannot see are "Not found".
+        instances = self.filter_queryset(self.get_queryset()).in_bulk(ids)
+        for index, item in enumerate(request.data):
+            if index not in errors and int(item['id']) not in instances:
+                errors[index] = {'id': ['Not found.']}
+        if errors:
+            return Response(errors, status=400)
+        serializer = self.get_serializer(
+            [instances[pk] for pk in ids], data=request.data, many=True, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(self.refetch(serializer.instance))
+
+    def perform_update(self, serializer):
+        # ListCreateAPIView has none; defer to a mixin's (SlotConflictMixin) when there is one.
+        parent = getattr(super(), 'perform_update', None)
+        if parent is not None:
+            return parent(serializer)
+        serializer.save()
+
+    def refetch(self, objects):
+        # Re-read through filter_queryset() so the response joins what ?expand= asks for.
+        rows = self.filter_queryset(self.get_queryset()).in_bulk([obj.pk for obj in objects])
+        return self.get_serializer([rows[obj.pk] for obj in objects], many=True).data
+
+class ArchiveMixin:
+    """
+    ``?include_archived=true`` on a list endpoint: page over the view's rows and
+    the matching rows of ``archive_model`` together, in the same keyset order.
+    """
+    archive_model = None
+
+    def get_archive_queryset(self):
+        return self.archive_model.objects.all()
+
+    def paginate_queryset(self, queryset):
+        if not archive.include_archived(self.request):
+            return super().paginate_queryset(queryset)
+        archived = self.filter_queryset(self.get_archive_queryset())
+        return self.paginator.paginate_querysets([queryset, archived], self.request, view=self)
+
+class AppointmentListView(ArchiveMixin, BulkCreateUpdateMixin, SlotConflictMixin, generics.ListCreateAPIView):
     queryset = Appointment.objects.all()
+    archive_model = ArchivedAppointment
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ('date', 'time', 'id')
 
-class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
+class AppointmentDetailView(SlotConflictMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class PrescriptionListView(generics.ListCreateAPIView):
+class PrescriptionListView(ArchiveMixin, BulkCreateUpdateMixin, generics.ListCreateAPIView):
     queryset = Prescription.objects.all()
+    archive_model = ArchivedPrescription
     serializer_class = PrescriptionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ('-date_prescribed', '-id')
+
+    def get_queryset(self):
+        return self.by_drug(super().get_queryset())
+
+    def get_archive_queryset(self):
+        return self.by_drug(super().get_archive_queryset())
+
+    def by_drug(self, queryset):
+        # ?drug=<catalog id>: who was prescribed it, through the drug index.
+        drug = query_id(self.request, 'drug')
+        return queryset.filter(drug_id=drug) if drug is not None else queryset
 
 class PrescriptionDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Prescription.objects.all()
     serializer_class = PrescriptionSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+class WorkingHoursListView(generics.ListCreateAPIView):
+    serializer_class = WorkingHoursSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ('id',)
+
+    def get_queryset(self):
+        queryset = WorkingHours.objects.all()
+        doctor = query_id(self.request, 'doctor')
+        if doctor is not None:
+            queryset = queryset.filter(doctor_id=doctor)
+        return queryset
+
+class WorkingHoursDetailView(generics.RetrieveUpdateDestroyAPIView):
+    queryset = WorkingHours.objects.all()
+    serializer_class = WorkingHoursSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+class MedicationAutocompleteView(APIView):
+    """``?q=amox``: catalog entries whose name or a later word starts with q, from core.medications' in-memory index."""
+    permission_classes = [permissions.IsAuthenticated]
+    max_limit = 50
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), self.max_limit)
+        except ValueError:
+            return Response({'error': 'limit must be an integer.'}, status=400)
+        return Response(medications.catalog.search(request.query_params.get('q', ''), limit))
+
+class AvailableSlotsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    max_days = 31
+
+    def get(self, request):
+        doctor = query_id(request, 'doctor')
+        department = query_id(request, 'department')
+        start = query_date(request, 'start')
+        end = query_date(request, 'end', start)
+        if doctor is None and department is None:
+            return Response({'error': 'Pass a doctor or department id.'}, status=400)
+        if not start or end < start:
+            return Response({'error': 'Pass start (and optionally end) as YYYY-MM-DD, with end >= start.'}, status=400)
+        if (end - start).days >= self.max_days:
+            return Response({'error': f'The date range is limited to {self.max_days} days.'}, status=400)
+
+        doctors = Doctor.objects.all()
+        if doctor is not None:
+            doctors = doctors.filter(pk=doctor)
+        if department is not None:
+            doctors = doctors.filter(department_id=department)
+
+        slots = free_slots(doctors.values('pk'), start, end)
+        return Response([
+            {'doctor_id': doctor_id, 'date': date, 'time': time}
+            for doctor_id, date, time in slots
+        ])
+
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = RegisterSerializer
@@ -75,9 +368,9 @@ class LoginView(APIView):
     def post(self, request):
         username = request.data.get('username')
         password = request.data.get('password')
-        user = authenticate(username=username, password=password)
+        user = hashing.authenticate(request, username, password)
         if user:
-            refresh = RefreshToken.for_user(user)
+            refresh = HMSRefreshToken.for_user(user)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -92,11 +385,27 @@ class UserProfileView(APIView):
         serializer = UserSerializer(request.user)
         return Response(serializer.data)
 
+def stats_range(request, max_days=366):
+    """(start, end) from ?start=&end=, by default the 30 days either side of today; (None, error) when invalid."""
+    today = timezone.localdate()
+    start = query_date(request, 'start', today - datetime.timedelta(days=30))
+    end = query_date(request, 'end', today + datetime.timedelta(days=30))
+    if end < start:
+        return None, Response({'error': 'Pass start and end as YYYY-MM-DD, with end >= start.'}, status=400)
+    if (end - start).days >= max_days:
+        return None, Response({'error': f'The date range is limited to {max_days} days.'}, status=400)
+    return (start, end), None
+
 class DoctorOnlyView(APIView):
+    """The doctor's appointment counts per day and status, read from DoctorDailyStats."""
     permission_classes = [IsDoctor]
 
     def get(self, request, *args, **kwargs):
-        return Response({"message": "This is a view for doctors only."})
+        dates, error = stats_range(request)
+        if error:
+            return error
+        summary = stats.doctor_summary(profile_lookup(request.user, 'doctor'), *dates)
+        return Response({"message": "This is a view for doctors only.", **summary})
 
 class PatientOnlyView(APIView):
     permission_classes = [IsPatient]
@@ -104,30 +413,151 @@ class PatientOnlyView(APIView):
     def get(self, request, *args, **kwargs):
         return Response({"message": "This is a view for patients only."})
 
-class MyAppointmentsView(generics.ListAPIView):
+def own_rows(model, user):
+    """The user's own appointments or prescriptions (live or archived); empty for lab and admin users."""
+    if user.role in ('patient', 'doctor'):
+        return model.objects.for_user(user)
+    return model.objects.none()
+
+class CachedListMixin:
+    """Serve list responses from the per-user payload cache in core.cache."""
+    cache_kind = None
+
+    def list(self, request, *args, **kwargs):
+        key = cache.payload_key(self.cache_kind, request.user, request.build_absolute_uri())
+        payload = cache.get_payload(key)
+        if payload is not None:
+            return Response(payload)
+        response = super().list(request, *args, **kwargs)
+        cache.set_payload(key, response.data)
+        return response
+
+class MyAppointmentsView(ArchiveMixin, CachedListMixin, generics.ListAPIView):
     serializer_class = AppointmentSerializer
+    archive_model = ArchivedAppointment
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ('date', 'time', 'id')
+    cache_kind = 'appointments'
     
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'patient':
-            patient = Patient.objects.get(user=user)
-            return Appointment.objects.filter(patient=patient)
-        elif user.role == 'doctor':
-            doctor = Doctor.objects.get(user=user)
-            return Appointment.objects.filter(doctor=doctor)
-        return Appointment.objects.none()
-
-class MyPrescriptionsView(generics.ListAPIView):
+        return own_rows(Appointment, self.request.user)
+
+    def get_archive_queryset(self):
+        return own_rows(ArchivedAppointment, self.request.user)
+
+class MyPrescriptionsView(ArchiveMixin, CachedListMixin, generics.ListAPIView):
     serializer_class = PrescriptionSerializer
+    archive_model = ArchivedPrescription
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ('-date_prescribed', '-id')
+    cache_kind = 'prescriptions'
     
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'patient':
-            patient = Patient.objects.get(user=user)
-            return Prescription.objects.filter(patient=patient)
-        elif user.role == 'doctor':
-            doctor = Doctor.objects.get(user=user)
-            return Prescription.objects.filter(doctor=doctor)
-        return Prescription.objects.none()
\ No newline at end of file
+        return own_rows(Prescription, self.request.user)
+
+    def get_archive_queryset(self):
+        return own_rows(ArchivedPrescription, self.request.user)
+
+class SyncView(APIView):
+    """
+    ``/api/sync/?since=<token>``: the user's appointments and prescriptions
+    changed, and the ids removed, since an earlier sync (see core.sync).
+    Without ``since`` every row is sent. Takes ``?expand=`` and ``?fields=``.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    kinds = {
+        'appointments': (Appointment, ArchivedAppointment, AppointmentSerializer),
+        'prescriptions': (Prescription, ArchivedPrescription, PrescriptionSerializer),
+    }
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = sync.decode(since)
+            except (ValueError, OverflowError):
+                return Response({'error': 'since must be a token from an earlier sync.'}, status=400)
+            if sync.expired(since):
+                return Response({'error': 'This sync token has expired; download the lists again.'}, status=410)
+        else:
+            since = None
+
+        user, sources = request.user, {}
+        for kind, (model, archive_model, serializer_class) in self.kinds.items():
+            lookups = serializer_class.related_lookups(*serializer_class.from_request(request))
+            sources[kind] = (
+                [own_rows(model, user).select_related(*lookups), own_rows(archive_model, user).select_related(*lookups)],
+                own_rows(Tombstone, user).filter(kind=kind),
+            )
+        token, more, results = sync.changes(sources, since)
+        data = {'token': token, 'more': more}
+        for kind, (changed, deleted) in results.items():
+            serializer_class = self.kinds[kind][2]
+            data[kind] = {
+                'changed': serializer_class(changed, many=True, context={'request': request}).data,
+                'deleted': deleted,
+            }
+        return Response(data)
+
+class EventTicketView(APIView):
+    """POST: a single-use ticket for opening /api/async/events/ with ``?ticket=`` (see core.events)."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        return Response({'ticket': events.issue_ticket(int(request.user.pk)), 'expires_in': events.ticket_ttl()})
+
+def department_scope(request):
+    """(department id from ?department= or the user's own department, or None; error response or None)."""
+    department = query_id(request, 'department')
+    own = getattr(request.user, 'department_id', None)
+    if own is not None and department is not None and department != own:
+        return None, Response({'error': 'You can only see your own department.'}, status=403)
+    return (department if department is not None else own), None
+
+class StatsView(APIView):
+    """Appointments per day and prescriptions per department and month, from the summary tables."""
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        dates, error = stats_range(request)
+        if error:
+            return error
+        department, error = department_scope(request)
+        if error:
+            return error
+        doctor_filter = {'doctor__department_id': department} if department is not None else {}
+        return Response({
+            'appointments': stats.doctor_summary(doctor_filter, *dates),
+            'prescriptions': stats.department_summary(*dates, department_id=department),
+        })
+
+class CacheStatsView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return Response(cache.stats())
+
+class ExportView(APIView):
+    """Stream /api/exports/<appointments|prescriptions>.<csv|ndjson> for reporting."""
+    permission_classes = [IsAdmin]
+
+    def get(self, request, kind, fmt):
+        if kind not in exports.EXPORTS or fmt not in exports.FORMATS:
+            return Response({'error': 'Unknown export.'}, status=404)
+        filters = {}
+        for name in ('start', 'end'):
+            value = query_date(request, name)
+            if value is not None:
+                filters[name] = value
+        doctor = query_id(request, 'doctor')
+        if doctor is not None:
+            filters['doctor'] = doctor
+        filters['department'], error = department_scope(request)
+        if error:
+            return error
+
+        response = StreamingHttpResponse(
+            exports.render(kind, fmt, **filters), content_type=exports.FORMATS[fmt]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+        return response
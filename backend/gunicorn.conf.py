@@ -0,0 +1,40 @@
+"""
+gunicorn settings: ``gunicorn -c gunicorn.conf.py hms.wsgi``.
+
+Sized from the CPU count by default. Set HMS_ASGI=1 to run hms.asgi on
+uvicorn workers instead, for the async views under /api/async/. The
+Server-Sent Events stream (/api/async/events/) only works under ASGI; on the
+default gthread workers it answers 501. hms.settings_production reads the same
+variable and turns off persistent database connections under ASGI.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('HMS_BIND', '0.0.0.0:8000')
+
+# A request spends part of its time waiting on the database, so run more
+# processes than cores; threads add concurrency without another copy of the app.
+workers = int(os.environ.get('HMS_WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('HMS_WEB_THREADS', 2))
+
+if os.environ.get('HMS_ASGI', '').lower() in ('1', 'true', 'yes', 'on'):
+    wsgi_app = 'hms.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'hms.wsgi:application'
+    worker_class = 'gthread'
+
+# Import Django once in the master and fork workers from it (faster start,
+# shared memory pages). No database connection is open at import time.
+preload_app = True
+
+timeout = int(os.environ.get('HMS_WEB_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so slow leaks cannot accumulate.
+max_requests = int(os.environ.get('HMS_WEB_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 # from corsheaders.defaults import default_headers
 from datetime import timedelta
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,13 +81,68 @@ WSGI_APPLICATION = 'hms.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# SQLite tuned for several workers: WAL lets readers run alongside the one
+# writer, busy_timeout makes a blocked writer wait instead of failing with
+# "database is locked", and IMMEDIATE transactions take the write lock at BEGIN
+# so two transactions cannot deadlock upgrading from a read lock.
+SQLITE_PRAGMAS = [
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA cache_size = -65536',
+]
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': '; '.join(['PRAGMA journal_mode = WAL'] + SQLITE_PRAGMAS),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # The same file on a second, read-only connection. core.routers.ReplicaRouter
+    # sends reads here unless 'default' is inside a transaction.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': '; '.join(SQLITE_PRAGMAS + ['PRAGMA query_only = ON']),
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Local memory is per process; point 'default' at Redis or Memcached to share
+# the "my appointments/prescriptions" cache between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'hms',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
 
+HMS_CACHE_ALIAS = 'default'
+# Whether that cache is shared by every worker. Token revocation is only read
+# from a shared cache; None decides from the backend (local memory is not shared).
+HMS_CACHE_SHARED = None
+HMS_CACHE_TIMEOUT = 300
+
+# Cache-Control for department/doctor responses. They also carry an ETag, so
+# once max-age runs out clients revalidate and usually get a 304.
+HMS_REFERENCE_CACHE_CONTROL = {
+    'public': True,
+    'max_age': 60,
+    'stale_while_revalidate': 300,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -106,6 +163,24 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# The first hasher hashes new passwords. The rest can still verify older hashes,
+# which are replaced on the next successful login, as are hashes made with
+# outdated parameters (e.g. fewer PBKDF2 iterations). Argon2 and bcrypt need
+# the argon2-cffi / bcrypt packages.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Password hashing (core.hashing): threads in the pool the async views hash on
+# (default: one per CPU), and how many hashes, sync or async, may be running or
+# waiting before logins are refused with 503.
+HMS_HASHER_WORKERS = None
+HMS_HASHER_MAX_PENDING = 64
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -138,8 +213,67 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Trusts role/profile claims in tokens from LoginView instead of loading the user.
+        'core.authentication.StatelessJWTAuthentication',
     ),
+    # Scopes appointments, prescriptions and patients to request.user, and
+    # joins only the relations a request expands with ?expand=.
+    'DEFAULT_FILTER_BACKENDS': ('core.filters.RoleScopeFilterBackend', 'core.filters.ExpandFilterBackend'),
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    # orjson-backed JSON (falls back to the json module without orjson), and
+    # application/msgpack for clients that ask for it when msgpack is installed.
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        *(['core.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        *(['core.parsers.MessagePackParser'] if find_spec('msgpack') else []),
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    # Report bulk (list payload) validation errors as {item index: errors}.
+    'LIST_SERIALIZER_ERRORS_AS_DICT': True,
+}
+
+# Upper bound for the ?page_size= query parameter on list endpoints.
+HMS_MAX_PAGE_SIZE = 500
+
+# Admin changelists over tables at least this big (by the database's statistics)
+# show an estimated count instead of running COUNT(*); see EstimatedCountPaginator.
+HMS_ESTIMATED_COUNT_THRESHOLD = 100000
+# Most patient/doctor matches an admin search or autocomplete lookup returns.
+HMS_ADMIN_SEARCH_LIMIT = 1000
+
+# Seconds a worker trusts its in-memory medication autocomplete index before
+# checking the catalog's TableVersion for changes made by other workers.
+HMS_MEDICATION_INDEX_TTL = 5
+
+# Largest list accepted by the bulk POST/PATCH appointment and prescription endpoints.
+HMS_BULK_MAX_ITEMS = 1000
+
+# Rows fetched per round trip by the streaming CSV/NDJSON exports.
+HMS_EXPORT_CHUNK_SIZE = 2000
+
+# Per-request instrumentation (core.middleware.PerformanceMiddleware): Server-Timing
+# header plus one JSON line on the "hms.perf" logger per sampled request. Requests
+# slower than HMS_PERF_SLOW_MS are logged as warnings with their SQL.
+HMS_PERF_ENABLED = False
+HMS_PERF_SAMPLE_RATE = 1.0
+HMS_PERF_SLOW_MS = 500
+HMS_PERF_MAX_LOGGED_QUERIES = 50
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'hms.perf': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
 }
 
 SIMPLE_JWT = {
@@ -147,4 +281,26 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
-}
\ No newline at end of file
+    'TOKEN_USER_CLASS': 'core.authentication.HMSTokenUser',
+}
+
+# Change feed at /api/async/events/ (core.events). DatabaseBackend shares events
+# between workers through the ChangeEvent table; LocalBackend is single-process.
+HMS_EVENTS_BACKEND = 'core.events.DatabaseBackend'
+HMS_EVENTS_RETENTION = 86400
+HMS_EVENTS_POLL_INTERVAL = 2.0
+HMS_EVENTS_HEARTBEAT = 15.0
+# Streams end after this many seconds; the client reconnects with a new ticket
+# (POST /api/events/ticket/, valid this many seconds, once) and ?last_event_id=.
+HMS_EVENTS_MAX_STREAM = 600
+HMS_EVENTS_TICKET_TTL = 30
+
+# Delta sync (core.sync): rows per source per page, how far each token lags
+# the request (for transactions still open during the read), and how long
+# tombstones are kept; older tokens get 410 and the client downloads its lists again.
+HMS_SYNC_PAGE_SIZE = 500
+HMS_SYNC_OVERLAP = 5
+HMS_SYNC_RETENTION = 30 * 86400
+
+# Seconds a full User row is cached for token-authenticated requests that need it.
+HMS_TOKEN_USER_CACHE_TIMEOUT = 60
\ No newline at end of file
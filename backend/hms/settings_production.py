@@ -0,0 +1,67 @@
+"""
+Production settings: ``DJANGO_SETTINGS_MODULE=hms.settings_production``.
+
+Everything deployment-specific comes from the environment; the rest is
+inherited from hms.settings. Run behind gunicorn (see gunicorn.conf.py), not
+runserver.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import CORS_ALLOWED_ORIGINS, DATABASES, MIDDLEWARE
+
+
+def env_list(name, default=''):
+    return [item.strip() for item in os.environ.get(name, default).split(',') if item.strip()]
+
+
+def env_bool(name, default=False):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+# Off here also stops Django keeping every SQL statement in connection.queries.
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Set DJANGO_SECRET_KEY for production.')
+
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS', 'localhost')
+CSRF_TRUSTED_ORIGINS = env_list('DJANGO_CSRF_TRUSTED_ORIGINS')
+CORS_ALLOWED_ORIGINS = env_list('HMS_CORS_ALLOWED_ORIGINS', ','.join(CORS_ALLOWED_ORIGINS))
+
+# TLS is terminated by the proxy in front of gunicorn.
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+SESSION_COOKIE_SECURE = CSRF_COOKIE_SECURE = env_bool('HMS_SECURE_COOKIES', True)
+
+# Keep each worker's connection open between requests instead of reconnecting
+# (and re-running the SQLite PRAGMAs) every time; check it is still usable
+# before reusing it. Not under ASGI (HMS_ASGI=1, as in gunicorn.conf.py): sync
+# code there runs on threads that outlive requests, so persistent connections
+# would pile up unused; every request opens and closes its own.
+ASGI = env_bool('HMS_ASGI')
+for database in DATABASES.values():
+    database['NAME'] = os.environ.get('HMS_SQLITE_PATH', database['NAME'])
+    database['CONN_MAX_AGE'] = 0 if ASGI else int(os.environ.get('HMS_CONN_MAX_AGE', 600))
+    database['CONN_HEALTH_CHECKS'] = True
+
+# WhiteNoise serves collectstatic output from the app server: gzip and brotli
+# copies are built at collectstatic time, file names carry a content hash, and
+# hashed files are sent with a one-year immutable Cache-Control.
+MIDDLEWARE = list(MIDDLEWARE)
+MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                  'whitenoise.middleware.WhiteNoiseMiddleware')
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
+
+# The built Vue app, served from the site root. Vite already puts a content
+# hash in every asset name under /assets/, so those are cached for a year too.
+WHITENOISE_ROOT = os.environ.get('HMS_FRONTEND_ROOT') or None
+WHITENOISE_INDEX_FILE = True
+WHITENOISE_IMMUTABLE_FILE_TEST = r'^.+[.-][0-9a-zA-Z_-]{8,12}\..+$'
+
+HMS_PERF_ENABLED = env_bool('HMS_PERF_ENABLED')
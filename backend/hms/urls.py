@@ -15,14 +15,36 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
 from django.urls import path, include
-from django.http import HttpResponse
+
+from core.cache import get_cache
 
 def home(request):
     return HttpResponse("Welcome to HMS API")
 
+def healthz(request):
+    """Liveness/readiness probe: 200 when every database and the cache answer, else 503."""
+    checks = {}
+    for alias in connections:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            checks[alias] = 'ok'
+        except Exception as exc:
+            checks[alias] = f'error: {exc.__class__.__name__}'
+    try:
+        get_cache().get('hms:healthz')
+        checks['cache'] = 'ok'
+    except Exception as exc:
+        checks['cache'] = f'error: {exc.__class__.__name__}'
+    healthy = all(value == 'ok' for value in checks.values())
+    return JsonResponse({'status': 'ok' if healthy else 'error', 'checks': checks}, status=200 if healthy else 503)
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')),
+    path('healthz', healthz, name='healthz'),
     path('', home),  # Add this line for root URL
 ]